@@ -1,12 +1,20 @@
 import librosa
 import librosa.filters
 import numpy as np
+import soundfile as sf
 # import tensorflow as tf
 from scipy import signal
 from scipy.io import wavfile
 from hparams import hparams as hp
 
 def load_wav(path, sr):
+    # fast path: a WAV already at `sr` is read directly, no resampling/audioread
+    try:
+        info = sf.info(path)
+        if info.format == 'WAV' and info.samplerate == sr:
+            return sf.read(path, dtype='float32', always_2d=True)[0].mean(axis=1)
+    except RuntimeError:
+        pass
     return librosa.core.load(path, sr=sr)[0]
 
 def save_wav(wav, path, sr):
@@ -1,8 +1,7 @@
-from os.path import dirname, join, basename, isfile
+from os.path import join
 from tqdm import tqdm
 
 from models import SyncNet_color as SyncNet
-import audio
 
 import torch
 from torch import nn
@@ -11,15 +10,17 @@ import torch.backends.cudnn as cudnn
 from torch.utils import data as data_utils
 import numpy as np
 
-from glob import glob
-
-import os, random, cv2, argparse
+import os, random, argparse
 from hparams import hparams, get_image_list
+from frame_store import open_frames
 
 parser = argparse.ArgumentParser(description='Code to train the expert lip-sync discriminator')
 
 parser.add_argument("--data_root", help="Root folder of the preprocessed LRS2 dataset", required=True)
 
+parser.add_argument("--packed_root", help="Read frames and mels from this pack_dataset.py output instead "
+                    "of the per-frame JPEGs under --data_root", default=None)
+
 parser.add_argument('--checkpoint_dir', help='Save checkpoints to this directory', required=True, type=str)
 parser.add_argument('--checkpoint_path', help='Resumed from this checkpoint', default=None, type=str)
 
@@ -37,26 +38,11 @@ syncnet_mel_step_size = 16
 class Dataset(object):
     def __init__(self, split):
         self.all_videos = get_image_list(args.data_root, split)
-
-    def get_frame_id(self, frame):
-        return int(basename(frame).split('.')[0])
-
-    def get_window(self, start_frame):
-        start_id = self.get_frame_id(start_frame)
-        vidname = dirname(start_frame)
-
-        window_fnames = []
-        for frame_id in range(start_id, start_id + syncnet_T):
-            frame = join(vidname, '{}.jpg'.format(frame_id))
-            if not isfile(frame):
-                return None
-            window_fnames.append(frame)
-        return window_fnames
+        self.frames = open_frames(args.data_root, args.packed_root, hparams.img_size)
 
     def crop_audio_window(self, spec, start_frame):
         # num_frames = (T x hop_size * fps) / sample_rate
-        start_frame_num = self.get_frame_id(start_frame)
-        start_idx = int(80. * (start_frame_num / float(hparams.fps)))
+        start_idx = int(80. * (start_frame / float(hparams.fps)))
 
         end_idx = start_idx + syncnet_mel_step_size
 
@@ -71,51 +57,31 @@ class Dataset(object):
             idx = random.randint(0, len(self.all_videos) - 1)
             vidname = self.all_videos[idx]
 
-            img_names = list(glob(join(vidname, '*.jpg')))
-            if len(img_names) <= 3 * syncnet_T:
+            frame_ids = self.frames.frame_ids(vidname)
+            if len(frame_ids) <= 3 * syncnet_T:
                 continue
-            img_name = random.choice(img_names)
-            wrong_img_name = random.choice(img_names)
-            while wrong_img_name == img_name:
-                wrong_img_name = random.choice(img_names)
+            img_id = random.choice(frame_ids)
+            wrong_img_id = random.choice(frame_ids)
+            while wrong_img_id == img_id:
+                wrong_img_id = random.choice(frame_ids)
 
             if random.choice([True, False]):
                 y = torch.ones(1).float()
-                chosen = img_name
+                chosen = img_id
             else:
                 y = torch.zeros(1).float()
-                chosen = wrong_img_name
+                chosen = wrong_img_id
 
-            window_fnames = self.get_window(chosen)
-            if window_fnames is None:
+            window = self.frames.window(vidname, chosen, syncnet_T)
+            if window is None:
                 continue
 
-            window = []
-            all_read = True
-            for fname in window_fnames:
-                img = cv2.imread(fname)
-                if img is None:
-                    all_read = False
-                    break
-                try:
-                    img = cv2.resize(img, (hparams.img_size, hparams.img_size))
-                except Exception as e:
-                    all_read = False
-                    break
-
-                window.append(img)
-
-            if not all_read: continue
-
             try:
-                wavpath = join(vidname, "audio.wav")
-                wav = audio.load_wav(wavpath, hparams.sample_rate)
-
-                orig_mel = audio.melspectrogram(wav).T
+                orig_mel = self.frames.mel(vidname)
             except Exception as e:
                 continue
 
-            mel = self.crop_audio_window(orig_mel.copy(), img_name)
+            mel = self.crop_audio_window(orig_mel, img_id)
 
             if (mel.shape[0] != syncnet_mel_step_size):
                 continue
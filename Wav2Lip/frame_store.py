@@ -0,0 +1,136 @@
+"""
+Where the training scripts' Dataset classes get face crops and mels from.
+
+JpegFrames reads the tree preprocess.py writes (<data_root>/<dir>/<video>/<i>.jpg
+and audio.wav), decoding, resizing and computing the mel on every access.
+PackedFrames reads the same data from the memory-mapped shards written by
+pack_dataset.py, so a window of frames is one slice of a uint8 array and the
+mel is precomputed. Both are addressed by the video paths get_image_list()
+returns and by frame ids (the <i> of <i>.jpg).
+"""
+import json, os
+from glob import glob
+from os.path import basename, isfile, join
+
+import cv2
+import numpy as np
+
+import audio
+from hparams import hparams
+
+INDEX = 'index.json'
+
+# hparams that change audio.melspectrogram(); packed mels are only valid for the values they were made with
+MEL_HPARAMS = ('num_mels', 'rescale', 'rescaling_max', 'use_lws', 'n_fft', 'hop_size', 'win_size', 'sample_rate',
+               'frame_shift_ms', 'signal_normalization', 'allow_clipping_in_normalization', 'symmetric_mels',
+               'max_abs_value', 'preemphasize', 'preemphasis', 'min_level_db', 'ref_level_db', 'fmin', 'fmax')
+
+def mel_signature():
+    return {k: hparams.data[k] for k in MEL_HPARAMS}
+
+def load_mel(wavpath):
+    """(mel frames x num_mels) spectrogram of a video's audio.wav, as the training scripts compute it."""
+    wav = audio.load_wav(wavpath, hparams.sample_rate)
+    return audio.melspectrogram(wav).T
+
+
+class JpegFrames(object):
+    """Per-frame JPEG face crops, resized to img_size on read."""
+    def __init__(self, img_size):
+        self.img_size = img_size
+
+    def frame_ids(self, vidname):
+        return [int(basename(f).split('.')[0]) for f in glob(join(vidname, '*.jpg'))]
+
+    def window(self, vidname, start_id, T):
+        """T consecutive crops from start_id as a T x H x W x 3 uint8 array, or None if one is missing."""
+        window = []
+        for frame_id in range(start_id, start_id + T):
+            fname = join(vidname, '{}.jpg'.format(frame_id))
+            img = cv2.imread(fname) if isfile(fname) else None
+            if img is None:
+                return None
+            try:
+                img = cv2.resize(img, (self.img_size, self.img_size))
+            except Exception:
+                return None
+            window.append(img)
+        return np.asarray(window)
+
+    def mel(self, vidname):
+        return load_mel(join(vidname, 'audio.wav'))
+
+
+class PackedFrames(object):
+    """
+    Shards written by pack_dataset.py. The arrays are memory-mapped on first
+    use in each process (DataLoader workers map them themselves; the OS page
+    cache is shared between them).
+    """
+    def __init__(self, packed_root, data_root, img_size):
+        self.root, self.data_root = packed_root, data_root
+        with open(join(packed_root, INDEX)) as f:
+            self.index = json.load(f)
+        if self.index['img_size'] != img_size:
+            raise ValueError('{} holds {}px crops, training uses {}px; run pack_dataset.py again'.format(
+                packed_root, self.index['img_size'], img_size))
+        if self.index['mel'] != mel_signature():
+            raise ValueError('{} was packed with other mel hparams; run pack_dataset.py again'.format(packed_root))
+        self._maps = None
+        self._ids = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_maps'] = None  # re-mapped in the worker instead of pickling the data
+        return state
+
+    def _shard(self, k):
+        if self._maps is None:
+            self._maps = {}
+        if k not in self._maps:
+            s, size = self.index['shards'][k], self.index['img_size']
+            self._maps[k] = (
+                np.memmap(join(self.root, s['frames_file']), np.uint8, 'r', shape=(s['frames'], size, size, 3)),
+                np.memmap(join(self.root, s['present_file']), np.uint8, 'r', shape=(s['frames'],)),
+                np.memmap(join(self.root, s['mels_file']), np.float32, 'r', shape=(s['mels'], hparams.num_mels))
+                if s['mels'] else None,
+            )
+        return self._maps[k]
+
+    def _video(self, vidname):
+        v = self.index['videos'].get(os.path.relpath(vidname, self.data_root))
+        if v is None:
+            raise KeyError('{} is not in {}'.format(vidname, self.root))
+        return v
+
+    def frame_ids(self, vidname):
+        if vidname not in self._ids:
+            v = self._video(vidname)
+            present = self._shard(v['shard'])[1][v['offset']:v['offset'] + v['frames']]
+            self._ids[vidname] = np.flatnonzero(present).tolist()
+        return self._ids[vidname]
+
+    def window(self, vidname, start_id, T):
+        v = self._video(vidname)
+        if start_id < 0 or start_id + T > v['frames']:
+            return None
+        frames, present, _ = self._shard(v['shard'])
+        lo = v['offset'] + start_id
+        if not present[lo:lo + T].all():
+            return None
+        return frames[lo:lo + T]
+
+    def mel(self, vidname):
+        v = self._video(vidname)
+        if not v['mel_frames']:
+            raise ValueError('no audio packed for {}'.format(vidname))
+        # a writable copy (a few hundred KB): torch.FloatTensor() would otherwise wrap the read-only map
+        return np.array(self._shard(v['shard'])[2][v['mel_offset']:v['mel_offset'] + v['mel_frames']])
+
+
+def open_frames(data_root, packed_root=None, img_size=None):
+    """PackedFrames when packed_root is given, else the JPEG tree under data_root."""
+    img_size = img_size or hparams.img_size
+    if packed_root:
+        return PackedFrames(packed_root, data_root, img_size)
+    return JpegFrames(img_size)
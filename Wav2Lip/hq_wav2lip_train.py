@@ -1,9 +1,8 @@
-from os.path import dirname, join, basename, isfile
+from os.path import join
 from tqdm import tqdm
 
 from models import SyncNet_color as SyncNet
 from models import Wav2Lip, Wav2Lip_disc_qual
-import audio
 
 import torch
 from torch import nn
@@ -13,15 +12,17 @@ import torch.backends.cudnn as cudnn
 from torch.utils import data as data_utils
 import numpy as np
 
-from glob import glob
-
 import os, random, cv2, argparse
 from hparams import hparams, get_image_list
+from frame_store import open_frames
 
 parser = argparse.ArgumentParser(description='Code to train the Wav2Lip model WITH the visual quality discriminator')
 
 parser.add_argument("--data_root", help="Root folder of the preprocessed LRS2 dataset", required=True, type=str)
 
+parser.add_argument("--packed_root", help="Read frames and mels from this pack_dataset.py output instead "
+                    "of the per-frame JPEGs under --data_root", default=None, type=str)
+
 parser.add_argument('--checkpoint_dir', help='Save checkpoints to this directory', required=True, type=str)
 parser.add_argument('--syncnet_checkpoint_path', help='Load the pre-trained Expert discriminator', required=True, type=str)
 
@@ -42,44 +43,10 @@ syncnet_mel_step_size = 16
 class Dataset(object):
     def __init__(self, split):
         self.all_videos = get_image_list(args.data_root, split)
-
-    def get_frame_id(self, frame):
-        return int(basename(frame).split('.')[0])
-
-    def get_window(self, start_frame):
-        start_id = self.get_frame_id(start_frame)
-        vidname = dirname(start_frame)
-
-        window_fnames = []
-        for frame_id in range(start_id, start_id + syncnet_T):
-            frame = join(vidname, '{}.jpg'.format(frame_id))
-            if not isfile(frame):
-                return None
-            window_fnames.append(frame)
-        return window_fnames
-
-    def read_window(self, window_fnames):
-        if window_fnames is None: return None
-        window = []
-        for fname in window_fnames:
-            img = cv2.imread(fname)
-            if img is None:
-                return None
-            try:
-                img = cv2.resize(img, (hparams.img_size, hparams.img_size))
-            except Exception as e:
-                return None
-
-            window.append(img)
-
-        return window
+        self.frames = open_frames(args.data_root, args.packed_root, hparams.img_size)
 
     def crop_audio_window(self, spec, start_frame):
-        if type(start_frame) == int:
-            start_frame_num = start_frame
-        else:
-            start_frame_num = self.get_frame_id(start_frame)
-        start_idx = int(80. * (start_frame_num / float(hparams.fps)))
+        start_idx = int(80. * (start_frame / float(hparams.fps)))
         
         end_idx = start_idx + syncnet_mel_step_size
 
@@ -88,7 +55,7 @@ class Dataset(object):
     def get_segmented_mels(self, spec, start_frame):
         mels = []
         assert syncnet_T == 5
-        start_frame_num = self.get_frame_id(start_frame) + 1 # 0-indexing ---> 1-indexing
+        start_frame_num = start_frame + 1 # 0-indexing ---> 1-indexing
         if start_frame_num - 2 < 0: return None
         for i in range(start_frame_num, start_frame_num + syncnet_T):
             m = self.crop_audio_window(spec, i - 2)
@@ -114,42 +81,34 @@ class Dataset(object):
         while 1:
             idx = random.randint(0, len(self.all_videos) - 1)
             vidname = self.all_videos[idx]
-            img_names = list(glob(join(vidname, '*.jpg')))
-            if len(img_names) <= 3 * syncnet_T:
+            frame_ids = self.frames.frame_ids(vidname)
+            if len(frame_ids) <= 3 * syncnet_T:
                 continue
             
-            img_name = random.choice(img_names)
-            wrong_img_name = random.choice(img_names)
-            while wrong_img_name == img_name:
-                wrong_img_name = random.choice(img_names)
-
-            window_fnames = self.get_window(img_name)
-            wrong_window_fnames = self.get_window(wrong_img_name)
-            if window_fnames is None or wrong_window_fnames is None:
-                continue
+            img_id = random.choice(frame_ids)
+            wrong_img_id = random.choice(frame_ids)
+            while wrong_img_id == img_id:
+                wrong_img_id = random.choice(frame_ids)
 
-            window = self.read_window(window_fnames)
+            window = self.frames.window(vidname, img_id, syncnet_T)
             if window is None:
                 continue
 
-            wrong_window = self.read_window(wrong_window_fnames)
+            wrong_window = self.frames.window(vidname, wrong_img_id, syncnet_T)
             if wrong_window is None:
                 continue
 
             try:
-                wavpath = join(vidname, "audio.wav")
-                wav = audio.load_wav(wavpath, hparams.sample_rate)
-
-                orig_mel = audio.melspectrogram(wav).T
+                orig_mel = self.frames.mel(vidname)
             except Exception as e:
                 continue
 
-            mel = self.crop_audio_window(orig_mel.copy(), img_name)
+            mel = self.crop_audio_window(orig_mel, img_id)
             
             if (mel.shape[0] != syncnet_mel_step_size):
                 continue
 
-            indiv_mels = self.get_segmented_mels(orig_mel.copy(), img_name)
+            indiv_mels = self.get_segmented_mels(orig_mel, img_id)
             if indiv_mels is None: continue
 
             window = self.prepare_window(window)
@@ -1,7 +1,7 @@
 from os import listdir, path
 import numpy as np
 import scipy, cv2, os, sys, argparse, audio
-import json, subprocess, random, string
+import fcntl, json, subprocess, random, string, time
 from tqdm import tqdm
 from glob import glob
 import torch, face_detection
@@ -11,12 +11,12 @@ import platform
 parser = argparse.ArgumentParser(description='Inference code to lip-sync videos in the wild using Wav2Lip models')
 
 parser.add_argument('--checkpoint_path', type=str,
-                    help='Name of saved checkpoint to load weights from', required=True)
+                    help='Name of saved checkpoint to load weights from (not needed with --detect_only)')
 
 parser.add_argument('--face', type=str,
                     help='Filepath of video/image that contains faces to use', required=True)
 parser.add_argument('--audio', type=str,
-                    help='Filepath of video/audio file to use as raw audio source', required=True)
+                    help='Filepath of video/audio file to use as raw audio source (not needed with --detect_only)')
 parser.add_argument('--outfile', type=str, help='Video path to save result. See default for an e.g.',
                                 default='results/result_voice.mp4')
 
@@ -50,11 +50,54 @@ parser.add_argument('--rotate', default=False, action='store_true',
 parser.add_argument('--nosmooth', default=False, action='store_true',
                     help='Prevent smoothing face detections over a short temporal window')
 
-args = parser.parse_args()
-args.img_size = 96
-
-if os.path.isfile(args.face) and args.face.split('.')[-1].lower() in ['jpg', 'png', 'jpeg']:
-    args.static = True
+parser.add_argument('--face_cache', type=str, default=None,
+                    help='JSON file with raw face detections for --face; reused when it matches the video '
+                    'and frame options, written otherwise')
+parser.add_argument('--detect_only', default=False, action='store_true',
+                    help='Only run face detection and write --face_cache (no audio/model needed)')
+parser.add_argument('--metrics_json', type=str, default=None,
+                    help='Write timings (read, face detection, model, inference, encode) and frame/batch counts here')
+parser.add_argument('--shard', nargs=2, type=int, default=None, metavar=('K', 'N'),
+                    help='Render only the K-th (0-based) of N equal frame ranges into --outfile as a '
+                    'silent video segment; segments are joined and muxed with the audio afterwards')
+parser.add_argument('--threads', type=int, default=0,
+                    help='CPU threads for torch, OpenCV and ffmpeg (0: library defaults, usually one per core)')
+parser.add_argument('--resume_dir', type=str, default=None,
+                    help='Write the render as closed H.264 segments plus progress.json in this directory; '
+                    'a rerun with the same inputs and options continues after the last completed segment')
+parser.add_argument('--segment_batches', type=int, default=8,
+                    help='Wav2Lip batches per segment with --resume_dir')
+
+metrics = {'items': {}}  # per-run timings/counters, written to --metrics_json
+
+def _timed(key, t0):
+    metrics[key] = metrics.get(key, 0.0) + time.perf_counter() - t0
+
+def _count(item, n=1):
+    metrics['items'][item] = metrics['items'].get(item, 0) + n
+
+def _ff_threads():
+    """ffmpeg -threads for the codec it precedes (an input's decoder or the output's encoder)."""
+    return '-threads {} '.format(args.threads) if args.threads > 0 else ''
+
+def _save_metrics():
+    if args.metrics_json:
+        with open(args.metrics_json, 'w') as f:
+            json.dump(metrics, f)
+
+def parse_args(argv=None):
+    args = parser.parse_args(argv)
+    args.img_size = 96
+    if args.detect_only and not args.face_cache:
+        parser.error('--detect_only needs --face_cache')
+    if not args.detect_only and (not args.checkpoint_path or not args.audio):
+        parser.error('--checkpoint_path and --audio are required')
+
+    if os.path.isfile(args.face) and args.face.split('.')[-1].lower() in ['jpg', 'png', 'jpeg']:
+        args.static = True
+    return args
+
+args = None  # set by parse_args() under __main__ or by run()
 
 # --- robust writer fallback ---------------------------------------------------
 def _open_writer_with_fallback(base_no_ext: str, fps: float, size):
@@ -95,7 +138,39 @@ def get_smoothened_boxes(boxes, T):
         boxes[i] = np.mean(window, axis=0)
     return boxes
 
-def face_detect(images):
+def _face_cache_meta():
+    st = os.stat(args.face)
+    return {'face': os.path.abspath(args.face), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+            'resize_factor': args.resize_factor, 'crop': list(args.crop), 'rotate': args.rotate}
+
+def _read_face_cache(n_frames=None):
+    """Cached raw rects when --face_cache matches this video/frame options (and covers n_frames)."""
+    if not args.face_cache or not os.path.isfile(args.face_cache):
+        return None
+    try:
+        with open(args.face_cache) as f:
+            data = json.load(f)
+    except ValueError:
+        return None
+    if data.get('meta') != _face_cache_meta():
+        return None
+    if n_frames is not None and len(data['rects']) < n_frames:
+        return None
+    return data['rects']
+
+def detect_rects(images):
+    """
+    Raw detector rects (x1, y1, x2, y2) or None per image. Padding and
+    smoothing are applied by the caller, so cached rects stay valid when
+    --pads/--nosmooth change or the frame list is truncated to the audio.
+    """
+    rects = _read_face_cache(len(images))
+    metrics['face_cache_hit'] = rects is not None
+    if rects is not None:
+        print('Using cached face detections: {}'.format(args.face_cache))
+        return rects[:len(images)]
+    t0 = time.perf_counter()
+
     detector = face_detection.FaceAlignment(face_detection.LandmarksType._2D,
                                             flip_input=False, device=device)
 
@@ -113,6 +188,21 @@ def face_detect(images):
             print('Recovering from OOM error; New batch size: {}'.format(batch_size))
             continue
         break
+    del detector
+
+    rects = [None if r is None else [int(v) for v in r[:4]] for r in predictions]
+    _timed('face_detect_s', t0)
+    _count('face_frames', len(images))
+    if args.face_cache:
+        os.makedirs(os.path.dirname(os.path.abspath(args.face_cache)), exist_ok=True)
+        tmp = '{}.{}.tmp'.format(args.face_cache, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({'meta': _face_cache_meta(), 'rects': rects}, f)
+        os.replace(tmp, args.face_cache)
+    return rects
+
+def face_detect(images):
+    predictions = detect_rects(images)
 
     results = []
     pady1, pady2, padx1, padx2 = args.pads
@@ -132,10 +222,9 @@ def face_detect(images):
     if not args.nosmooth: boxes = get_smoothened_boxes(boxes, T=5)
     results = [[image[y1: y2, x1:x2], (y1, y2, x1, x2)] for image, (x1, y1, x2, y2) in zip(images, boxes)]
 
-    del detector
     return results
 
-def datagen(frames, mels):
+def datagen(frames, mels, offset=0):
     img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
 
     if args.box[0] == -1:
@@ -149,7 +238,7 @@ def datagen(frames, mels):
         face_det_results = [[f[y1: y2, x1:x2], (y1, y2, x1, x2)] for f in frames]
 
     for i, m in enumerate(mels):
-        idx = 0 if args.static else i%len(frames)
+        idx = 0 if args.static else (offset + i)%len(frames)
         frame_to_save = frames[idx].copy()
         face, coords = face_det_results[idx].copy()
 
@@ -187,6 +276,181 @@ mel_step_size = 16
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
 print('Using {} for inference.'.format(device))
 
+def get_mel_chunks(mel, fps):
+    """One mel window of mel_step_size columns per video frame (80 mel columns per second)."""
+    mel_chunks = []
+    mel_idx_multiplier = 80. / float(fps)
+    i = 0
+    while 1:
+        start_idx = int(i * mel_idx_multiplier)
+        if start_idx + mel_step_size > len(mel[0]):
+            mel_chunks.append(mel[:, len(mel[0]) - mel_step_size:])
+            break
+        mel_chunks.append(mel[:, start_idx : start_idx + mel_step_size])
+        i += 1
+    return mel_chunks
+
+def paste_frames(writer, pred, frames, coords):
+    """Resize each predicted face back into its frame and write the frame."""
+    for p, f, c in zip(pred, frames, coords):
+        y1, y2, x1, x2 = c
+        p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
+        f[y1:y2, x1:x2] = p
+        writer.write(f)
+
+# --- resumable rendering (--resume_dir) --------------------------------------
+def _stamp(p):
+    st = os.stat(p)
+    return [os.path.abspath(p), st.st_size, st.st_mtime_ns]
+
+def _resume_meta(audio_stamp, fps, n_frames, seg_frames):
+    """Everything that changes the rendered frames; segments of a render with other meta are discarded."""
+    return {'face': _stamp(args.face), 'audio': audio_stamp, 'checkpoint': _stamp(args.checkpoint_path),
+            'fps': fps, 'frames': n_frames, 'segment_frames': seg_frames, 'shard': args.shard,
+            'pads': list(args.pads), 'resize_factor': args.resize_factor, 'crop': list(args.crop),
+            'box': list(args.box), 'rotate': args.rotate, 'nosmooth': args.nosmooth,
+            'static': args.static, 'img_size': args.img_size}
+
+class SegmentWriter:
+    """
+    Frame writer for --resume_dir. Every `seg_frames` frames the open temp
+    file is closed and encoded into an independently decodable H.264 segment
+    (seg_<first>_<end>.mp4), then progress.json records it and the number of
+    frames done. A render with the same meta continues after the last
+    completed segment; finish() joins the segments without re-encoding.
+
+    The directory is locked (flock on .lock) for the whole render. A second
+    render of the same job (a reclaimed cluster lease still running on its
+    old node, two server jobs with the same basename and language) finds it
+    taken and renders into a private <dir>.<pid> instead of deleting the
+    first one's files.
+    """
+    _held = []  # lock files of this process's open writers; main() releases them on any exit
+
+    def __init__(self, dirpath, meta, fps, size, seg_frames):
+        self.meta, self.fps, self.size, self.seg_frames = meta, fps, size, seg_frames
+        self.dir, self._lock = self._acquire(dirpath)
+        self.manifest = os.path.join(self.dir, 'progress.json')
+        self.state = self._load()
+        self.writer = self.writer_path = None
+        self.n = 0
+
+    @classmethod
+    def _acquire(cls, dirpath):
+        for d in (dirpath, '{}.{}'.format(dirpath.rstrip('/\\'), os.getpid())):
+            os.makedirs(d, exist_ok=True)
+            f = open(os.path.join(d, '.lock'), 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                print('{} is in use by another render; this one will not be resumable'.format(d))
+                continue
+            cls._held.append(f)
+            return d, f
+        raise SystemExit('Could not lock a resume directory for {}'.format(dirpath))
+
+    def release(self):
+        if self._lock in self._held:
+            self._held.remove(self._lock)
+            self._lock.close()
+
+    @classmethod
+    def release_all(cls):
+        for f in list(cls._held):
+            f.close()
+        del cls._held[:]
+
+    def _load(self):
+        try:
+            with open(self.manifest) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        if (not state or state.get('meta') != self.meta
+                or not all(os.path.isfile(os.path.join(self.dir, s['file'])) for s in state['segments'])):
+            state = {'meta': self.meta, 'segments': [], 'frames_done': 0}
+        keep = {s['file'] for s in state['segments']}
+        # segments of a render with other inputs, temp files of a killed one (the lock rules out a live one)
+        for name in os.listdir(self.dir):
+            if name.startswith(('seg_', 'open_', 'tmp_')) and name not in keep:
+                os.remove(os.path.join(self.dir, name))
+        return state
+
+    def _save(self):
+        tmp = '{}.{}.tmp'.format(self.manifest, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp, self.manifest)
+
+    @property
+    def frames_done(self):
+        return self.state['frames_done']
+
+    def write(self, frame):
+        if self.writer is None:
+            base = os.path.join(self.dir, 'open_{}'.format(os.getpid()))
+            self.writer, self.writer_path = _open_writer_with_fallback(base, self.fps, self.size)
+        self.writer.write(frame)
+        self.n += 1
+        if self.n >= self.seg_frames:
+            self.close()
+
+    def close(self):
+        """Encode the open segment (silent, same settings as --shard) and record it."""
+        if self.writer is None:
+            return
+        self.writer.release()
+        t0 = time.perf_counter()
+        first, end = self.frames_done, self.frames_done + self.n
+        name = 'seg_{:07d}_{:07d}.mp4'.format(first, end)
+        tmp = os.path.join(self.dir, 'tmp_{}.mp4'.format(os.getpid()))
+        ret = subprocess.call(f'ffmpeg -y -loglevel error -i "{self.writer_path}" -an '
+                              f'-c:v libx264 {_ff_threads()}-pix_fmt yuv420p "{tmp}"', shell=True)
+        os.remove(self.writer_path)
+        if ret != 0 or not os.path.exists(tmp):
+            raise SystemExit("Segment encode failed: check ffmpeg install and the writer output path.")
+        os.replace(tmp, os.path.join(self.dir, name))
+        self.state['segments'].append({'file': name, 'first': first, 'end': end})
+        self.state['frames_done'] = end
+        self._save()
+        _timed('encode_s', t0)
+        _count('segments')
+        self.writer = self.writer_path = None
+        self.n = 0
+
+    def finish(self, outfile, audio=None):
+        """Concatenate the segments into outfile (muxing audio if given), then remove them."""
+        self.close()
+        if not self.state['segments']:
+            raise SystemExit("No frames were rendered.")
+        t0 = time.perf_counter()
+        listing = os.path.join(self.dir, 'tmp_{}.txt'.format(os.getpid()))
+        with open(listing, 'w') as f:
+            f.writelines("file '{}'\n".format(os.path.abspath(os.path.join(self.dir, s['file'])))
+                         for s in self.state['segments'])
+        if audio:
+            ffmpeg_cmd = (f'ffmpeg -y -loglevel error -f concat -safe 0 -i "{listing}" -i "{audio}" '
+                          f'-map 0:v -map 1:a -shortest -c:v copy -c:a aac "{outfile}"')
+        else:
+            ffmpeg_cmd = f'ffmpeg -y -loglevel error -f concat -safe 0 -i "{listing}" -an -c:v copy "{outfile}"'
+        print("[ffmpeg]", ffmpeg_cmd)
+        ret = subprocess.call(ffmpeg_cmd, shell=True)
+        os.remove(listing)
+        _timed('encode_s', t0)
+        if ret != 0 or not os.path.exists(outfile):
+            raise SystemExit("Concat failed: the segments in {} are kept for the next run.".format(self.dir))
+        for s in self.state['segments']:
+            os.remove(os.path.join(self.dir, s['file']))
+        os.remove(self.manifest)
+        os.remove(os.path.join(self.dir, '.lock'))
+        self.release()
+        try:
+            os.rmdir(self.dir)
+        except OSError:
+            pass
+# ------------------------------------------------------------------------------
+
 def _load(checkpoint_path):
     if device == 'cuda':
         checkpoint = torch.load(checkpoint_path)
@@ -208,11 +472,26 @@ def load_model(path):
     model = model.to(device)
     return model.eval()
 
-def main():
+def main(model=None, wav=None):
+    try:
+        return _main(model, wav)
+    finally:
+        SegmentWriter.release_all()  # also when a render fails in a long-lived process (in-process runner)
+
+def _main(model=None, wav=None):
+    metrics.clear(); metrics['items'] = {}
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+        cv2.setNumThreads(args.threads)
     if not os.path.isfile(args.face):
         raise ValueError('--face argument must be a valid path to video/image file')
 
+    if args.detect_only and _read_face_cache() is not None:
+        print('Face cache is up to date: {}'.format(args.face_cache))
+        return
+
     # Read frames
+    t0 = time.perf_counter()
     if args.face.split('.')[-1].lower() in ['jpg', 'png', 'jpeg']:
         full_frames = [cv2.imread(args.face)]
         fps = args.fps
@@ -250,53 +529,80 @@ def main():
             full_frames.append(frame)
 
     print("Number of frames available for inference: "+str(len(full_frames)))
+    _timed('read_frames_s', t0)
+
+    if args.detect_only:
+        if args.box[0] == -1:
+            detect_rects(full_frames if not args.static else [full_frames[0]])
+        return
 
-    # Audio to wav if needed
-    if not args.audio.endswith('.wav'):
+    audio_stamp = _stamp(args.audio)  # of the source, before any conversion to temp/temp.wav
+    # Audio to wav if needed (skipped when the caller hands over 16 kHz samples)
+    if wav is None and not args.audio.endswith('.wav'):
         print('Extracting raw audio...')
         os.makedirs('temp', exist_ok=True)
-        command = f'ffmpeg -y -i "{args.audio}" -ar 16000 -ac 1 -f wav temp/temp.wav'
+        command = f'ffmpeg -y {_ff_threads()}-i "{args.audio}" -ar 16000 -ac 1 -f wav temp/temp.wav'
         subprocess.call(command, shell=True)
         args.audio = 'temp/temp.wav'
 
-    wav = audio.load_wav(args.audio, 16000)
+    t0 = time.perf_counter()
+    if wav is None:
+        wav = audio.load_wav(args.audio, 16000)
     mel = audio.melspectrogram(wav)
+    _timed('mel_s', t0)
     print(mel.shape)
 
     if np.isnan(mel.reshape(-1)).sum() > 0:
         raise ValueError('Mel contains nan! Using a TTS voice? Add a small epsilon noise to the wav file and try again')
 
-    # Build mel chunks aligned to FPS
-    mel_chunks = []
-    mel_idx_multiplier = 80. / float(fps)
-    i = 0
-    while 1:
-        start_idx = int(i * mel_idx_multiplier)
-        if start_idx + mel_step_size > len(mel[0]):
-            mel_chunks.append(mel[:, len(mel[0]) - mel_step_size:])
-            break
-        mel_chunks.append(mel[:, start_idx : start_idx + mel_step_size])
-        i += 1
+    mel_chunks = get_mel_chunks(mel, fps)
 
     print("Length of mel chunks: {}".format(len(mel_chunks)))
 
     full_frames = full_frames[:len(mel_chunks)]
 
+    offset = 0
+    if args.shard:
+        k, n = args.shard
+        offset, end = k * len(mel_chunks) // n, (k + 1) * len(mel_chunks) // n
+        if not 0 <= k < n or offset >= end:
+            raise ValueError('--shard {} {} is empty for {} frames'.format(k, n, len(mel_chunks)))
+        mel_chunks = mel_chunks[offset:end]
+        print('Shard {}/{}: frames {}-{}'.format(k, n, offset, end - 1))
+
     batch_size = args.wav2lip_batch_size
-    gen = datagen(full_frames.copy(), mel_chunks)
+    resume, skip = None, 0
+    if args.resume_dir:
+        frame_h, frame_w = full_frames[0].shape[:-1]
+        seg_frames = max(1, args.segment_batches) * batch_size
+        resume = SegmentWriter(args.resume_dir, _resume_meta(audio_stamp, fps, len(mel_chunks), seg_frames),
+                               fps, (frame_w, frame_h), seg_frames)
+        skip = resume.frames_done
+        if skip:
+            print('Resuming after frame {} ({} segments done)'.format(skip, len(resume.state['segments'])))
+            _count('resumed_frames', skip)
+    gen = datagen(full_frames.copy(), mel_chunks[skip:], offset + skip) if skip < len(mel_chunks) else iter(())
 
     writer = None
     writer_path = None
 
+    t_loop = time.perf_counter()
     for i, (img_batch, mel_batch, frames, coords) in enumerate(tqdm(gen,
-                                            total=int(np.ceil(float(len(mel_chunks))/batch_size)))):
+                                            total=int(np.ceil(float(len(mel_chunks) - skip)/batch_size)))):
         if i == 0:
-            model = load_model(args.checkpoint_path)
+            if model is None:
+                t0 = time.perf_counter()
+                model = load_model(args.checkpoint_path)
+                _timed('model_load_s', t0)
             print("Model loaded")
 
-            frame_h, frame_w = full_frames[0].shape[:-1]
-            os.makedirs("temp", exist_ok=True)
-            writer, writer_path = _open_writer_with_fallback("temp/result", fps, (frame_w, frame_h))
+            if resume is not None:
+                writer = resume
+            else:
+                frame_h, frame_w = full_frames[0].shape[:-1]
+                os.makedirs("temp", exist_ok=True)
+                base = "temp/result" if not args.shard else "temp/result_{}_{}_{}".format(*args.shard, os.getpid())
+                writer, writer_path = _open_writer_with_fallback(base, fps, (frame_w, frame_h))
 
         img_batch = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))).to(device)
         mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(device)
@@ -306,30 +612,71 @@ def main():
 
         pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
 
-        for p, f, c in zip(pred, frames, coords):
-            y1, y2, x1, x2 = c
-            p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
-            f[y1:y2, x1:x2] = p
-            writer.write(f)
+        paste_frames(writer, pred, frames, coords)
+        _count('frames', len(frames))
+        _count('batches')
 
-    if writer is not None:
+    if writer is not None and resume is None:
         writer.release()
+    # generator time includes face detection (and, with --resume_dir, segment encodes); model load is timed separately
+    metrics['infer_s'] = (time.perf_counter() - t_loop - metrics.get('face_detect_s', 0.0)
+                          - metrics.get('model_load_s', 0.0) - metrics.get('encode_s', 0.0))
+    t0 = time.perf_counter()
+
+    if resume is not None:
+        # the shard's segments stay silent; a full render gets the audio muxed while joining
+        resume.finish(args.outfile, None if args.shard else args.audio)
+        print("✅ Saved{}:".format(" segment" if args.shard else ""), args.outfile)
+        return
 
     # Mux with the *actual* path we wrote to
     if writer_path is None or (not os.path.exists(writer_path)):
         raise SystemExit("Writer finished but no intermediate file was found. Check OpenCV install/codecs.")
 
+    if args.shard:
+        # silent segment; every shard is encoded the same way so they concatenate without re-encoding
+        ffmpeg_cmd = (
+            f'ffmpeg -y -loglevel error -i "{writer_path}" -an '
+            f'-c:v libx264 {_ff_threads()}-pix_fmt yuv420p "{args.outfile}"'
+        )
+        print("[ffmpeg]", ffmpeg_cmd)
+        ret = subprocess.call(ffmpeg_cmd, shell=True)
+        _timed('encode_s', t0)
+        os.remove(writer_path)
+        if ret != 0 or (not os.path.exists(args.outfile)):
+            raise SystemExit("Segment encode failed: check ffmpeg install and the writer output path.")
+        print("✅ Saved segment:", args.outfile)
+        return
+
     # robust ffmpeg mux
     ffmpeg_cmd = (
         f'ffmpeg -y -loglevel error '
         f'-i "{writer_path}" -i "{args.audio}" -shortest '
-        f'-c:v libx264 -pix_fmt yuv420p -c:a aac "{args.outfile}"'
+        f'-c:v libx264 {_ff_threads()}-pix_fmt yuv420p -c:a aac "{args.outfile}"'
     )
     print("[ffmpeg]", ffmpeg_cmd)
     ret = subprocess.call(ffmpeg_cmd, shell=True)
+    _timed('encode_s', t0)
     if ret != 0 or (not os.path.exists(args.outfile)):
         raise SystemExit("Mux failed: check ffmpeg install and the writer output path.")
     print("✅ Saved:", args.outfile)
 
+def run(argv, model=None, wav=None):
+    """
+    In-process entry point: same flags as the CLI, optionally with an
+    already-loaded (e.g. registry-cached) Wav2Lip model and the decoded
+    16 kHz float32 audio.
+    """
+    global args
+    args = parse_args(argv)
+    try:
+        main(model, wav)
+    finally:
+        _save_metrics()
+
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    try:
+        main()
+    finally:
+        _save_metrics()
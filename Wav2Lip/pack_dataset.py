@@ -0,0 +1,126 @@
+"""
+Pack the face crops and audio that preprocess.py wrote into a few large,
+memory-mapped files, so training reads a window of frames as one array slice
+instead of opening, decoding and resizing one JPEG per frame (pass
+--packed_root to wav2lip_train.py, hq_wav2lip_train.py or color_syncnet_train.py).
+
+<packed_root>/
+  frames_000.u8   N x img_size x img_size x 3 uint8 crops, already resized;
+                  a video's frame <i> is at its offset + i
+  present_000.u8  N bytes: 1 where preprocess.py wrote <i>.jpg (a face was detected)
+  mels_000.f32    M x num_mels float32 mel spectrograms of the videos' audio.wav
+  index.json      per video: shard, frame offset/count, mel offset/count (written last)
+
+A new shard is started once one holds --shard_frames frames.
+
+python pack_dataset.py --preprocessed_root lrs2_preprocessed/ --packed_root lrs2_packed/
+python pack_dataset.py --preprocessed_root lrs2_preprocessed/ --packed_root lrs2_packed/ --filelists train val
+"""
+import argparse, json, os, time, traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from os import path
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+from frame_store import INDEX, load_mel, mel_signature
+from hparams import hparams, get_image_list
+
+parser = argparse.ArgumentParser(description='Pack preprocessed face crops and audio into memory-mapped shards')
+parser.add_argument('--preprocessed_root', help='Root folder written by preprocess.py', required=True)
+parser.add_argument('--packed_root', help='Folder for the packed shards and index.json', required=True)
+parser.add_argument('--filelists', nargs='+', default=None,
+                    help='Pack only the videos of filelists/<name>.txt (default: every <dir>/<video> folder)')
+parser.add_argument('--shard_frames', type=int, default=200000,
+                    help='Frames per shard (200k 96px frames are about 5.5 GB)')
+parser.add_argument('--workers', type=int, default=8, help='Threads decoding JPEGs and computing mels')
+
+
+def read_video(vidname, img_size):
+    """(frames, present, mel or None) of one preprocessed video folder."""
+    files = {int(path.basename(f).split('.')[0]): f for f in glob(path.join(vidname, '*.jpg'))}
+    n = max(files) + 1 if files else 0
+    frames = np.zeros((n, img_size, img_size, 3), np.uint8)
+    present = np.zeros(n, np.uint8)
+    for i, fname in files.items():
+        img = cv2.imread(fname)
+        if img is None:
+            continue
+        frames[i] = cv2.resize(img, (img_size, img_size))
+        present[i] = 1
+    try:
+        mel = load_mel(path.join(vidname, 'audio.wav')).astype(np.float32)
+    except Exception:
+        traceback.print_exc()
+        mel = None
+    return frames, present, mel
+
+def read_all(videos, img_size, workers):
+    """read_video over `videos` in order, with at most 2 x workers videos in memory."""
+    with ThreadPoolExecutor(workers) as ex:
+        pending = deque()
+        for vidname in videos:
+            pending.append((vidname, ex.submit(read_video, vidname, img_size)))
+            if len(pending) >= 2 * workers:
+                name, fut = pending.popleft()
+                yield name, fut.result()
+        while pending:
+            name, fut = pending.popleft()
+            yield name, fut.result()
+
+def list_videos(root, filelists):
+    if filelists:
+        videos = []
+        for split in filelists:
+            videos.extend(get_image_list(root, split))
+        return list(dict.fromkeys(videos))
+    return sorted(d for d in glob(path.join(root, '*', '*')) if path.isdir(d))
+
+def main(args):
+    root, out, img_size = args.preprocessed_root, args.packed_root, hparams.img_size
+    os.makedirs(out, exist_ok=True)
+    index_path = path.join(out, INDEX)
+    if path.exists(index_path):
+        os.remove(index_path)  # an interrupted repack must not be read with the old index
+
+    videos = list_videos(root, args.filelists)
+    print('Packing {} videos from {} into {}'.format(len(videos), root, out))
+    index = {'version': 1, 'img_size': img_size, 'mel': mel_signature(), 'shards': [], 'videos': {}}
+    files, shard = None, None
+    t0 = time.perf_counter()
+    for vidname, (frames, present, mel) in tqdm(read_all(videos, img_size, args.workers), total=len(videos)):
+        if shard is None or (shard['frames'] and shard['frames'] + len(frames) > args.shard_frames):
+            if files is not None:
+                for f in files: f.close()
+            k = len(index['shards'])
+            shard = {'frames_file': 'frames_{:03d}.u8'.format(k), 'present_file': 'present_{:03d}.u8'.format(k),
+                     'mels_file': 'mels_{:03d}.f32'.format(k), 'frames': 0, 'mels': 0}
+            index['shards'].append(shard)
+            files = [open(path.join(out, shard[key]), 'wb') for key in ('frames_file', 'present_file', 'mels_file')]
+        files[0].write(frames.tobytes())
+        files[1].write(present.tobytes())
+        if mel is not None:
+            files[2].write(mel.tobytes())
+        index['videos'][path.relpath(vidname, root)] = {
+            'shard': len(index['shards']) - 1, 'offset': shard['frames'], 'frames': len(frames),
+            'mel_offset': shard['mels'], 'mel_frames': 0 if mel is None else len(mel)}
+        shard['frames'] += len(frames)
+        shard['mels'] += 0 if mel is None else len(mel)
+    if files is not None:
+        for f in files: f.close()
+
+    tmp = '{}.{}.tmp'.format(index_path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, index_path)
+    n_frames = sum(s['frames'] for s in index['shards'])
+    size = sum(path.getsize(path.join(out, s[k])) for s in index['shards']
+               for k in ('frames_file', 'present_file', 'mels_file'))
+    print('Packed {} videos, {} frame slots in {} shards ({:.2f} GB) in {:.0f}s'.format(
+        len(index['videos']), n_frames, len(index['shards']), size / 2**30, time.perf_counter() - t0))
+
+if __name__ == '__main__':
+    main(parser.parse_args())
@@ -0,0 +1,77 @@
+"""
+Real-time factor of each faster-whisper preset (config.ASR_PROFILES) on bundled audio.
+
+RTF = transcription wall time / audio duration (lower is faster; < 1 is faster
+than real time). WER is measured against the committed transcript, which was
+made with the original small/beam-5 settings, so it is a drift figure, not
+absolute accuracy.
+
+python benchmarks/bench_asr_profiles.py --profiles fast balanced accurate --threads 4
+"""
+import argparse, json, sys, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from config import ASR_PROFILES, ASR_LANGUAGE
+
+AUDIO = "audio/monologue_clip_audio.wav"
+REFERENCE = "transcripts/monologue_clip_asr.json"
+
+def wer(hyp: str, ref: str) -> float:
+    """Word error rate (Levenshtein over lower-cased whitespace tokens)."""
+    h, r = hyp.lower().split(), ref.lower().split()
+    prev = list(range(len(h) + 1))
+    for i, rw in enumerate(r, 1):
+        cur = [i] + [0] * len(h)
+        for j, hw in enumerate(h, 1):
+            cur[j] = min(prev[j] + 1, cur[j-1] + 1, prev[j-1] + (rw != hw))
+        prev = cur
+    return prev[-1] / max(1, len(r))
+
+def run(profiles, audio=AUDIO, threads=None, language=ASR_LANGUAGE, repeat=1):
+    import soundfile as sf
+    from modules.asr_whisper import transcribe_faster_whisper, asr_settings
+    from modules.model_registry import get_registry
+
+    audio = ROOT / audio
+    duration = sf.info(str(audio)).duration
+    ref = " ".join(s["text"] for s in json.load(open(ROOT / REFERENCE, encoding="utf-8")))
+    out_json = Path("/tmp") / "bench_asr_profiles.json"
+
+    rows = []
+    for name in profiles:
+        cfg = asr_settings(ASR_PROFILES[name], cpu_threads=threads)
+        t0 = time.perf_counter()
+        get_registry().get("whisper", cfg["model_size"], "cpu", cfg["compute_type"],
+                           cpu_threads=cfg["cpu_threads"], num_workers=cfg["num_workers"])
+        load_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            transcribe_faster_whisper(audio, out_json, device="cpu", language=language, **cfg)
+        dt = (time.perf_counter() - t0) / repeat
+        hyp = " ".join(s["text"] for s in json.load(open(out_json, encoding="utf-8")))
+        rows.append({"profile": name, **cfg, "load_s": load_s, "asr_s": dt,
+                     "rtf": dt / duration, "wer_vs_committed": wer(hyp, ref)})
+        get_registry().clear()
+
+    print(f"audio: {audio.name} ({duration:.1f}s)")
+    print(f"{'profile':<10}{'model':<8}{'compute':<10}{'beam':>5}{'batch':>6}{'load s':>8}{'asr s':>8}{'RTF':>7}{'WER':>7}")
+    for r in rows:
+        print(f"{r['profile']:<10}{r['model_size']:<8}{r['compute_type']:<10}{r['beam_size']:>5}{r['batch_size']:>6}"
+              f"{r['load_s']:>8.1f}{r['asr_s']:>8.1f}{r['rtf']:>7.3f}{r['wer_vs_committed']:>7.3f}")
+    return rows
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--profiles", nargs="+", default=list(ASR_PROFILES), choices=list(ASR_PROFILES))
+    ap.add_argument("--audio", default=AUDIO)
+    ap.add_argument("--threads", type=int, default=None, help="Override cpu_threads for every profile")
+    ap.add_argument("--language", default=ASR_LANGUAGE, help="Empty = auto-detect")
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--json", default="", help="Also write results to this JSON file")
+    a = ap.parse_args()
+    res = run(a.profiles, a.audio, a.threads, a.language or None, a.repeat)
+    if a.json:
+        Path(a.json).write_text(json.dumps(res, indent=2))
@@ -0,0 +1,110 @@
+"""
+Compare NLLB backends/decoding strategies on the bundled test set.
+
+Reference = the fp32 beam-4 translations committed under translations/, so the
+scores are a quality *delta* against the current default, not absolute quality.
+
+python benchmarks/bench_nllb_backends.py --configs torch:beam4 int8:beam4 int8:greedy ct2:beam4
+"""
+import argparse, json, math, sys, time
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from config import LANG_NAME_TO_CODE, NLLB_CT2_DIR
+
+# (ASR transcript, fp32 beam-4 reference, language)
+TEST_SET = [
+    ("transcripts/monologue_clip_asr.json", "translations/monologue_clip_en_to_hindi.json", "hindi"),
+    ("transcripts/myclip_asr.json",         "translations/myclip_en_to_arabic.json",        "arabic"),
+]
+
+def _ngrams(seq, n):
+    return Counter(tuple(seq[i:i+n]) for i in range(len(seq) - n + 1))
+
+def corpus_bleu(hyps, refs, max_n=4):
+    """Corpus BLEU on whitespace tokens with brevity penalty (sacreBLEU-style, no smoothing)."""
+    match, total = [0] * max_n, [0] * max_n
+    hl = rl = 0
+    for h, r in zip(hyps, refs):
+        h, r = h.split(), r.split()
+        hl += len(h); rl += len(r)
+        for n in range(1, max_n + 1):
+            hn, rn = _ngrams(h, n), _ngrams(r, n)
+            match[n-1] += sum(min(c, rn[g]) for g, c in hn.items())
+            total[n-1] += max(0, len(h) - n + 1)
+    if hl == 0 or min(match) == 0: return 0.0
+    logp = sum(math.log(m / t) for m, t in zip(match, total)) / max_n
+    bp = 1.0 if hl > rl else math.exp(1 - rl / hl)
+    return 100.0 * bp * math.exp(logp)
+
+def corpus_chrf(hyps, refs, n=6, beta=2.0):
+    """chrF (character n-grams up to 6, beta=2), averaged over n like sacreBLEU."""
+    prec = rec = 0.0
+    for k in range(1, n + 1):
+        m = hc = rc = 0
+        for h, r in zip(hyps, refs):
+            hn, rn = _ngrams(h.replace(" ", ""), k), _ngrams(r.replace(" ", ""), k)
+            m += sum(min(c, rn[g]) for g, c in hn.items())
+            hc += sum(hn.values()); rc += sum(rn.values())
+        prec += m / hc if hc else 0.0
+        rec  += m / rc if rc else 0.0
+    prec /= n; rec /= n
+    if prec + rec == 0: return 0.0
+    return 100.0 * (1 + beta**2) * prec * rec / (beta**2 * prec + rec)
+
+def _scores(hyps, refs):
+    try:
+        import sacrebleu
+        return sacrebleu.corpus_bleu(hyps, [refs]).score, sacrebleu.corpus_chrf(hyps, [refs]).score
+    except ImportError:
+        return corpus_bleu(hyps, refs), corpus_chrf(hyps, refs)
+
+def run(configs, repeat=1):
+    from modules.translate_nllb import NLLBTranslator, DECODE_PRESETS
+    data = []
+    for asr, ref, lang in TEST_SET:
+        src = json.load(open(ROOT / asr, encoding="utf-8"))
+        tgt = json.load(open(ROOT / ref, encoding="utf-8"))
+        data.append(([s["text"] for s in src], [t["tgt"] for t in tgt], LANG_NAME_TO_CODE[lang]))
+    n_sent = sum(len(d[0]) for d in data)
+
+    rows = []
+    for cfg in configs:
+        backend, decode = cfg.split(":")
+        t0 = time.perf_counter()
+        tr = NLLBTranslator(device="cpu", backend=backend, ct2_dir=ROOT / NLLB_CT2_DIR)
+        load_s = time.perf_counter() - t0
+        p = DECODE_PRESETS[decode]
+        hyps, refs = [], []
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            hyps, refs = [], []
+            for texts, ref, code in data:
+                hyps += tr.translate_texts(texts, code, beams=p["beams"], max_new=p["max_new"],
+                                           no_repeat_ngram_size=p["no_repeat_ngram_size"])
+                refs += ref
+        dt = (time.perf_counter() - t0) / repeat
+        bleu, chrf = _scores(hyps, refs)
+        rows.append({"config": f"{tr.backend}:{decode}", "load_s": load_s, "sent_per_s": n_sent / dt,
+                     "bleu_vs_fp32_beam4": bleu, "chrf_vs_fp32_beam4": chrf})
+        del tr
+
+    print(f"{'config':<16}{'load s':>8}{'sent/s':>9}{'BLEU':>8}{'chrF':>8}")
+    for r in rows:
+        print(f"{r['config']:<16}{r['load_s']:>8.1f}{r['sent_per_s']:>9.2f}"
+              f"{r['bleu_vs_fp32_beam4']:>8.1f}{r['chrf_vs_fp32_beam4']:>8.1f}")
+    return rows
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--configs", nargs="+", default=["torch:beam4", "int8:beam4", "int8:greedy", "ct2:beam4"],
+                    help="backend:decode pairs")
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--json", default="", help="Also write results to this JSON file")
+    a = ap.parse_args()
+    res = run(a.configs, a.repeat)
+    if a.json:
+        Path(a.json).write_text(json.dumps(res, indent=2))
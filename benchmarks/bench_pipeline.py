@@ -0,0 +1,272 @@
+"""
+Offline, CPU-only throughput/memory benchmark of the pipeline's stages on
+synthetic inputs (benchmarks/fixtures.py): a face-like sprite video and
+speech-like audio of --seconds, randomly initialized / tiny models and a
+stubbed Edge TTS endpoint, so runs are reproducible and need no downloads.
+
+  startup       `main.py --help` cold start              starts / s
+  mel           Wav2Lip mel frontend                     audio s / s
+  detect        S3FD face detector forward (random)      frames / s
+  datagen       Wav2Lip crop/resize/mask batching        frames / s
+  generator     Wav2Lip generator forward (random)       frames / s
+  paste_encode  paste-back + OpenCV writer + ffmpeg mux  frames / s
+  timeline      Edge TTS timeline with a stub voice      audio s / s
+  translate     NLLB batching + generate (tiny M2M100)   segments / s
+
+Results are compared with benchmarks/baseline.json: a stage whose throughput
+drops by more than --max_slowdown or whose peak RSS grows by more than
+--max_mem_growth is a regression (exit code 1). Throughput depends on the
+machine; refresh the baseline with --update_baseline on the machine you compare on.
+
+python benchmarks/bench_pipeline.py --seconds 10
+python benchmarks/bench_pipeline.py --stages generator paste_encode --repeat 3
+python benchmarks/bench_pipeline.py --update_baseline
+"""
+import argparse, asyncio, json, os, platform, shutil, subprocess, sys, tempfile, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "Wav2Lip"))
+
+import numpy as np
+
+from benchmarks import fixtures
+from benchmarks.bench_startup import start_time
+from modules.metrics import RunReport
+
+BASELINE = ROOT / "benchmarks" / "baseline.json"
+STAGES = ("startup", "mel", "detect", "datagen", "generator", "paste_encode", "timeline", "translate")
+PARAMS = ("seconds", "fps", "size", "seed", "batch", "detect_frames", "tts_latency", "segments", "beams")
+
+
+class Bench:
+    """Fixtures and intermediate results shared by the stages (built on first use, untimed)."""
+    def __init__(self, a, tmp: Path):
+        self.a, self.tmp = a, tmp
+        self.wav, self.phrases = fixtures.speech(a.seconds, seed=a.seed)
+        self.video = tmp / "talking_head.mp4"
+        self.frames = fixtures.talking_head(self.video, self.wav, a.seconds, a.fps, (a.size, a.size), a.seed)
+        self._inf = self._mel = self._batches = self._preds = None
+
+    @property
+    def inference(self):
+        if self._inf is None:
+            from modules.model_registry import import_wav2lip_inference
+            self._inf = import_wav2lip_inference()
+            self._inf.device = "cpu"
+            s = self.a.size  # a fixed box around the sprite stands in for detection
+            self._inf.args = self._inf.parse_args([
+                "--face", str(self.video), "--audio", str(self.tmp / "speech.wav"), "--checkpoint_path", "random",
+                "--wav2lip_batch_size", str(self.a.batch), "--box", *map(str, (s // 5, s * 9 // 10, s // 5, s * 4 // 5))])
+        return self._inf
+
+    @property
+    def mel(self):
+        if self._mel is None:
+            self._mel = self.inference.audio.melspectrogram(self.wav)
+        return self._mel
+
+    @property
+    def batches(self):
+        if self._batches is None:
+            inf = self.inference
+            self._batches = list(inf.datagen([f.copy() for f in self.frames], inf.get_mel_chunks(self.mel, self.a.fps)))
+        return self._batches
+
+    @property
+    def preds(self):
+        if self._preds is None:
+            self._preds = _generate(fixtures.random_wav2lip(self.a.seed), self.batches)
+        return self._preds
+
+
+def _generate(model, batches):
+    import torch
+    preds = []
+    for img, mel, _, _ in batches:
+        img = torch.FloatTensor(np.transpose(img, (0, 3, 1, 2)))
+        mel = torch.FloatTensor(np.transpose(mel, (0, 3, 1, 2)))
+        with torch.no_grad():
+            preds.append(model(mel, img).numpy().transpose(0, 2, 3, 1) * 255.)
+    return preds
+
+
+# ---------------- stages: prepare, then return (run, units, unit) ----------------
+def bench_startup(b: Bench):
+    # import profile: benchmarks/bench_startup.py
+    return (lambda: start_time("main.py --help", repeat=1)), 1, "starts"
+
+def bench_mel(b: Bench):
+    inf = b.inference
+    def run():
+        b._mel = inf.audio.melspectrogram(b.wav)
+    return run, b.a.seconds, "audio_s"
+
+def bench_detect(b: Bench):
+    import torch
+    from face_detection.detection.sfd.net_s3fd import s3fd
+    torch.manual_seed(b.a.seed)
+    net = s3fd().eval()
+    frames = np.array(b.frames[:b.a.detect_frames])
+    def run():
+        # the S3FD detector's input transform: BGR minus the VGG mean, NCHW
+        x = torch.from_numpy((frames - np.array([104, 117, 123])).transpose(0, 3, 1, 2).astype(np.float32))
+        with torch.no_grad():
+            for i in range(0, len(x), 16):
+                net(x[i:i + 16])
+    return run, len(frames), "frames"
+
+def bench_datagen(b: Bench):
+    inf = b.inference
+    chunks = inf.get_mel_chunks(b.mel, b.a.fps)
+    def run():
+        b._batches = list(inf.datagen([f.copy() for f in b.frames], chunks))
+    return run, len(chunks), "frames"
+
+def bench_generator(b: Bench):
+    model, batches = fixtures.random_wav2lip(b.a.seed), b.batches
+    def run():
+        b._preds = _generate(model, batches)
+    return run, sum(len(x[0]) for x in batches), "frames"
+
+def bench_paste_encode(b: Bench):
+    import soundfile as sf
+    inf, batches, preds = b.inference, b.batches, b.preds
+    sf.write(b.tmp / "speech.wav", b.wav, fixtures.SR)
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        print("[bench] ffmpeg not found: paste_encode measures the OpenCV writer only")
+    def run():
+        writer, path = inf._open_writer_with_fallback(str(b.tmp / "result"), b.a.fps, (b.a.size, b.a.size))
+        for (_, _, frames, coords), pred in zip(batches, preds):
+            inf.paste_frames(writer, pred, [f.copy() for f in frames], coords)
+        writer.release()
+        if ffmpeg is not None:
+            subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-i", path, "-i", str(b.tmp / "speech.wav"),
+                            "-shortest", "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac",
+                            str(b.tmp / "result_voice.mp4")], check=True)
+    return run, sum(len(p) for p in preds), "frames"
+
+def bench_timeline(b: Bench):
+    import soundfile as sf
+    from modules import tts_edge
+    from modules.tts_scheduler import configure_scheduler
+    from modules.voice_catalog import VoiceCatalog
+    segs = fixtures.asr_segments(b.phrases, b.a.seed)
+    asr_json = fixtures.write_json(b.tmp / "bench_asr.json", segs)
+    trans_json = fixtures.write_json(b.tmp / "bench_trans.json", fixtures.translation_segments(segs, b.a.seed + 1))
+    orig = b.tmp / "speech.wav"
+    sf.write(orig, b.wav, fixtures.SR)
+    tts_edge._edge_save = fixtures.StubEdge(b.a.tts_latency, seed=b.a.seed)
+    configure_scheduler(rate_per_sec=1e6, burst=10**6, retries=1)  # throttling is not what is measured here
+    catalog = VoiceCatalog(fixtures.VOICES)
+    def run():
+        asyncio.run(tts_edge.build_dubbed_timeline(asr_json, trans_json, orig, b.tmp / "bench_dub.wav", "hi-",
+                                                   None, catalog=catalog, incremental=False))
+    return run, b.a.seconds, "audio_s"
+
+def bench_translate(b: Bench):
+    from modules.translate_nllb import translate_segments
+    segs = fixtures.transcript(b.a.segments, b.a.seed)
+    asr_json = fixtures.write_json(b.tmp / "bench_transcript.json", segs)
+    tr = fixtures.tiny_translator(b.a.seed)
+    def run():
+        translate_segments(asr_json, "hin_Deva", b.tmp / "bench_trans_out.json", tm_path=None, translator=tr,
+                           decode={"beams": b.a.beams, "max_new": 48})
+    return run, len(segs), "segments"
+
+
+# ---------------- harness ----------------
+def machine() -> dict:
+    import torch
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "torch": torch.__version__, "torch_threads": torch.get_num_threads()}
+
+def run(a) -> dict:
+    rep = RunReport("bench_pipeline", sample_sec=0.05)
+    stages = {}
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as tmp:
+        t0 = time.perf_counter()
+        b = Bench(a, Path(tmp))
+        print(f"[bench] fixtures: {a.seconds:.0f}s audio, {len(b.frames)} frames {a.size}x{a.size}, "
+              f"{len(b.phrases)} phrases ({time.perf_counter() - t0:.1f}s)")
+        for name in a.stages:
+            fn, units, unit = globals()[f"bench_{name}"](b)
+            for _ in range(a.warmup):  # first calls pay for lazy imports, allocator growth, FFT plans
+                fn()
+            walls = []
+            with rep.stage(name) as rec:
+                while len(walls) < a.repeat or sum(walls) < a.min_time:  # short stages repeat, like timeit
+                    t1 = time.perf_counter()
+                    fn()
+                    walls.append(time.perf_counter() - t1)
+            best = min(walls)
+            stages[name] = {"throughput": units / best, "unit": f"{unit}/s", "units": units, "wall_s": best,
+                            "runs": len(walls), "peak_rss_mb": rec["peak_rss_mb"], "items": rec["items"]}
+            print(f"[bench] {name:<13}{units / best:>10.2f} {unit}/s  ({best:.2f}s, peak RSS {rec['peak_rss_mb']:.0f} MB)")
+    return {"created": time.time(), "machine": machine(), "params": {k: getattr(a, k) for k in PARAMS},
+            "stages": stages}
+
+def compare(res: dict, base: dict, max_slowdown: float, max_mem_growth: float) -> list:
+    """Print current vs. baseline per stage; returns the regressed stage names."""
+    if base["params"] != res["params"]:
+        print(f"[bench] warning: baseline was made with {base['params']}, this run with {res['params']}")
+    if base["machine"] != res["machine"]:
+        print(f"[bench] warning: baseline machine {base['machine']} differs from {res['machine']}")
+    print(f"\n[bench] {'stage':<13}{'baseline':>11}{'now':>11}{'change':>9}{'RSS base':>10}{'RSS now':>9}")
+    bad = []
+    for name, s in res["stages"].items():
+        old = base["stages"].get(name)
+        if old is None:
+            print(f"[bench] {name:<13}{'-':>11}{s['throughput']:>11.2f}   (not in baseline)")
+            continue
+        change = s["throughput"] / old["throughput"] - 1
+        slow = -change > max_slowdown
+        fat = s["peak_rss_mb"] > old["peak_rss_mb"] * (1 + max_mem_growth)
+        if slow or fat:
+            bad.append(name)
+        flag = "  REGRESSION" + (" (speed)" if slow else "") + (" (memory)" if fat else "") if slow or fat else ""
+        print(f"[bench] {name:<13}{old['throughput']:>11.2f}{s['throughput']:>11.2f}{change:>+9.0%}"
+              f"{old['peak_rss_mb']:>10.0f}{s['peak_rss_mb']:>9.0f}{flag}")
+    return bad
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    ap.add_argument("--seconds", type=float, default=10.0, help="Length of the synthetic clip")
+    ap.add_argument("--fps", type=int, default=25)
+    ap.add_argument("--size", type=int, default=256, help="Frame width and height")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--batch", type=int, default=128, help="Wav2Lip batch size")
+    ap.add_argument("--detect_frames", type=int, default=8, help="Frames sent through the face detector")
+    ap.add_argument("--tts_latency", type=float, default=0.0, help="Simulated Edge round trip per request (s)")
+    ap.add_argument("--segments", type=int, default=64, help="Transcript segments for the translate stage")
+    ap.add_argument("--beams", type=int, default=4, help="Beam size for the translate stage")
+    ap.add_argument("--threads", type=int, default=None, help="torch.set_num_threads before running")
+    ap.add_argument("--warmup", type=int, default=1, help="Untimed runs of each stage before measuring")
+    ap.add_argument("--repeat", type=int, default=1, help="Run each stage at least N times and keep the fastest")
+    ap.add_argument("--min_time", type=float, default=2.0, help="...and for at least this many seconds in total")
+    ap.add_argument("--baseline", default=str(BASELINE))
+    ap.add_argument("--update_baseline", action="store_true", help="Store this run as the baseline")
+    ap.add_argument("--max_slowdown", type=float, default=0.25, help="Allowed throughput drop (fraction)")
+    ap.add_argument("--max_mem_growth", type=float, default=0.25, help="Allowed peak RSS growth (fraction)")
+    ap.add_argument("--json", default="", help="Also write results to this JSON file")
+    a = ap.parse_args()
+    if a.threads:
+        import torch
+        torch.set_num_threads(a.threads)
+    res = run(a)
+    if a.json:
+        Path(a.json).write_text(json.dumps(res, indent=2))
+    base_path = Path(a.baseline)
+    if a.update_baseline:
+        base_path.write_text(json.dumps(res, indent=2) + "\n")
+        print(f"[bench] baseline written: {base_path}")
+    elif base_path.exists():
+        bad = compare(res, json.loads(base_path.read_text()), a.max_slowdown, a.max_mem_growth)
+        if bad:
+            print(f"[bench] regressions: {', '.join(bad)}")
+            sys.exit(1)
+    else:
+        print(f"[bench] no baseline at {base_path}; create one with --update_baseline")
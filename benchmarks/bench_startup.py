@@ -0,0 +1,80 @@
+"""
+Cold-start time of the CLI and where it goes (python -X importtime).
+
+Each command is started --repeat times in a fresh interpreter; the median wall
+time is compared with --budget (exit code 1 above it). The import profile of
+the first run lists the slowest top-level imports and flags heavy libraries
+(torch, transformers, librosa, ...) that a trivial invocation should not load.
+
+python benchmarks/bench_startup.py
+python benchmarks/bench_startup.py --cmd "main.py batch --help" --top 25
+"""
+import argparse, json, statistics, subprocess, sys, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+COMMANDS = ["main.py --help", "main.py batch --help", "main.py serve --help",
+            "main.py cluster --help", "main.py report --help"]
+HEAVY = ("torch", "transformers", "librosa", "cv2", "faster_whisper", "ctranslate2", "edge_tts",
+         "soundfile", "scipy", "sklearn", "numba", "numpy")
+
+def parse_importtime(stderr: str) -> list:
+    """[(module, self_s, cumulative_s, depth)] from -X importtime output, in import order."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line: continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit(): continue  # header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us) / 1e6, int(cum_us) / 1e6, depth))
+    return rows
+
+def start_time(cmd: str, repeat: int = 5) -> float:
+    """Median wall time of `python <cmd>` run from the repo root."""
+    walls = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, *cmd.split()], cwd=ROOT, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True)
+        walls.append(time.perf_counter() - t0)
+    return statistics.median(walls)
+
+def profile(cmd: str, repeat: int = 5, top: int = 15) -> dict:
+    res = subprocess.run([sys.executable, "-X", "importtime", *cmd.split()], cwd=ROOT,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    rows = parse_importtime(res.stderr)
+    # depth 0 = imported directly by the script or by site; their cumulative times add up to the total
+    firsts = sorted((r for r in rows if r[3] == 0), key=lambda r: -r[2])[:top]
+    loaded = {r[0] for r in rows}
+    return {"cmd": cmd, "wall_s": start_time(cmd, repeat), "import_s": sum(r[2] for r in rows if r[3] == 0),
+            "modules": len(rows), "heavy": [h for h in HEAVY if h in loaded],
+            "top": [{"module": m, "cumulative_s": c, "self_s": s} for m, s, c, _ in firsts]}
+
+def run(cmds, repeat=5, top=15, budget=0.5):
+    rows = []
+    for cmd in cmds:
+        p = profile(cmd, repeat, top)
+        rows.append(p)
+        print(f"\n{p['cmd']}: {p['wall_s'] * 1000:.0f} ms wall (median of {repeat}), "
+              f"{p['import_s'] * 1000:.0f} ms in {p['modules']} imports"
+              + (f", heavy: {', '.join(p['heavy'])}" if p["heavy"] else ""))
+        for t in p["top"]:
+            print(f"  {t['cumulative_s'] * 1000:8.1f} ms  {t['module']}")
+    slow = [p["cmd"] for p in rows if p["wall_s"] > budget]
+    print(f"\n{len(rows) - len(slow)}/{len(rows)} commands start within {budget * 1000:.0f} ms"
+          + (f"; over budget: {', '.join(slow)}" if slow else ""))
+    return rows, slow
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--cmd", action="append", default=None, help=f"Command line after 'python' (default {COMMANDS})")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--top", type=int, default=15, help="Slowest top-level imports to list")
+    ap.add_argument("--budget", type=float, default=0.5, help="Cold-start budget in seconds")
+    ap.add_argument("--json", default="", help="Also write results to this JSON file")
+    a = ap.parse_args()
+    res, slow = run(a.cmd or COMMANDS, a.repeat, a.top, a.budget)
+    if a.json:
+        Path(a.json).write_text(json.dumps(res, indent=2))
+    sys.exit(1 if slow else 0)
@@ -0,0 +1,108 @@
+"""
+Throughput of 1, 2, 4, ... concurrent render-like jobs on one machine, with
+every library choosing its own thread count ("default": torch, OpenCV and
+ffmpeg each start one thread per core) against the shared thread budget of
+modules/threads.py ("budget").
+
+Each job is its own process, like job server or cluster workers. It runs a
+randomly initialized Wav2Lip generator over --frames frames in batches
+(torch), pastes the faces back with OpenCV and encodes the frames with
+ffmpeg/libx264. Budgeted jobs register in a common ledger and re-apply
+their share between batches, so a job that finishes hands its threads to
+the ones still running. Jobs start together (after loading); throughput is
+frames / s from the first start to the last finish.
+
+python benchmarks/bench_threads.py
+python benchmarks/bench_threads.py --jobs 1 2 4 8 --frames 256 --json threads.json
+"""
+import argparse, json, multiprocessing as mp, os, subprocess, sys, tempfile, time
+from contextlib import nullcontext
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "Wav2Lip"))
+
+MODES = ("default", "budget")
+
+
+def job(mode, ledger, cores, frames, batch, size, seed, barrier, results):
+    """One render-like job (runs in a spawned process); puts {"start", "end", "threads"} on `results`."""
+    import cv2, numpy as np, torch
+    from benchmarks import fixtures
+    from modules.threads import configure_threads
+    budget = configure_threads(cores, ledger, poll_sec=0.2) if mode == "budget" else None
+    model = fixtures.random_wav2lip(seed)
+    rng = np.random.default_rng(seed)
+    bg = rng.integers(0, 255, (size, size, 3), dtype=np.uint8)
+    y1, x1, side = size // 4, size // 4, size // 2
+    barrier.wait()
+    start, seen = time.time(), set()
+    with budget.allot("render", cores) if budget else nullcontext():
+        enc = subprocess.Popen(
+            ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "bgr24",
+             "-s", f"{size}x{size}", "-r", "25", "-i", "pipe:0", *(budget.ffmpeg_args() if budget else []),
+             "-c:v", "libx264", "-pix_fmt", "yuv420p", "-f", "null", "-"], stdin=subprocess.PIPE)
+        for i in range(0, frames, batch):
+            if budget:
+                seen.add(budget.apply())
+            n = min(batch, frames - i)
+            with torch.no_grad():
+                pred = model(torch.rand(n, 1, 80, 16), torch.rand(n, 6, 96, 96))
+            for p in (pred.numpy().transpose(0, 2, 3, 1) * 255).astype(np.uint8):
+                f = bg.copy()
+                f[y1:y1 + side, x1:x1 + side] = cv2.resize(p, (side, side))
+                enc.stdin.write(f.tobytes())
+        enc.stdin.close()
+        enc.wait()
+    results.put({"start": start, "end": time.time(), "threads": sorted(seen) or None})
+
+def run_concurrent(mode, n, cores, frames, batch, size, seed, tmp: Path) -> dict:
+    ctx = mp.get_context("spawn")
+    barrier, results = ctx.Barrier(n), ctx.Queue()
+    ledger = tmp / f"ledger_{mode}_{n}.json"
+    procs = [ctx.Process(target=job, args=(mode, ledger, cores, frames, batch, size, seed + k, barrier, results))
+             for k in range(n)]
+    for p in procs: p.start()
+    rows = [results.get() for _ in procs]
+    for p in procs: p.join()
+    if any(p.exitcode for p in procs):
+        raise RuntimeError(f"{mode} x{n}: a job failed")
+    wall = max(r["end"] for r in rows) - min(r["start"] for r in rows)
+    return {"mode": mode, "jobs": n, "wall_s": wall, "frames_per_s": n * frames / wall,
+            "jobs_per_min": 60 * n / wall, "job_wall_s": sorted(r["end"] - r["start"] for r in rows),
+            "threads_seen": [r["threads"] for r in rows]}
+
+def run(jobs=(1, 2, 4), modes=MODES, cores=None, frames=192, batch=32, size=256, seed=0):
+    cores = cores or os.cpu_count() or 1
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="bench_threads_") as tmp:
+        for n in jobs:
+            for mode in modes:
+                r = run_concurrent(mode, n, cores, frames, batch, size, seed, Path(tmp))
+                rows.append(r)
+                print(f"[threads] {mode:<8} x{n}: {r['wall_s']:6.1f}s wall, {r['frames_per_s']:7.1f} frames/s, "
+                      f"{r['jobs_per_min']:6.2f} jobs/min"
+                      + (f", shares {r['threads_seen']}" if mode == "budget" else ""))
+    print(f"\n[threads] {cores} cores, {frames} frames per job")
+    print(f"[threads] {'jobs':>5}" + "".join(f"{m + ' fr/s':>16}" for m in modes) + f"{'budget/default':>16}")
+    for n in jobs:
+        fps = {r["mode"]: r["frames_per_s"] for r in rows if r["jobs"] == n}
+        gain = f"{fps['budget'] / fps['default']:.2f}x" if {"budget", "default"} <= fps.keys() else "-"
+        print(f"[threads] {n:>5}" + "".join(f"{fps[m]:>16.1f}" for m in modes) + f"{gain:>16}")
+    return rows
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4], help="Concurrent job counts to measure")
+    ap.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    ap.add_argument("--cores", type=int, default=None, help="Thread budget (default: os.cpu_count())")
+    ap.add_argument("--frames", type=int, default=192, help="Frames rendered per job")
+    ap.add_argument("--batch", type=int, default=32, help="Wav2Lip batch size")
+    ap.add_argument("--size", type=int, default=256, help="Frame width and height")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default="", help="Also write results to this JSON file")
+    a = ap.parse_args()
+    res = run(a.jobs, a.modes, a.cores, a.frames, a.batch, a.size, a.seed)
+    if a.json:
+        Path(a.json).write_text(json.dumps(res, indent=2))
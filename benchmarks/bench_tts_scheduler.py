@@ -0,0 +1,166 @@
+"""
+Drive modules/tts_scheduler.py against fixtures.FaultyEdge (a local Edge
+stand-in that injects latency, timeouts, 429s and outages) and check that
+it behaves as designed:
+
+  backoff  full-jitter delays stay within min(cap, base * 2^(attempt-1)), mean about half of it
+  aimd     the concurrency limit halves on an error and grows by ~1 per window of successes
+  flaky    10% 429s + 5% timeouts: every request still succeeds through retries, the limit
+           backs off, calls in flight never exceed max_concurrency, the token bucket holds the rate
+  outage   every call fails for a while: the breaker opens and short-circuits callers, a probe
+           after breaker_reset closes it once the endpoint is back, later requests succeed
+
+Timings are scaled down (tens of ms), so the whole run takes a few seconds.
+Exits with code 1 if a check fails.
+
+python benchmarks/bench_tts_scheduler.py
+python benchmarks/bench_tts_scheduler.py --scenarios flaky outage --requests 200 --json sched.json
+"""
+import argparse, asyncio, json, sys, time
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmarks import fixtures
+from modules.tts_scheduler import AdaptiveLimit, CircuitOpenError, TTSScheduler
+
+SCENARIOS = ("backoff", "aimd", "flaky", "outage")
+
+# scaled-down TTS_SCHEDULER: fast retries and breaker reset, so a scenario takes a second or two
+SCHED = {"rate_per_sec": 100.0, "burst": 10, "min_concurrency": 1, "max_concurrency": 6, "retries": 5,
+         "backoff_base": 0.02, "backoff_cap": 0.2, "breaker_threshold": 5, "breaker_reset": 0.3}
+
+
+def _check(checks, name, ok, detail=""):
+    checks.append({"check": name, "ok": bool(ok), "detail": detail})
+
+async def drive(stub, n, spacing=0.0, **sched_kw):
+    """n requests through one scheduler, request i starting at i * spacing s; samples limit and breaker state."""
+    sched = TTSScheduler(**{**SCHED, **sched_kw})
+    trace, done = [], asyncio.Event()
+
+    async def sample():
+        t0 = time.monotonic()
+        while not done.is_set():
+            trace.append((time.monotonic() - t0, sched.limit.limit, sched.breaker.state))
+            await asyncio.sleep(0.005)
+
+    async def one(i):
+        await asyncio.sleep(i * spacing)
+        t = time.monotonic()
+        try:
+            await sched.run("stub", lambda: stub(f"request {i}", "stub", 0, None))
+            return t, "ok"
+        except CircuitOpenError:
+            return t, "circuit_open"
+        except Exception as e:
+            return t, type(e).__name__
+
+    sampler = asyncio.create_task(sample())
+    t0 = time.monotonic()
+    outcomes = await asyncio.gather(*(one(i) for i in range(n)))
+    wall = time.monotonic() - t0
+    done.set()
+    await sampler
+    return sched, [(t - t0, o) for t, o in outcomes], trace, wall
+
+
+def run_backoff(a, checks):
+    sched = TTSScheduler(**SCHED)
+    rows = []
+    for attempt in range(1, 8):
+        bound = min(sched.backoff_cap, sched.backoff_base * 2 ** (attempt - 1))
+        xs = [sched.backoff(attempt) for _ in range(4000)]
+        mean = sum(xs) / len(xs)
+        rows.append({"attempt": attempt, "bound": bound, "max": max(xs), "mean": mean})
+        _check(checks, f"backoff attempt {attempt} <= bound", max(xs) <= bound, f"max {max(xs):.4f} bound {bound:.4f}")
+        _check(checks, f"backoff attempt {attempt} mean ~ bound/2", abs(mean / bound - 0.5) < 0.05, f"{mean / bound:.3f}")
+    for r in rows:
+        print(f"[sched] backoff attempt {r['attempt']}: bound {r['bound']:.3f}s max {r['max']:.3f}s mean {r['mean']:.3f}s")
+    return rows
+
+def run_aimd(a, checks):
+    lim = AdaptiveLimit(1, 8, initial=4)
+    seq = []
+    async def step(ok):
+        await lim.acquire()
+        lim.release(ok)
+        seq.append(round(lim.limit, 3))
+    async def go():
+        await step(False)                 # 4 -> 2
+        for _ in range(6): await step(True)
+        for _ in range(5): await step(False)
+        for _ in range(200): await step(True)
+    asyncio.run(go())
+    _check(checks, "aimd halves on error", seq[0] == 2.0, str(seq[0]))
+    _check(checks, "aimd grows ~1 per window", 3.5 < seq[6] < 4.5, str(seq[6]))  # windows of ~2, then ~3
+    _check(checks, "aimd floor at min_limit", seq[11] == 1.0, str(seq[11]))
+    _check(checks, "aimd ceiling at max_limit", seq[-1] == 8.0, str(seq[-1]))
+    print(f"[sched] aimd limit after error: {seq[0]}, +6 ok: {seq[6]}, +5 errors: {seq[11]}, +200 ok: {seq[-1]}")
+    return {"limits": seq}
+
+def run_flaky(a, checks):
+    stub = fixtures.FaultyEdge(latency=0.03, p_timeout=0.05, p_429=0.10, timeout=0.1, write=False, seed=a.seed)
+    sched, outcomes, trace, wall = asyncio.run(drive(stub, a.requests))
+    res = Counter(o for _, o in outcomes)
+    calls = Counter(o for _, o in stub.log)
+    min_limit = min(l for _, l, _ in trace)
+    burst, rate = SCHED["burst"], SCHED["rate_per_sec"]
+    _check(checks, "flaky: all requests succeed", res["ok"] == a.requests, dict(res))
+    _check(checks, "flaky: faults were retried", len(stub.log) > a.requests, f"{len(stub.log)} calls")
+    _check(checks, "flaky: limit backed off", min_limit < sched.limit.max_limit // 2, f"min {min_limit:.2f}")
+    _check(checks, "flaky: in flight <= max_concurrency", stub.peak <= SCHED["max_concurrency"], f"peak {stub.peak}")
+    _check(checks, "flaky: token bucket rate", len(stub.log) <= burst + rate * wall + 1,
+           f"{len(stub.log)} calls in {wall:.2f}s")
+    st = sched.stats()["stub"]
+    print(f"[sched] flaky: {a.requests} requests, {len(stub.log)} calls {dict(calls)}, {wall:.2f}s, "
+          f"limit min {min_limit:.2f} final {sched.limit.limit:.2f}, peak in flight {stub.peak}, "
+          f"p50 {st['p50']:.3f}s p95 {st['p95']:.3f}s")
+    return {"requests": a.requests, "outcomes": dict(res), "calls": dict(calls), "wall_s": wall,
+            "limit_min": min_limit, "limit_final": sched.limit.limit, "peak_in_flight": stub.peak, "stats": st}
+
+def run_outage(a, checks):
+    outage = (0.3, 1.0)
+    stub = fixtures.FaultyEdge(latency=0.02, outage=outage, write=False, seed=a.seed)
+    sched, outcomes, trace, wall = asyncio.run(drive(stub, a.requests, spacing=2.0 / a.requests))
+    res = Counter(o for _, o in outcomes)
+    states = [s for _, _, s in trace]
+    opened = [t for t, _, s in trace if s == "open"]
+    during = sum(1 for t, _ in stub.log if outage[0] <= t < outage[1])
+    late = [o for t, o in outcomes if t > outage[1] + SCHED["breaker_reset"] + 0.2]
+    _check(checks, "outage: breaker opened", bool(opened), f"first open at {opened[0]:.2f}s" if opened else "")
+    _check(checks, "outage: callers short-circuited", res["circuit_open"] > 0, dict(res))
+    _check(checks, "outage: breaker closed again", states[-1] == "closed", states[-1])
+    _check(checks, "outage: requests after recovery succeed", late and all(o == "ok" for o in late),
+           f"{sum(o == 'ok' for o in late)}/{len(late)}")
+    span = outage[1] - outage[0]
+    _check(checks, "outage: calls to the failing endpoint bounded",
+           during <= SCHED["breaker_threshold"] + SCHED["max_concurrency"] + span / SCHED["breaker_reset"] + 2,
+           f"{during} calls during the {span:.1f}s outage")
+    print(f"[sched] outage {outage[0]}-{outage[1]}s: {a.requests} requests {dict(res)}, {during} calls reached "
+          f"the failing endpoint, breaker states {sorted(set(states))}, final {states[-1]}")
+    return {"requests": a.requests, "outcomes": dict(res), "calls_during_outage": during,
+            "first_open_s": opened[0] if opened else None, "final_state": states[-1]}
+
+
+RUNNERS = {"backoff": run_backoff, "aimd": run_aimd, "flaky": run_flaky, "outage": run_outage}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    ap.add_argument("--requests", type=int, default=120, help="Requests per flaky/outage scenario")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default="", help="Also write results to this JSON file")
+    a = ap.parse_args()
+    checks, results = [], {}
+    for name in a.scenarios:
+        results[name] = RUNNERS[name](a, checks)
+    failed = [c for c in checks if not c["ok"]]
+    for c in failed:
+        print(f"[sched] FAILED {c['check']}: {c['detail']}")
+    print(f"[sched] {len(checks) - len(failed)}/{len(checks)} checks passed")
+    if a.json:
+        Path(a.json).write_text(json.dumps({"results": results, "checks": checks}, indent=2))
+    sys.exit(1 if failed else 0)
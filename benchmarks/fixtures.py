@@ -0,0 +1,257 @@
+"""
+Synthetic, seeded inputs and offline stand-ins for the pipeline benchmarks:
+
+  speech()        speech-like 16 kHz audio (voiced syllables, word and phrase pauses)
+  talking_head()  video of a moving face-like sprite whose mouth follows the audio
+  asr_segments()  ASR/translation JSON segments aligned with the audio's phrases
+  transcript()    a longer ASR-style transcript of n segments (translation batching)
+  StubEdge        replaces the Edge TTS request with a local synthetic voice
+  FaultyEdge      StubEdge that injects latency, timeouts, 429s and outages
+  tiny_translator() NLLBTranslator with a word tokenizer and a small random M2M100
+  random_wav2lip()  randomly initialized Wav2Lip generator
+
+Nothing here touches the network or needs downloaded weights.
+"""
+import asyncio, json, time, zlib
+from pathlib import Path
+
+import numpy as np
+
+SR = 16000
+WORDS = ("the", "we", "new", "model", "speech", "time", "video", "people", "world", "think", "really",
+         "going", "because", "language", "voice", "today", "right", "about", "little", "problem")
+
+
+# ---------------- audio ----------------
+def _syllable(rng, sr, f0, dur):
+    n = int(dur * sr)
+    t = np.arange(n) / sr
+    f = f0 * (1 + 0.08 * np.sin(2 * np.pi * rng.uniform(2, 5) * t))  # pitch contour
+    phase = 2 * np.pi * np.cumsum(f) / sr
+    y = sum(np.sin(k * phase) / k for k in range(1, 11))              # glottal-like harmonics
+    y += 0.15 * rng.standard_normal(n)                                # aspiration
+    return (y * np.hanning(n)).astype(np.float32)
+
+def speech(seconds: float, sr: int = SR, seed: int = 0):
+    """
+    Returns (samples float32, phrases [(start, end, n_words)]). Words are 1-3
+    syllables of 120-250 ms; short pauses separate words, longer ones phrases.
+    """
+    rng = np.random.default_rng(seed)
+    out = np.zeros(int(seconds * sr), dtype=np.float32)
+    phrases, t = [], 0.3
+    while t < seconds - 1.0:
+        start, words = t, 0
+        f0 = rng.uniform(100, 220)
+        for _ in range(rng.integers(3, 12)):
+            for _ in range(rng.integers(1, 4)):
+                dur = rng.uniform(0.12, 0.25)
+                i = int(t * sr)
+                if i + int(dur * sr) >= len(out): break
+                y = _syllable(rng, sr, f0, dur)
+                out[i:i + len(y)] += y * rng.uniform(0.2, 0.35)
+                t += dur
+            words += 1
+            t += rng.uniform(0.03, 0.12)
+            if t >= seconds - 1.0: break
+        phrases.append((round(start, 3), round(t, 3), words))
+        t += rng.uniform(0.25, 0.7)
+    out += 10 ** (-50 / 20) * rng.standard_normal(len(out)).astype(np.float32)
+    return out, phrases
+
+def envelope(wav, sr: int, fps: float):
+    """Per-video-frame RMS of the audio, scaled to 0..1 (drives the sprite's mouth)."""
+    hop = sr / fps
+    n = int(len(wav) / hop)
+    rms = np.array([np.sqrt(np.mean(wav[int(i * hop):int((i + 1) * hop)] ** 2) + 1e-12) for i in range(n)])
+    return np.clip(rms / (rms.max() + 1e-9), 0, 1)
+
+
+# ---------------- video ----------------
+def _background(rng, w, h):
+    gy, gx = np.mgrid[0:h, 0:w]
+    bg = np.stack([60 + 40 * gx / w, 70 + 30 * gy / h, 90 + 20 * (gx + gy) / (w + h)], axis=-1)
+    return np.clip(bg + rng.normal(0, 6, bg.shape), 0, 255).astype(np.uint8)
+
+def talking_head(path: Path, wav, seconds: float, fps: int = 25, size=(256, 256), seed: int = 0):
+    """
+    Write an mp4 (OpenCV mp4v) of a face-like sprite (skin ellipse, eyes,
+    mouth opening with the audio envelope) drifting over a textured
+    background. Returns the frames (BGR uint8) as well.
+    """
+    import cv2
+    rng = np.random.default_rng(seed)
+    w, h = size
+    bg = _background(rng, w, h)
+    env = envelope(wav, SR, fps)
+    frames = []
+    for i in range(int(seconds * fps)):
+        f = bg.copy()
+        t = i / fps
+        cx = int(w / 2 + 0.12 * w * np.sin(2 * np.pi * 0.13 * t))
+        cy = int(h / 2 + 0.06 * h * np.sin(2 * np.pi * 0.21 * t + 1))
+        fw, fh = int(0.22 * w), int(0.3 * h)
+        cv2.ellipse(f, (cx, cy), (fw, fh), 0, 0, 360, (120, 160, 210), -1)
+        for dx in (-fw // 2, fw // 2):
+            cv2.circle(f, (cx + dx, cy - fh // 4), max(2, fw // 8), (40, 40, 40), -1)
+        cv2.line(f, (cx, cy - fh // 8), (cx, cy + fh // 6), (90, 120, 170), 2)
+        open_ = env[min(i, len(env) - 1)]
+        cv2.ellipse(f, (cx, cy + fh // 2), (fw // 3, max(1, int(fh / 5 * open_))), 0, 0, 360, (40, 30, 90), -1)
+        frames.append(f)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    wr = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+    for f in frames:
+        wr.write(f)
+    wr.release()
+    return frames
+
+
+# ---------------- transcripts ----------------
+def _text(rng, n_words):
+    words = [WORDS[k] for k in rng.integers(0, len(WORDS), max(1, n_words))]
+    return " ".join(words).capitalize() + rng.choice([".", ".", "?", ","])
+
+def asr_segments(phrases, seed: int = 0):
+    """ASR-style segments, one per phrase; some text repeats, like real speech."""
+    rng = np.random.default_rng(seed)
+    return [{"start": s, "end": e, "text": _text(rng, n)} for s, e, n in phrases]
+
+def transcript(n_segments: int, seed: int = 0):
+    """n ASR-style segments of 2-14 words, back to back."""
+    rng = np.random.default_rng(seed)
+    phrases, t = [], 0.0
+    for _ in range(n_segments):
+        n = int(rng.integers(2, 15))
+        phrases.append((round(t, 3), round(t + 0.4 * n, 3), n))
+        t += 0.4 * n + rng.uniform(0.2, 0.8)
+    return asr_segments(phrases, seed)
+
+def translation_segments(segs, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    return [{"start": s["start"], "end": s["end"], "src": s["text"],
+             "tgt": _text(rng, int(len(s["text"].split()) * rng.uniform(0.8, 1.4)))} for s in segs]
+
+def write_json(path: Path, data):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+# ---------------- network / model stand-ins ----------------
+VOICES = [{"ShortName": "hi-IN-BenchNeural", "Locale": "hi-IN", "Gender": "Female"}]
+
+class StubEdge:
+    """
+    Stand-in for modules.tts_edge._edge_save: after `latency` seconds (the
+    network round trip) it writes synthetic speech whose length follows the
+    text and the requested rate, as Edge would.
+    """
+    def __init__(self, latency: float = 0.0, sec_per_char: float = 0.065, seed: int = 0):
+        self.latency, self.sec_per_char, self.seed, self.calls = latency, sec_per_char, seed, 0
+
+    async def __call__(self, text, voice, rate_pct, path):
+        import soundfile as sf
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        dur = max(0.2, len(text) * self.sec_per_char / (1 + rate_pct / 100))
+        y, _ = speech(dur + 0.2, sr=24000, seed=self.seed + self.calls)
+        sf.write(path, y, 24000, format="WAV")  # librosa sniffs the format, the .mp3 name is harmless
+
+
+class EdgeHTTPError(Exception):
+    """A rejected Edge request (edge_tts surfaces the server's answer as an aiohttp error with .status)."""
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(f"{status} {message}".strip())
+        self.status = status
+
+class FaultyEdge(StubEdge):
+    """
+    StubEdge that misbehaves like the real endpoint under load. Every call
+    waits `latency` s (+/- `jitter` of it); with probability `p_timeout` it
+    hangs `timeout` s and raises asyncio.TimeoutError, with probability
+    `p_429` it answers EdgeHTTPError(429). From outage[0] to outage[1] s
+    after the first call every call gets a 429. `log` has (t, outcome) per
+    call and `peak` the most calls in flight; with write=False nothing is
+    written (scheduler tests).
+    """
+    def __init__(self, latency: float = 0.05, jitter: float = 0.5, p_timeout: float = 0.0, p_429: float = 0.0,
+                 timeout: float = 0.2, outage=None, write: bool = True, seed: int = 0):
+        super().__init__(0.0, seed=seed)
+        self.latency, self.jitter, self.p_timeout, self.p_429 = latency, jitter, p_timeout, p_429
+        self.timeout, self.outage, self.write = timeout, outage, write
+        self.rng = np.random.default_rng(seed)
+        self.t0, self.log, self.in_flight, self.peak = None, [], 0, 0
+
+    async def __call__(self, text, voice, rate_pct, path):
+        now = time.monotonic()
+        self.t0 = now if self.t0 is None else self.t0
+        t, r = now - self.t0, self.rng.random()
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            if r < self.p_timeout:
+                await asyncio.sleep(self.timeout)
+                self.log.append((t, "timeout"))
+                raise asyncio.TimeoutError(f"stub: no answer in {self.timeout}s")
+            await asyncio.sleep(self.latency * self.rng.uniform(1 - self.jitter, 1 + self.jitter))
+            if (self.outage and self.outage[0] <= t < self.outage[1]) or r < self.p_timeout + self.p_429:
+                self.log.append((t, "429"))
+                raise EdgeHTTPError(429, "Too Many Requests")
+            self.log.append((t, "ok"))
+            if self.write:
+                await super().__call__(text, voice, rate_pct, path)
+        finally:
+            self.in_flight -= 1
+
+
+class WordTokenizer:
+    """Hashes whitespace words into a small vocabulary; enough of the HF tokenizer API for NLLBTranslator."""
+    pad_token_id, eos_token_id, unk_token_id = 1, 2, 3
+
+    def __init__(self, vocab: int = 4096, langs=("hin_Deva", "arb_Arab", "fra_Latn")):
+        self.vocab = vocab
+        self.lang_code_to_id = {c: vocab - 1 - i for i, c in enumerate(langs)}
+
+    def _ids(self, text, max_length):
+        ids = [4 + zlib.crc32(w.encode()) % (self.vocab - 100) for w in text.split()]
+        return (ids + [self.eos_token_id])[:max_length]
+
+    def __call__(self, texts, return_tensors=None, padding=False, truncation=False, max_length=512):
+        from transformers import BatchEncoding
+        ids = [self._ids(t, max_length) for t in texts]
+        if return_tensors != "pt":
+            return {"input_ids": ids}
+        import torch
+        n = max(len(x) for x in ids)
+        return BatchEncoding({
+            "input_ids": torch.tensor([x + [self.pad_token_id] * (n - len(x)) for x in ids]),
+            "attention_mask": torch.tensor([[1] * len(x) + [0] * (n - len(x)) for x in ids]),
+        })
+
+    def batch_decode(self, seqs, skip_special_tokens=True):
+        return [" ".join(f"w{int(t)}" for t in s if int(t) > 3) for s in seqs]
+
+def tiny_translator(seed: int = 0, d_model: int = 128, layers: int = 2):
+    """NLLBTranslator (torch backend) around a randomly initialized M2M100 of NLLB's architecture."""
+    import torch
+    from transformers import M2M100Config, M2M100ForConditionalGeneration
+    from modules.translate_nllb import NLLBTranslator
+    torch.manual_seed(seed)
+    tok = WordTokenizer()
+    cfg = M2M100Config(vocab_size=tok.vocab, d_model=d_model, encoder_layers=layers, decoder_layers=layers,
+                       encoder_attention_heads=4, decoder_attention_heads=4, encoder_ffn_dim=4 * d_model,
+                       decoder_ffn_dim=4 * d_model, max_position_embeddings=1024, pad_token_id=1,
+                       bos_token_id=0, eos_token_id=2, decoder_start_token_id=2)
+    tr = NLLBTranslator.__new__(NLLBTranslator)
+    tr.tok, tr.model = tok, M2M100ForConditionalGeneration(cfg).eval()
+    tr.backend, tr.device, tr.model_key, tr.degraded = "torch", "cpu", "bench-tiny-m2m100", set()
+    return tr
+
+def random_wav2lip(seed: int = 0):
+    import torch
+    from models import Wav2Lip  # Wav2Lip/ must be on sys.path (see bench_pipeline.py)
+    torch.manual_seed(seed)
+    return Wav2Lip().eval()
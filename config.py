@@ -1,4 +1,5 @@
 # config.py
+import os, tempfile
 from pathlib import Path
 
 # ---- Defaults (override via CLI flags in main.py) ----
@@ -25,6 +26,84 @@ EDGE_PREFERRED_VOICE = {
     "french": "fr-FR-DeniseNeural",
 }
 
+# faster-whisper presets. batch_size > 0 = BatchedInferencePipeline; cpu_threads 0 = library default.
+# "balanced" matches the original small/default-compute/beam-5 behaviour.
+ASR_PROFILES = {
+    "fast":     {"model_size": "base",   "compute_type": "int8",    "beam_size": 1, "batch_size": 8,
+                 "cpu_threads": 0, "num_workers": 1},
+    "balanced": {"model_size": "small",  "compute_type": "default", "beam_size": 5, "batch_size": 0,
+                 "cpu_threads": 0, "num_workers": 1},
+    "accurate": {"model_size": "medium", "compute_type": "float32", "beam_size": 5, "batch_size": 0,
+                 "cpu_threads": 0, "num_workers": 1},
+}
+ASR_PROFILE  = "balanced"
+ASR_LANGUAGE = "en"  # source language is pinned (NLLB translates from English); None = auto-detect
+
+# Parallel ASR (0 = single sequential faster-whisper call)
+ASR_WORKERS            = 0   # processes, each with its own int8 WhisperModel
+ASR_THREADS_PER_WORKER = 2
+
+# Edge TTS request scheduler (one per process, shared by every job/group)
+TTS_SCHEDULER = {
+    "rate_per_sec":      4.0,   # token bucket refill
+    "burst":             8,     # token bucket size
+    "min_concurrency":   1,     # adaptive limit floor (halved on errors)
+    "max_concurrency":   6,     # adaptive limit ceiling (grows on success)
+    "retries":           5,     # attempts per request, jittered exponential backoff
+    "backoff_base":      0.5,
+    "backoff_cap":       8.0,
+    "breaker_threshold": 5,     # consecutive failures before the circuit opens
+    "breaker_reset":     30.0,  # seconds before a half-open probe
+}
+
+# Edge voice catalog cache (list_voices() is only fetched when this is missing/stale)
+VOICE_CATALOG_PATH = Path("cache/edge_voices.json")
+VOICE_CATALOG_TTL  = 7 * 24 * 3600  # seconds; stale caches are refreshed in the background
+
+# NLLB backend / decoding (see modules/translate_nllb.py DECODE_PRESETS)
+NLLB_BACKEND        = "torch"   # "torch" (fp32), "int8" (dynamic quantized), "ct2" (CTranslate2)
+NLLB_CT2_DIR        = Path("models/nllb-200-distilled-600M-ct2")
+NLLB_DECODE         = "beam4"   # "beam4" | "beam2" | "greedy"
+NLLB_LATENCY_BUDGET = None      # seconds per translation job; past it, decode greedily
+
+# Translation memory (SQLite): reuses translations across segments and jobs
+TM_PATH = Path("cache/translation_memory.sqlite")
+
+# ASR transcript cache: keyed by a hash of the decoded 16k PCM + ASR parameters
+ASR_CACHE_DIR = Path("cache/asr")
+
+# Stage cache: per-stage records of input/param keys → output digests (replaces manual --skip_* use)
+STAGE_CACHE_DIR = Path("cache/stages")
+
+# Shared model registry (Whisper / NLLB / Wav2Lip kept warm within a process)
+MODEL_RAM_BUDGET_MB = 8192  # least recently used models are dropped above this; None = unlimited
+
+# Pipeline task graph: resources shared by concurrently running stages (see modules/dag.py)
+PIPELINE_RESOURCES = {
+    "cpu":    os.cpu_count() or 4,   # threads
+    "net":    2,                     # concurrent network-bound stages (download, Edge TTS)
+    "mem_mb": MODEL_RAM_BUDGET_MB or 8192,
+    "nllb":    1,                    # one translation at a time on the shared NLLB model/tokenizer
+    "wav2lip": 1,                    # in-process inference.py keeps its options in module globals
+}
+# CPU thread budget (modules/threads.py): running stages split these cores instead of every library
+# starting one thread per core. Processes using the same ledger (server/cluster workers, separate
+# runs) split them together; keep it on local disk, since a ledger is per machine.
+THREAD_CORES  = os.cpu_count() or 4
+THREAD_LEDGER = Path(tempfile.gettempdir()) / "dubbing_threads.json"  # None: this process's stages only
+BATCH_MAX_WORKERS = 8  # `main.py batch`: concurrently running tasks across all jobs
+
+# Local job server (`main.py serve`): SQLite queue + worker processes that keep models loaded
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_WORKERS = 2
+SERVER_DB = Path("cache/jobs.sqlite")
+SERVER_SLOTS = {"asr": 1, "nllb": 1, "tts": 2, "wav2lip": 1}  # jobs inside a stage of each class, across workers
+
+# Multi-node queue (`main.py cluster`): a directory on a filesystem every node mounts
+CLUSTER_QUEUE_DIR = Path("cache/cluster")
+CLUSTER_LEASE_TTL = 120.0  # seconds without a heartbeat before another node takes a task over
+
 # Wav2Lip checkpoint path (put correct files here)
 W2L_CKPT = "Wav2Lip/checkpoints/wav2lip.pth"  # or "Wav2Lip/checkpoints/wav2lip_gan.pth"
 
@@ -36,10 +115,16 @@ DIRS = {
     "translations":Path("translations"),
     "tts":         Path("tts_outputs"),
     "outputs":     Path("outputs"),
+    "cache":       Path("cache"),
 }
 
-for d in DIRS.values():
-    d.mkdir(parents=True, exist_ok=True)
+def ensure_dirs():
+    """Create the output folders (main.add_job does, before a job's first task); not done on import."""
+    for d in DIRS.values():
+        d.mkdir(parents=True, exist_ok=True)
+
+# Keep the decoded 16k audio in a memory-mapped float32 wav under cache/ (paged out, shared with ASR workers)
+PCM_MMAP = False
 
 # Audio sample rates
 ASR_SR   = 16000  # extract video audio to 16k for whisper
@@ -50,3 +135,7 @@ EDGE_SR  = 24000  # Edge TTS native synth rate; we resample to W2L_SR
 W2L_PADS          = (0, 12, 0, 0)
 W2L_RESIZE_FACTOR = 1
 W2L_FORCE_FPS     = 24
+W2L_IN_PROCESS    = False  # True: run inference.py in-process with a registry-cached model
+W2L_SHARDS        = 1      # >1: render frame-range segments as separate tasks, then join them
+W2L_SEGMENT_BATCHES = 8    # close a resumable H.264 segment every N batches (0: one temp file, no resume)
+W2L_FACE_CACHE    = True   # detect faces in the background as soon as the video is available
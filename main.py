@@ -4,25 +4,50 @@ python main.py --video_file "/path/to/myclip.mp4" --basename myclip --lang hindi
 
 TO RUN THIS SCRIPT ON A YOUTUBE VIDEO:
 python main.py --yt_url "https://www.youtube.com/watch?v=ERNWm9aiZQw" --basename monologue_clip --lang hindi
+
+TO RUN A BATCH (many videos x languages, one process, resumable):
+python main.py batch --manifest jobs.yaml
+
+TO RUN THE LOCAL JOB SERVER (HTTP on localhost, warm worker processes):
+python main.py serve --workers 2
+
+TO SPREAD JOBS OVER SEVERAL NODES (queue directory on a shared filesystem):
+python main.py cluster submit --queue /mnt/share/queue --manifest jobs.yaml
+python main.py cluster work --queue /mnt/share/queue --slots 2     # on every node
+python main.py cluster status --queue /mnt/share/queue --watch 5
+
+TO SUMMARIZE RUN REPORTS (written next to every output as *.report.json):
+python main.py report outputs/*.report.json
  
 """
 
 # main.py
-import argparse
+import argparse, asyncio, json, os, threading, time
 from pathlib import Path
 from config import (
     DEFAULT_YT_URL, DEFAULT_BASENAME, DIRS, LANG_NAME_TO_CODE,
-    EDGE_LOCALE_PREFIX, EDGE_PREFERRED_VOICE,
-    ASR_SR, W2L_SR, EDGE_SR, W2L_CKPT, W2L_PADS, W2L_RESIZE_FACTOR, W2L_FORCE_FPS
+    EDGE_LOCALE_PREFIX, EDGE_PREFERRED_VOICE, TTS_SCHEDULER,
+    VOICE_CATALOG_PATH, VOICE_CATALOG_TTL, TM_PATH,
+    NLLB_BACKEND, NLLB_CT2_DIR, NLLB_DECODE, NLLB_LATENCY_BUDGET, MODEL_RAM_BUDGET_MB,
+    ASR_WORKERS, ASR_THREADS_PER_WORKER, ASR_CACHE_DIR, ASR_PROFILES, ASR_PROFILE, ASR_LANGUAGE,
+    PCM_MMAP, STAGE_CACHE_DIR, PIPELINE_RESOURCES, BATCH_MAX_WORKERS, W2L_FACE_CACHE,
+    SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_DB, SERVER_SLOTS, CLUSTER_QUEUE_DIR, CLUSTER_LEASE_TTL,
+    ASR_SR, W2L_SR, EDGE_SR, W2L_CKPT, W2L_PADS, W2L_RESIZE_FACTOR, W2L_FORCE_FPS, W2L_IN_PROCESS, W2L_SHARDS,
+    W2L_SEGMENT_BATCHES, THREAD_CORES, THREAD_LEDGER,
+    ensure_dirs
 )
-from modules.downloader import download_youtube
-from modules.media import extract_audio_ffmpeg, probe_video_info
-from modules.asr_whisper import transcribe_faster_whisper
-from modules.translate_nllb import translate_segments
-from modules.tts_edge import build_dubbed_timeline
-from modules.wav2lip_runner import run_wav2lip
-
-def parse_args():
+# stage modules (and through them numpy, librosa, torch, ...) are imported in add_job,
+# so --help, subcommand dispatch and the server/cluster front ends start quickly
+from modules.tts_scheduler import configure_scheduler
+from modules.model_registry import configure_registry
+from modules.threads import configure_threads
+from modules.stage_cache import StageCache
+from modules.dag import DAGExecutor
+from modules.metrics import RunReport, aggregate, print_aggregate, print_summary
+
+STAGES = ["download", "extract_audio", "asr", "translate", "tts", "stream", "wav2lip"]
+
+def parse_args(argv=None):
     ap = argparse.ArgumentParser(
         description="End-to-end: download/choose video → ASR → translate → TTS → Wav2Lip"
     )
@@ -30,96 +55,680 @@ def parse_args():
     ap.add_argument("--video_file", default="", help="Path to a local MP4. If set, skips YouTube download.")
     ap.add_argument("--basename", default=DEFAULT_BASENAME, help="Base name for generated files")
     ap.add_argument("--lang", default="hindi", choices=list(LANG_NAME_TO_CODE.keys()))
+    # Stages rerun only when their inputs/params changed (see modules/stage_cache.py);
+    # the --skip_* flags force-skip a stage and reuse whatever file is on disk.
+    ap.add_argument("--rerun", nargs="+", default=[], choices=STAGES + ["all"],
+                    help="Run these stages even if the stage cache says they are up to date")
+    ap.add_argument("--no_stage_cache", action="store_true", help="Run every (non-skipped) stage unconditionally")
     ap.add_argument("--skip_download", action="store_true")
     ap.add_argument("--skip_asr", action="store_true")
     ap.add_argument("--skip_translate", action="store_true")
     ap.add_argument("--skip_tts", action="store_true")
     ap.add_argument("--skip_wav2lip", action="store_true")
+    ap.add_argument("--asr_workers", type=int, default=ASR_WORKERS,
+                    help="Transcribe VAD chunks in this many processes (0 = sequential)")
+    ap.add_argument("--asr_profile", default=ASR_PROFILE, choices=list(ASR_PROFILES),
+                    help="faster-whisper preset; the --asr_* flags below override single fields")
+    ap.add_argument("--asr_model", default=None, help="Whisper model size (tiny/base/small/medium/...)")
+    ap.add_argument("--asr_compute", default=None, help="CTranslate2 compute type (int8, int8_float32, float32, ...)")
+    ap.add_argument("--asr_beam", type=int, default=None, help="Beam size (1 = greedy)")
+    ap.add_argument("--asr_batch", type=int, default=None, help="Batched inference batch size (0 = off)")
+    ap.add_argument("--asr_threads", type=int, default=None, help="CPU threads per Whisper model (0 = library default)")
+    ap.add_argument("--asr_language", default=ASR_LANGUAGE, help="Source language code; empty = auto-detect")
+    ap.add_argument("--no_asr_cache", action="store_true", help="Always run Whisper, ignoring cached transcripts")
+    ap.add_argument("--nllb_backend", default=NLLB_BACKEND, choices=["torch", "int8", "ct2"],
+                    help="Translation backend: fp32 torch, dynamic-int8 torch or CTranslate2")
+    ap.add_argument("--nllb_decode", default=NLLB_DECODE, choices=["beam4", "beam2", "greedy"])
+    ap.add_argument("--nllb_budget", type=float, default=NLLB_LATENCY_BUDGET,
+                    help="Translation latency budget in seconds (falls back to greedy decoding)")
+    ap.add_argument("--no_tm", action="store_true", help="Do not read/write the translation memory")
+    ap.add_argument("--stream", action="store_true",
+                    help="Overlap ASR → translate → TTS per segment instead of running them stage by stage")
+    ap.add_argument("--full_redub", action="store_true", help="Re-synthesize every TTS group even if a timeline manifest exists")
+    ap.add_argument("--tts_offline", action="store_true", help="Resolve TTS voices from the cached catalog only")
     ap.add_argument("--w2l_ckpt", default=W2L_CKPT, help="Path to wav2lip(.pth) or wav2lip_gan(.pth)")
-    return ap.parse_args()
+    ap.add_argument("--w2l_in_process", action="store_true", default=W2L_IN_PROCESS,
+                    help="Run Wav2Lip in this process with a cached model instead of a subprocess")
+    ap.add_argument("--w2l_shards", type=int, default=W2L_SHARDS,
+                    help="Render Wav2Lip as N frame-range segments (separate tasks, e.g. on several nodes)")
+    ap.add_argument("--w2l_segment_batches", type=int, default=W2L_SEGMENT_BATCHES,
+                    help="Checkpoint the render every N batches so a crashed render resumes (0: off)")
+    return ap.parse_args(argv)
 
-def main():
-    args = parse_args()
+def job_basename(args) -> str:
+    # If user left default basename with a local file, derive it from the file name for cleanliness
+    if args.video_file and (not args.basename or args.basename == DEFAULT_BASENAME):
+        return Path(args.video_file).stem
+    return args.basename
+
+def cache_force(args) -> set:
+    """Stages the stage cache must rerun: --rerun, plus tts with --full_redub (it changes no input)."""
+    return set(args.rerun) | ({"tts"} if args.full_redub else set())
+
+def add_job(dag: DAGExecutor, args, cache: StageCache, langs, prefix: str = "", on_done=None,
+            metrics: RunReport | None = None) -> dict:
+    """
+    Add one video's tasks to `dag`: download/extract/ASR/face detection once,
+    translation once for all of `langs` (per language with a single one or
+    --stream), then TTS → Wav2Lip per language.
+    Returns {lang: {"output": Path, "final": task name, "tasks": [task names]}}.
+    on_done(lang, output) is called when a language's last stage succeeds.
+    With `metrics`, every task is recorded as a stage of that report.
+    """
+    from modules.downloader import download_youtube
+    from modules.media import extract_audio_pcm, probe_video_info, probe_audio_frames
+    from modules.asr_whisper import transcribe_faster_whisper, transcribe_faster_whisper_parallel, asr_settings
+    from modules.asr_cache import cached_transcribe
+    from modules.translate_nllb import translate_segments, translate_segments_multi, model_key, resolve_backend
+    from modules.tts_edge import build_dubbed_timeline, pick_edge_voice
+    from modules.streaming import stream_dub
+    from modules.voice_catalog import load_voice_catalog
+    from modules.wav2lip_runner import run_wav2lip, detect_faces, concat_segments
+    ensure_dirs()
+    ncpu = PIPELINE_RESOURCES["cpu"]
+    name = lambda stage, lang=None: f"{prefix}{stage}" + (f":{lang}" if lang else "")
+    add = lambda *a, **kw: dag.add(*a, metrics=metrics, **kw)
 
     # -------- pick video source --------
     # If --video_file is provided, use it and skip download.
-    # Else, use YouTube flow (unless --skip_download).
-    basename = args.basename
+    # Else, use YouTube flow (skipped while the downloaded file is still the one recorded for the URL).
+    basename = job_basename(args)
     if args.video_file:
         video_mp4 = Path(args.video_file).expanduser().resolve()
         if not video_mp4.exists():
             raise FileNotFoundError(f"Local video not found: {video_mp4}")
-        # If user left default basename, derive from file name for cleanliness
-        if not basename or basename == DEFAULT_BASENAME:
-            basename = video_mp4.stem
-        print(f"✅ Using local video: {video_mp4}")
     else:
         video_mp4 = DIRS["downloads"] / f"{basename}.mp4"
-        if not args.skip_download:
+
+    def _video():
+        if not args.video_file and not args.skip_download:
             if not args.yt_url:
                 print("⚠️ No --yt_url given; expecting the video to already exist at:", video_mp4)
             else:
-                video_mp4 = download_youtube(args.yt_url, DIRS["downloads"], basename)
+                cache.run("download", {"url": args.yt_url}, {}, {"video": video_mp4},
+                          lambda: download_youtube(args.yt_url, DIRS["downloads"], basename))
         if not video_mp4.exists():
             raise FileNotFoundError(video_mp4)
-        print(f"✅ Downloaded/selected video: {video_mp4}")
+        print(f"✅ Using video: {video_mp4}")
+    # a network slot only when something is downloaded; local files must not queue behind downloads
+    add(name("video"), _video, net=1 if args.yt_url and not (args.video_file or args.skip_download) else 0)
 
     # -------- extract audio (16k mono) --------
+    # decoded once; the samples (with their rate) are reused by ASR and the timeline
     audio_wav = DIRS["audio"] / f"{basename}_audio.wav"
-    if not args.skip_asr:
-        audio_wav = extract_audio_ffmpeg(video_mp4, DIRS["audio"], sr=ASR_SR)
-    if not audio_wav.exists():
-        raise FileNotFoundError(audio_wav)
-    print(f"✅ Extracted audio: {audio_wav}")
+    audio = audio_wav
+    def _extract():
+        def _decode():
+            nonlocal audio
+            audio = extract_audio_pcm(video_mp4, DIRS["audio"], sr=ASR_SR,
+                                      mmap_path=DIRS["cache"] / f"{basename}_pcm_f32.wav" if PCM_MMAP else None)
+        if not args.skip_asr:
+            cache.run("extract_audio", {"video": video_mp4}, {"sr": ASR_SR}, {"audio": audio_wav}, _decode)
+        if not audio_wav.exists():
+            raise FileNotFoundError(audio_wav)
+        if metrics is not None:
+            metrics.media_sec = probe_audio_frames(audio_wav, ASR_SR) / ASR_SR
+        print(f"✅ Extracted audio: {audio_wav}")
+    add(name("extract_audio"), _extract, [name("video")], cpu=1)
 
-    # -------- ASR --------
     asr_json = DIRS["transcripts"] / f"{basename}_asr.json"
-    if not args.skip_asr:
-        # Use small/cpu for portability; change if you want GPU
-        transcribe_faster_whisper(audio_wav, asr_json, model_size="small", device="cpu")
-    if not asr_json.exists():
-        raise FileNotFoundError(asr_json)
-    print(f"✅ ASR saved: {asr_json}")
-
-    # -------- Translate (NLLB) --------
-    tgt_code = LANG_NAME_TO_CODE[args.lang]
-    trans_json = DIRS["translations"] / f"{basename}_en_to_{args.lang}.json"
-    if not args.skip_translate:
-        translate_segments(asr_json, tgt_code, trans_json)
-    if not trans_json.exists():
-        raise FileNotFoundError(trans_json)
-    print(f"✅ Translation saved: {trans_json}")
-
-    # -------- TTS (Edge), grouped, elastic timeline → 16k wav --------
-    locale = EDGE_LOCALE_PREFIX[args.lang]
-    preferred = EDGE_PREFERRED_VOICE.get(args.lang)
-    dub_wav = DIRS["tts"] / f"{basename}_{args.lang}_dub_16k.wav"
-    if not args.skip_tts:
-        import asyncio
-        asyncio.run(build_dubbed_timeline(
-            asr_json=asr_json, trans_json=trans_json,
-            orig_audio_wav=audio_wav, out_wav=dub_wav,
-            locale_prefix=locale, preferred_voice=preferred,
-            sr_synth=EDGE_SR, sr_out=W2L_SR
-        ))
-    if not dub_wav.exists():
-        raise FileNotFoundError(dub_wav)
-    print(f"✅ TTS dubbed wav: {dub_wav}")
-
-    # -------- Wav2Lip inference --------
-    out_mp4 = DIRS["outputs"] / f"{basename}__{args.lang}_wav2lip.mp4"
-    if not args.skip_wav2lip:
-        info = probe_video_info(video_mp4)
-        fps = int(round(info["fps"])) if info and "fps" in info else W2L_FORCE_FPS
-        run_wav2lip(
-            video_in=video_mp4, audio_in=dub_wav,
-            checkpoint_path=Path(args.w2l_ckpt),
-            outfile=out_mp4, fps=fps,
-            pads=W2L_PADS, resize_factor=W2L_RESIZE_FACTOR,
-            box=None  # let detector run; pass a box=(y1,y2,x1,x2) if you want fixed crop
-        )
+    asr = asr_settings(ASR_PROFILES[args.asr_profile], model_size=args.asr_model,
+                       compute_type=args.asr_compute, beam_size=args.asr_beam,
+                       batch_size=args.asr_batch, cpu_threads=args.asr_threads)
+    asr["language"] = args.asr_language or None
+    # cpu for portability; change device if you want GPU
+    asr_params = {k: asr[k] for k in ("model_size", "compute_type", "beam_size", "language")}
+    if args.asr_workers > 0:
+        # one model per worker process: int8 unless --asr_compute says otherwise
+        asr_params.update(vad_filter=True, mode="chunked", compute_type=args.asr_compute or "int8")
+    else:
+        asr_params.update(vad_filter=True, mode="whole", batch_size=asr["batch_size"])
+    asr_cpu = args.asr_workers * ASR_THREADS_PER_WORKER if args.asr_workers > 0 else (asr["cpu_threads"] or 4)
+    nllb_model = model_key(resolve_backend(args.nllb_backend, NLLB_CT2_DIR))
+    streamed = args.stream and not (args.skip_asr or args.skip_translate or args.skip_tts)
+    if streamed and len(langs) > 1:
+        # each stream runs its own Whisper pass and writes the shared transcript: stage by stage instead
+        print(f"[stream] {basename}: {len(langs)} target languages, running ASR once in staged mode instead")
+        streamed = False
+    tr_params = lambda lang: {"tgt_code": LANG_NAME_TO_CODE[lang], "model": nllb_model,
+                              "decode": args.nllb_decode, "budget": args.nllb_budget}
+    trans_jsons = {lang: DIRS["translations"] / f"{basename}_en_to_{lang}.json" for lang in langs}
+    # several languages: one task translates all of them, sharing each encoder pass
+    multi = not streamed and not args.skip_translate and len(langs) > 1
+
+    # -------- face detection for Wav2Lip: needs only the video, so it overlaps ASR → TTS --------
+    face_cache = DIRS["cache"] / f"{basename}_faces.json" if W2L_FACE_CACHE and not args.skip_wav2lip else None
+    if face_cache is not None:
+        add(name("faces"), lambda: detect_faces(video_mp4, face_cache, resize_factor=W2L_RESIZE_FACTOR),
+                [name("video")], cpu=max(1, ncpu // 2), mem_mb=1500)
+
+    # -------- ASR (once per video) --------
+    if not streamed:
+        def _asr():
+            if not args.skip_asr:
+                if args.asr_workers > 0:
+                    run_asr = lambda a, o: transcribe_faster_whisper_parallel(
+                        a, o, model_size=asr["model_size"], workers=args.asr_workers,
+                        threads_per_worker=ASR_THREADS_PER_WORKER, compute_type=asr_params["compute_type"],
+                        language=asr["language"], beam_size=asr["beam_size"])
+                else:
+                    run_asr = lambda a, o: transcribe_faster_whisper(a, o, device="cpu", **asr)
+                def _transcribe():
+                    if args.no_asr_cache:
+                        run_asr(audio, asr_json)
+                    else:
+                        cached_transcribe(audio, asr_json, asr_params, run_asr, ASR_CACHE_DIR)
+                cache.run("asr", {"audio": audio_wav}, asr_params, {"asr": asr_json}, _transcribe)
+            if not asr_json.exists():
+                raise FileNotFoundError(asr_json)
+            print(f"✅ ASR saved: {asr_json}")
+        add(name("asr"), _asr, [name("extract_audio")], cpu=asr_cpu, mem_mb=1500)
+
+    if multi:
+        def _translate_multi():
+            # per-language cache entries as in single-language runs; only the stale ones are translated
+            todo = [l for l in langs if not cache.up_to_date("translate", {"asr": asr_json}, tr_params(l),
+                                                             {"translation": trans_jsons[l]}, keep_edited=True)]
+            if todo:
+                translate_segments_multi(
+                    asr_json, [LANG_NAME_TO_CODE[l] for l in todo], DIRS["translations"],
+                    tm_path=None if args.no_tm else TM_PATH, names={LANG_NAME_TO_CODE[l]: l for l in todo},
+                    backend=args.nllb_backend, ct2_dir=NLLB_CT2_DIR,
+                    decode=args.nllb_decode, budget_sec=args.nllb_budget
+                )
+            for l in langs:
+                cache.run("translate", {"asr": asr_json}, tr_params(l), {"translation": trans_jsons[l]},
+                          lambda: None, keep_edited=True)  # written above: records the outputs of the languages just translated
+                print(f"✅ Translation saved: {trans_jsons[l]}")
+        add(name("translate"), _translate_multi, [name("asr")], cpu=4, nllb=1, mem_mb=3000)
+
+    jobs = {}
+    def _add_lang(lang):
+        tgt_code = LANG_NAME_TO_CODE[lang]
+        trans_json = trans_jsons[lang]
+        locale = EDGE_LOCALE_PREFIX[lang]
+        preferred = EDGE_PREFERRED_VOICE.get(lang)
+        dub_wav = DIRS["tts"] / f"{basename}_{lang}_dub_16k.wav"
+        out_mp4 = DIRS["outputs"] / f"{basename}__{lang}_wav2lip.mp4"
+        tts_params = {"locale": locale, "preferred": preferred, "sr_synth": EDGE_SR, "sr_out": W2L_SR}
+        tasks = []
+        async def _voice():
+            # the dub depends on the voice actually picked, which a catalog refresh can change
+            catalog = await load_voice_catalog(VOICE_CATALOG_PATH, VOICE_CATALOG_TTL, offline=args.tts_offline)
+            return catalog, await pick_edge_voice(locale, preferred, catalog)
+
+        if streamed:
+            # -------- streaming ASR → translate → TTS (replaces the three stages below) --------
+            async def _stream(catalog, voice):
+                await stream_dub(
+                    audio, asr_json, trans_json, dub_wav, tgt_code,
+                    locale_prefix=locale, preferred_voice=voice, model_size=asr["model_size"],
+                    device="cpu", compute_type=asr["compute_type"],
+                    asr_kwargs={"beam_size": asr["beam_size"], "language": asr["language"]},
+                    tm_path=None if args.no_tm else TM_PATH, backend=args.nllb_backend,
+                    ct2_dir=NLLB_CT2_DIR, decode=args.nllb_decode,
+                    sr_synth=EDGE_SR, sr_out=W2L_SR, catalog=catalog
+                )
+            def _streamed():
+                catalog, voice = asyncio.run(_voice())
+                cache.run(
+                    "stream", {"audio": audio_wav},
+                    {"asr": asr_params | {"mode": "stream"}, "translate": tr_params(lang),
+                     "tts": tts_params | {"voice": voice}},
+                    {"asr": asr_json, "translation": trans_json, "dub": dub_wav},
+                    lambda: asyncio.run(_stream(catalog, voice))
+                )
+            tts_task = add(name("stream", lang), _streamed, [name("extract_audio")],
+                           cpu=asr_cpu + 2, net=1, nllb=1, mem_mb=4000)
+            tasks.append(tts_task)
+        elif not multi:
+            # -------- Translate (NLLB) --------
+            def _translate():
+                if not args.skip_translate:
+                    cache.run("translate", {"asr": asr_json}, tr_params(lang), {"translation": trans_json},
+                              lambda: translate_segments(
+                                  asr_json, tgt_code, trans_json, tm_path=None if args.no_tm else TM_PATH,
+                                  backend=args.nllb_backend, ct2_dir=NLLB_CT2_DIR,
+                                  decode=args.nllb_decode, budget_sec=args.nllb_budget
+                              ), keep_edited=True)  # a translation edited by hand is kept, not regenerated
+                if not trans_json.exists():
+                    raise FileNotFoundError(trans_json)
+                print(f"✅ Translation saved: {trans_json}")
+            tasks.append(add(name("translate", lang), _translate, [name("asr")], cpu=4, nllb=1, mem_mb=3000))
+
+        if not streamed:
+            # -------- TTS (Edge), grouped, elastic timeline → 16k wav --------
+            def _tts():
+                if not args.skip_tts:
+                    catalog, voice = asyncio.run(_voice())
+                    async def _synth():
+                        await build_dubbed_timeline(
+                            asr_json=asr_json, trans_json=trans_json,
+                            orig_audio_wav=audio, out_wav=dub_wav,
+                            locale_prefix=locale, preferred_voice=voice,
+                            sr_synth=EDGE_SR, sr_out=W2L_SR, catalog=catalog,
+                            incremental=not args.full_redub
+                        )
+                    cache.run("tts", {"asr": asr_json, "translation": trans_json, "audio": audio_wav},
+                              tts_params | {"voice": voice}, {"dub": dub_wav}, lambda: asyncio.run(_synth()))
+                if not dub_wav.exists():
+                    raise FileNotFoundError(dub_wav)
+                print(f"✅ TTS dubbed wav: {dub_wav}")
+            tts_task = add(name("tts", lang), _tts, [name("translate", None if multi else lang), name("extract_audio")],
+                           cpu=1, net=1)
+            tasks.append(tts_task)
+
+        # -------- Wav2Lip inference (optionally as frame-range shards joined without re-encoding) --------
+        w2l_inputs = {"video": video_mp4, "dub": dub_wav, "checkpoint": Path(args.w2l_ckpt)}
+        def _w2l_params():
+            info = probe_video_info(video_mp4)
+            fps = int(round(info["fps"])) if info and "fps" in info else W2L_FORCE_FPS
+            return {"fps": fps, "pads": W2L_PADS, "resize_factor": W2L_RESIZE_FACTOR, "box": None}
+        w2l_dir = DIRS["cache"] / f"{basename}_{lang}_w2l"
+        def _render(outfile, params, shard=None):
+            # stable per render (not per process) so a rerun finds the segments a crashed one completed
+            resume = None if args.w2l_segment_batches <= 0 else \
+                w2l_dir / ("resume" if shard is None else f"resume_{shard[0]:03d}_of_{shard[1]:03d}")
+            return lambda: run_wav2lip(
+                video_in=video_mp4, audio_in=dub_wav,
+                checkpoint_path=w2l_inputs["checkpoint"],
+                outfile=outfile, fps=params["fps"],
+                pads=W2L_PADS, resize_factor=W2L_RESIZE_FACTOR,
+                box=None,  # let detector run; pass a box=(y1,y2,x1,x2) if you want fixed crop
+                in_process=args.w2l_in_process,
+                face_cache=face_cache, shard=shard,
+                resume_dir=resume, segment_batches=args.w2l_segment_batches
+            )
+        n_shards = max(1, args.w2l_shards)
+        segments = [w2l_dir / f"seg_{k:03d}_of_{n_shards:03d}.mp4"
+                    for k in range(n_shards)]
+        def _wav2lip():
+            params = _w2l_params()
+            if n_shards == 1:
+                cache.run("wav2lip", w2l_inputs, params, {"video": out_mp4}, _render(out_mp4, params))
+            else:
+                cache.run("wav2lip", {"dub": dub_wav, **{f"seg{k}": p for k, p in enumerate(segments)}},
+                          {"shards": n_shards}, {"video": out_mp4},
+                          lambda: concat_segments(segments, dub_wav, out_mp4))
+        def _shard(k):
+            def _run():
+                params = _w2l_params()
+                cache.run("wav2lip_shard", w2l_inputs, params | {"shard": [k, n_shards]}, {"video": segments[k]},
+                          _render(segments[k], params, shard=(k, n_shards)))
+            return _run
+        if not args.skip_wav2lip:
+            w2l_deps = [tts_task] + ([name("faces")] if face_cache is not None else [])
+            if n_shards > 1:
+                for k in range(n_shards):
+                    tasks.append(add(f"{name('wav2lip', lang)}#{k}", _shard(k), w2l_deps,
+                                         cpu=ncpu, wav2lip=1, mem_mb=3000))
+                w2l_deps = tasks[-n_shards:]
+            join = {"cpu": 1} if n_shards > 1 else {"cpu": ncpu, "wav2lip": 1, "mem_mb": 3000}
+            tasks.append(add(name("wav2lip", lang), _wav2lip, w2l_deps, **join))
+        output = dub_wav if args.skip_wav2lip else out_mp4
+
+        if on_done is not None:
+            final = dag.tasks[tasks[-1]]
+            run_final = final.fn
+            def _final():
+                result = run_final()
+                on_done(lang, output)
+                return result
+            final.fn = _final
+
+        shared = [name("video"), name("extract_audio")] + ([] if streamed else [name("asr")]) \
+            + ([name("translate")] if multi else []) \
+            + ([name("faces")] if face_cache is not None and not args.skip_wav2lip else [])
+        jobs[lang] = {"output": output, "final": tasks[-1], "tasks": shared + tasks}
+
+    for lang in langs:
+        _add_lang(lang)
+    return jobs
+
+def main():
+    import sys
+    if sys.argv[1:2] == ["batch"]:
+        return run_batch(sys.argv[2:])
+    if sys.argv[1:2] == ["serve"]:
+        return run_server(sys.argv[2:])
+    if sys.argv[1:2] == ["cluster"]:
+        return run_cluster(sys.argv[2:])
+    if sys.argv[1:2] == ["report"]:
+        return run_report(sys.argv[2:])
+    args = parse_args()
+    registry = configure_registry(MODEL_RAM_BUDGET_MB)
+    configure_scheduler(**TTS_SCHEDULER)
+    configure_threads(THREAD_CORES, THREAD_LEDGER)
+
+    cache = StageCache(STAGE_CACHE_DIR, force=cache_force(args), enabled=not args.no_stage_cache)
+    dag = DAGExecutor(PIPELINE_RESOURCES)
+    basename = job_basename(args)
+    rep = RunReport(f"{basename}:{args.lang}")
+    rep.meta = {"lang": args.lang, "asr_profile": args.asr_profile, "nllb_backend": args.nllb_backend,
+                "w2l_shards": args.w2l_shards, "stream": args.stream}
+    jobs = add_job(dag, args, cache, [args.lang], metrics=rep)
+    try:
+        dag.run()
+    finally:
+        report_json = rep.write(DIRS["outputs"] / f"{basename}__{args.lang}.report.json")
+    dag.report()
+    registry.report()
+    rep.summary()
+    print(f"[metrics] report: {report_json}")
+    out_mp4 = jobs[args.lang]["output"]
     if out_mp4.exists():
         print("✅ FINAL:", out_mp4.resolve())
 
+# ---------------- batch mode: many videos × languages in one process ----------------
+def load_manifest(path: Path) -> dict:
+    """
+    jobs.yaml / jobs.json:
+        defaults: {asr_profile: fast, w2l_in_process: true, ...}   # any main.py option
+        jobs:
+          - {video_file: a.mp4, langs: [hindi, arabic]}
+          - {yt_url: "https://...", basename: clip_b, langs: [french]}
+    """
+    text = Path(path).read_text(encoding="utf-8")
+    if Path(path).suffix.lower() in (".yaml", ".yml"):
+        import yaml
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+    if not isinstance(data, dict) or not isinstance(data.get("jobs"), list):
+        raise ValueError(f"{path}: manifest needs a 'jobs' list")
+    return data
+
+def job_args(defaults: dict, spec: dict):
+    """Namespace for one manifest entry: main.py's defaults ← manifest defaults ← entry."""
+    args = parse_args([])
+    for k, v in {**defaults, **spec}.items():
+        if k in ("langs", "lang"): continue
+        if not hasattr(args, k):
+            raise ValueError(f"unknown option '{k}' in manifest")
+        setattr(args, k, v)
+    langs = spec.get("langs") or [spec.get("lang", defaults.get("lang", args.lang))]
+    unknown = [l for l in langs if l not in LANG_NAME_TO_CODE]
+    if unknown:
+        raise ValueError(f"unknown language(s) {unknown}; expected {list(LANG_NAME_TO_CODE)}")
+    return args, langs
+
+def _save_state(path: Path, state: dict):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(state, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+def run_batch(argv=None):
+    ap = argparse.ArgumentParser(
+        prog="main.py batch",
+        description="Dub many videos into many languages in one process with shared, warm models"
+    )
+    ap.add_argument("--manifest", required=True, help="jobs.yaml / jobs.json (see load_manifest)")
+    ap.add_argument("--max_workers", type=int, default=BATCH_MAX_WORKERS,
+                    help="Concurrently running tasks; PIPELINE_RESOURCES still caps cpu/net/memory")
+    ap.add_argument("--restart", action="store_true", help="Ignore the state file and revisit every job")
+    b = ap.parse_args(argv)
+
+    manifest_path = Path(b.manifest)
+    manifest = load_manifest(manifest_path)
+    defaults = manifest.get("defaults") or {}
+    state_path = manifest_path.with_name(manifest_path.stem + ".state.json")
+    state = {}
+    if state_path.exists() and not b.restart:
+        state = json.loads(state_path.read_text(encoding="utf-8"))
+    lock = threading.Lock()
+
+    registry = configure_registry(MODEL_RAM_BUDGET_MB)
+    configure_scheduler(**TTS_SCHEDULER)
+    configure_threads(THREAD_CORES, THREAD_LEDGER)
+    base_args, _ = job_args(defaults, {})
+    cache = StageCache(STAGE_CACHE_DIR, force=cache_force(base_args), enabled=not base_args.no_stage_cache)
+    dag = DAGExecutor(PIPELINE_RESOURCES, max_workers=b.max_workers, fail_fast=False)
+
+    def _record(job_id, **entry):
+        with lock:
+            state[job_id] = entry
+            _save_state(state_path, state)
+
+    jobs = {}  # job_id -> add_job entry (or None when done in an earlier run)
+    reports = {}  # basename -> RunReport (one per video, all of its languages)
+    for spec in manifest["jobs"]:
+        args, langs = job_args(defaults, spec)
+        basename = job_basename(args)
+        todo = []
+        for lang in langs:
+            job_id = f"{basename}:{lang}"
+            prev = state.get(job_id, {})
+            if prev.get("status") == "done" and Path(prev.get("output", "")).exists():
+                jobs[job_id] = None
+            else:
+                todo.append(lang)
+        if not todo: continue
+        on_done = lambda lang, output, basename=basename: _record(
+            f"{basename}:{lang}", status="done", output=str(output), finished=time.time())
+        reports[basename] = RunReport(basename, strip=f"{basename}/")
+        reports[basename].meta = {"langs": todo}
+        for lang, job in add_job(dag, args, cache, todo, prefix=f"{basename}/", on_done=on_done,
+                                 metrics=reports[basename]).items():
+            jobs[f"{basename}:{lang}"] = job
+
+    print(f"[batch] {len(jobs)} jobs, {sum(j is None for j in jobs.values())} already done")
+    t0 = time.perf_counter()
+    dag.run()
+    wall = time.perf_counter() - t0
+
+    # -------- summary --------
+    print(f"\n[batch] {'job':<32}{'status':<10}{'time':>9}  detail")
+    failed = 0
+    for job_id, job in jobs.items():
+        if job is None:
+            print(f"[batch] {job_id:<32}{'done':<10}{'-':>9}  (earlier run) {state[job_id]['output']}")
+            continue
+        tasks = [dag.tasks[n] for n in job["tasks"]]
+        ran = [t for t in tasks if t.start is not None]
+        secs = max(t.end for t in ran) - min(t.start for t in ran) if ran else 0.0
+        bad = next((t for t in tasks if t.status in ("failed", "skipped")), None)
+        if bad is None:
+            print(f"[batch] {job_id:<32}{'done':<10}{secs:>8.1f}s  {job['output']}")
+        else:
+            failed += 1
+            cause = next((t for t in tasks if t.status == "failed"), bad)
+            detail = f"{cause.name}: {cause.error!r}"
+            print(f"[batch] {job_id:<32}{'failed':<10}{secs:>8.1f}s  {detail}")
+            _record(job_id, status="failed", error=detail, finished=time.time())
+    print(f"[batch] {len(jobs) - failed}/{len(jobs)} jobs done in {wall:.1f}s; state: {state_path}")
+    if reports:
+        dicts = []
+        for basename, rep in reports.items():
+            rep.write(DIRS["outputs"] / f"{basename}.report.json")
+            dicts.append(rep.to_dict())
+        agg = aggregate(dicts) | {"manifest": str(manifest_path), "batch_wall_s": wall}
+        agg_path = manifest_path.with_name(manifest_path.stem + ".report.json")
+        _save_state(agg_path, agg)
+        print()
+        print_aggregate(agg)
+        print(f"[metrics] per-video reports in {DIRS['outputs']}, batch report: {agg_path}")
+    registry.report()
+    return 1 if failed else 0
+
+# ---------------- job server: HTTP on localhost, SQLite queue, warm worker processes ----------------
+# server-wide slot class of each task-graph stage (see SERVER_SLOTS)
+STAGE_SLOTS = {"asr": "asr", "stream": "asr", "translate": "nllb", "tts": "tts",
+               "faces": "wav2lip", "wav2lip": "wav2lip"}
+
+def init_worker():
+    """Runs once in each server worker process; models then stay loaded across its jobs."""
+    configure_registry(MODEL_RAM_BUDGET_MB)
+    configure_scheduler(**TTS_SCHEDULER)
+    configure_threads(THREAD_CORES, THREAD_LEDGER)
+
+def validate_job(spec: dict):
+    if not isinstance(spec, dict):
+        raise ValueError("job spec must be a JSON object")
+    job_args({}, spec)
+
+def run_job(spec: dict, progress, slot) -> dict:
+    """
+    Server runner for one manifest-style job ({video_file|yt_url, basename,
+    langs, any main.py option}). Progress is reported per task-graph stage;
+    percent is the share of finished stages.
+    """
+    args, langs = job_args({}, spec)
+    cache = StageCache(STAGE_CACHE_DIR, force=cache_force(args), enabled=not args.no_stage_cache)
+    dag = DAGExecutor(PIPELINE_RESOURCES)
+    basename = job_basename(args)
+    rep = RunReport(basename)
+    rep.meta = {"langs": langs}
+    jobs = add_job(dag, args, cache, langs, metrics=rep)
+    total, finished, lock = len(dag.tasks), [0], threading.Lock()
+
+    def _wrap(task):
+        fn, cls = task.fn, STAGE_SLOTS.get(task.name.split(":")[0])
+        def _run():
+            progress(task.name, 100.0 * finished[0] / total, "started")
+            with slot(cls):
+                result = fn()
+            with lock:
+                finished[0] += 1
+            progress(task.name, 100.0 * finished[0] / total, "done")
+            return result
+        task.fn = _run
+    for task in dag.tasks.values():
+        _wrap(task)
+    report_json = DIRS["outputs"] / f"{basename}.report.json"
+    try:
+        dag.run()
+    finally:
+        rep.write(report_json)
+    return {lang: job["output"].resolve() for lang, job in jobs.items()} | {"report": report_json.resolve()}
+
+def run_server(argv=None):
+    from modules.job_server import JobServer
+    ap = argparse.ArgumentParser(
+        prog="main.py serve",
+        description="Local dubbing job server: POST /jobs, GET /jobs/<id>[/events|/artifacts/<name>], "
+                    "POST /jobs/<id>/cancel, POST /drain"
+    )
+    ap.add_argument("--host", default=SERVER_HOST)
+    ap.add_argument("--port", type=int, default=SERVER_PORT)
+    ap.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Worker processes (each keeps its own models)")
+    ap.add_argument("--db", default=str(SERVER_DB), help="SQLite job queue")
+    ap.add_argument("--slot", action="append", default=[], metavar="CLASS=N",
+                    help=f"Override a resource-class limit (default {SERVER_SLOTS})")
+    ap.add_argument("--stub", action="store_true", help="Run the stub pipeline (fake models, no downloads) for testing")
+    a = ap.parse_args(argv)
+    slots = dict(SERVER_SLOTS)
+    for item in a.slot:
+        cls, _, n = item.partition("=")
+        slots[cls] = int(n)
+    server = JobServer(
+        a.db, runner="modules.job_server:stub_runner" if a.stub else "main:run_job",
+        init=None if a.stub else "main:init_worker", workers=a.workers, slots=slots,
+        host=a.host, port=a.port, validate=None if a.stub else validate_job,
+    )
+    server.start().serve_forever()
+    return 0
+
+# ---------------- run reports ----------------
+def run_report(argv=None):
+    ap = argparse.ArgumentParser(prog="main.py report",
+                                 description="Print run reports (*.report.json) and their per-stage aggregate")
+    ap.add_argument("reports", nargs="+", help="Report files written by single runs, batch or the server")
+    ap.add_argument("--json", default=None, help="Also write the aggregate to this file")
+    a = ap.parse_args(argv)
+    reports = []
+    for path in a.reports:
+        rep = json.loads(Path(path).read_text(encoding="utf-8"))
+        if "stages" not in rep or not isinstance(rep["stages"], list):
+            print(f"[metrics] skipping {path}: not a run report")
+            continue
+        reports.append(rep)
+        print_summary(rep)
+        print()
+    if not reports:
+        return 1
+    agg = aggregate(reports)
+    print_aggregate(agg)
+    if a.json:
+        _save_state(Path(a.json), agg)
+    return 0
+
+# ---------------- cluster: shared-filesystem queue worked by several nodes ----------------
+def cluster_task_id(basename: str, task_name: str) -> str:
+    return f"{basename}__{task_name.replace(':', '-').replace('#', '-')}"
+
+def submit_cluster(queue, manifest: dict) -> int:
+    """One queue task per task-graph stage of every manifest job, with the graph's dependencies."""
+    defaults, n = manifest.get("defaults") or {}, 0
+    for spec in manifest["jobs"]:
+        args, langs = job_args(defaults, spec)
+        dag = DAGExecutor(PIPELINE_RESOURCES)
+        add_job(dag, args, StageCache(STAGE_CACHE_DIR, enabled=False), langs)
+        job = {**defaults, **spec, "langs": langs}
+        basename = job_basename(args)
+        for t in dag.tasks.values():
+            n += queue.submit(cluster_task_id(basename, t.name), t.name.split(":")[0],
+                              {"job": job, "task": t.name}, [cluster_task_id(basename, d) for d in t.deps])
+    return n
+
+def run_cluster_task(task: dict) -> dict:
+    """FSWorker runner: rebuild the job's task graph on this node and run just this stage."""
+    args, langs = job_args({}, task["spec"]["job"])
+    cache = StageCache(STAGE_CACHE_DIR, force=cache_force(args), enabled=not args.no_stage_cache)
+    dag = DAGExecutor(PIPELINE_RESOURCES)
+    jobs = add_job(dag, args, cache, langs)
+    name = task["spec"]["task"]
+    dag.run(only=[name])
+    return {lang: job["output"] for lang, job in jobs.items() if job["final"] == name}
+
+def print_cluster_status(st: dict):
+    c = st["counts"]
+    print("[cluster] tasks: " + ", ".join(f"{k} {c.get(k, 0)}" for k in
+                                          ("ready", "leased", "waiting", "done", "failed", "blocked")))
+    for n in st["nodes"]:
+        busy = len(n.get("running", {}))
+        print(f"[cluster] node {n['node']:<24}{'up' if n['alive'] else 'DOWN':<6}"
+              f"{busy}/{n.get('slots', '?')} slots  load {n.get('load1') or 0:.1f}/{n.get('cpus') or '?'}  "
+              f"done {n.get('completed', 0)} failed {n.get('failed', 0)}  "
+              f"seen {time.time() - n['updated']:.0f}s ago")
+    for ls in st["leases"]:
+        print(f"[cluster] lease {ls['id']:<40}{ls['node'] or '?':<24}"
+              f"running {time.time() - (ls['since'] or time.time()):.0f}s, heartbeat {ls['heartbeat_age']:.0f}s ago")
+
+def run_cluster(argv=None):
+    from modules.fs_queue import FSQueue, FSWorker, stub_task
+    ap = argparse.ArgumentParser(prog="main.py cluster",
+                                 description="Dub across several nodes through a queue directory on a shared filesystem")
+    ap.add_argument("command", choices=["submit", "work", "status"])
+    ap.add_argument("--queue", default=str(CLUSTER_QUEUE_DIR), help="Queue directory on the shared filesystem")
+    ap.add_argument("--lease_ttl", type=float, default=CLUSTER_LEASE_TTL,
+                    help="Seconds without a heartbeat before a task is reclaimed")
+    ap.add_argument("--manifest", help="submit: jobs.yaml / jobs.json (same format as `main.py batch`)")
+    ap.add_argument("--node", default=None, help="work: node name (default host-pid)")
+    ap.add_argument("--slots", type=int, default=1, help="work: tasks run at once on this node")
+    ap.add_argument("--exit_when_idle", action="store_true", help="work: exit once every task is finished")
+    ap.add_argument("--stub", action="store_true", help="work: run the stub task runner (testing)")
+    ap.add_argument("--watch", type=float, default=0, help="status: refresh every N seconds")
+    a = ap.parse_args(argv)
+    queue = FSQueue(a.queue, lease_ttl=a.lease_ttl)
+
+    if a.command == "submit":
+        if not a.manifest:
+            ap.error("submit needs --manifest")
+        print(f"[cluster] submitted {submit_cluster(queue, load_manifest(Path(a.manifest)))} new tasks to {a.queue}")
+    elif a.command == "work":
+        if not a.stub:
+            configure_registry(MODEL_RAM_BUDGET_MB)
+            configure_scheduler(**TTS_SCHEDULER)
+            configure_threads(THREAD_CORES, THREAD_LEDGER)
+        FSWorker(queue, stub_task if a.stub else run_cluster_task, a.node, a.slots).run(a.exit_when_idle)
+    else:
+        while True:
+            queue.reclaim()
+            print_cluster_status(queue.status())
+            if a.watch <= 0: break
+            time.sleep(a.watch)
+            print()
+    return 0
+
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -0,0 +1,99 @@
+# modules/asr_cache.py
+import hashlib, json, os, tempfile
+from pathlib import Path
+import numpy as np
+from modules import metrics
+from modules.asr_whisper import ASR_SR, _save_segments
+
+_BLOCK = 1 << 20  # samples hashed per step (2 MiB of int16)
+
+
+def _engine_version() -> str:
+    try:
+        from importlib.metadata import version
+        return version("faster-whisper")
+    except Exception:
+        return "unknown"
+
+def audio_fingerprint(audio_wav, sr: int = ASR_SR) -> str:
+    """
+    sha1 of the decoded mono PCM16 samples at `sr` (plus sr itself), so the
+    same audio gives the same key whatever the file name or container.
+    16 kHz PCM WAVs (what extract_audio_ffmpeg writes) are hashed straight
+    from a memory map; PCMAudio is hashed from memory; anything else is decoded first.
+    """
+    from modules.media import PCMAudio, load_pcm
+    from modules.wavmap import open_wav_memmap
+    h = hashlib.sha1(f"pcm16:{sr}:".encode())
+    usable = False
+    if not isinstance(audio_wav, PCMAudio):
+        try:
+            mm, wav_sr = open_wav_memmap(audio_wav, mode="r")
+            usable = wav_sr == sr and mm.ndim == 1 and mm.dtype == np.int16
+        except ValueError:
+            pass
+    if not usable:
+        pcm = audio_wav if isinstance(audio_wav, PCMAudio) else load_pcm(audio_wav, sr)
+        mm = pcm.at(sr)
+    for i in range(0, len(mm), _BLOCK):
+        block = mm[i:i + _BLOCK]
+        if block.dtype != np.int16:
+            block = np.clip(np.rint(block * 32768.0), -32768, 32767).astype(np.int16)
+        h.update(np.ascontiguousarray(block).tobytes())
+    return h.hexdigest()
+
+def cache_key(fingerprint: str, params: dict) -> str:
+    """Key = audio fingerprint + ASR parameters (model, compute type, VAD, ...) + engine version."""
+    p = json.dumps({"engine": _engine_version(), **params}, sort_keys=True, default=str)
+    return hashlib.sha1(f"{fingerprint}\x1f{p}".encode("utf-8")).hexdigest()
+
+
+class TranscriptCache:
+    """
+    Content-addressed ASR results: <root>/<key[:2]>/<key>.json holding the
+    [{start,end,text}] segments and the parameters they were made with.
+    Entries are written to a temp file and renamed, so readers never see a
+    partial transcript.
+    """
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str):
+        try:
+            with open(self.path(key), encoding="utf-8") as f:
+                return json.load(f)["segments"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key: str, segments: list, params: dict | None = None):
+        p = self.path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=p.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"params": params or {}, "segments": segments}, f, ensure_ascii=False)
+            os.replace(tmp, p)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+
+def cached_transcribe(audio_wav: Path, out_json: Path, params: dict, transcribe, cache_dir: Path):
+    """
+    Look the audio up in the transcript cache before running `transcribe`
+    (called as transcribe(audio_wav, out_json)); on a miss the fresh result is stored.
+    """
+    cache = TranscriptCache(cache_dir)
+    key = cache_key(audio_fingerprint(audio_wav), params)
+    segments = cache.get(key)
+    metrics.note(asr_cache="hit" if segments is not None else "miss")
+    if segments is not None:
+        print(f"[ASR] cache hit {key[:12]} ({len(segments)} segments), skipping Whisper")
+        return _save_segments(segments, out_json)
+    transcribe(audio_wav, out_json)
+    with open(out_json, encoding="utf-8") as f:
+        cache.put(key, json.load(f), params)
+    return out_json
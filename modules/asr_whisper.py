@@ -1,19 +1,156 @@
 # modules/asr_whisper.py
 from pathlib import Path
 import json
+from modules import metrics
+from modules.media import PCMAudio, asr_input
 
-def transcribe_faster_whisper(audio_wav: Path, out_json: Path, model_size="small", device="auto"):
+def transcribe_faster_whisper(audio_wav: Path, out_json: Path, model_size="small", device="auto",
+                              compute_type="default", model=None, beam_size=5, language=None,
+                              batch_size=0, cpu_threads=0, num_workers=1):
     """
     Transcribe with faster-whisper; save [{start,end,text}] to JSON.
+    audio_wav may be a path or already-decoded PCMAudio (passed as an array).
+    `model` may be a preloaded WhisperModel; otherwise one is taken from the
+    shared model registry (loaded once per process).
+    language: pin the source language (skips the 30 s detection pass); None = detect.
+    batch_size > 0 uses BatchedInferencePipeline (VAD chunks decoded in batches).
     """
-    from faster_whisper import WhisperModel
-    model = WhisperModel(model_size, device=device)
-    segments, _ = model.transcribe(str(audio_wav), vad_filter=True)
+    if model is None:
+        from modules.model_registry import get_registry
+        model = get_registry().get("whisper", model_size, device, compute_type,
+                                   cpu_threads=cpu_threads, num_workers=num_workers)
+    if batch_size > 0:
+        from faster_whisper import BatchedInferencePipeline
+        segments, _ = BatchedInferencePipeline(model=model).transcribe(
+            asr_input(audio_wav), batch_size=batch_size, beam_size=beam_size, language=language, vad_filter=True)
+    else:
+        segments, _ = model.transcribe(asr_input(audio_wav), beam_size=beam_size, language=language, vad_filter=True)
     out = []
     for seg in segments:
         out.append({"start": float(seg.start), "end": float(seg.end), "text": seg.text.strip()})
+    return _save_segments(out, out_json)
+
+def asr_settings(profile: dict, **overrides) -> dict:
+    """Profile preset (config.ASR_PROFILES) with non-None overrides applied."""
+    cfg = dict(profile)
+    cfg.update({k: v for k, v in overrides.items() if v is not None})
+    return cfg
+
+def _save_segments(out, out_json: Path):
     out_json.parent.mkdir(parents=True, exist_ok=True)
     with open(out_json, "w", encoding="utf-8") as f:
         json.dump(out, f, ensure_ascii=False, indent=2)
+    metrics.count("segments", len(out))
     print("✅ ASR saved:", out_json)
     return out_json
+
+# ---------------- parallel ASR over VAD regions ----------------
+ASR_SR = 16000  # faster-whisper's input rate
+
+def pack_speech_regions(regions, total_samples, target_samples, sr=ASR_SR, pad_sec=0.2):
+    """
+    Group consecutive VAD regions ({"start","end"} in samples) into chunks of
+    roughly `target_samples`, cutting only in the silence between regions.
+    Each chunk is widened by up to pad_sec into the surrounding silence.
+    Returns [(start_sample, end_sample), ...].
+    """
+    chunks, cur = [], []
+    for r in regions:
+        if cur and r["end"] - cur[0]["start"] > target_samples:
+            chunks.append(cur); cur = []
+        cur.append(r)
+    if cur: chunks.append(cur)
+
+    pad = int(pad_sec * sr)
+    out = []
+    for i, c in enumerate(chunks):
+        lo = chunks[i-1][-1]["end"] if i > 0 else 0
+        hi = chunks[i+1][0]["start"] if i < len(chunks) - 1 else total_samples
+        s = max(lo + (c[0]["start"] - lo) // 2, c[0]["start"] - pad, 0)
+        e = min(hi - (hi - c[-1]["end"]) // 2, c[-1]["end"] + pad, total_samples)
+        out.append((int(s), int(e)))
+    return out
+
+_WORKER_MODEL = None
+
+def _init_asr_worker(model_size, compute_type, threads):
+    global _WORKER_MODEL
+    from faster_whisper import WhisperModel
+    _WORKER_MODEL = WhisperModel(model_size, device="cpu", compute_type=compute_type,
+                                 cpu_threads=threads, num_workers=1)
+
+def _transcribe_chunk(job):
+    src, s, e, kw = job
+    if isinstance(src, str):  # PCM WAV on disk: map it instead of pickling audio
+        import numpy as np
+        from modules.wavmap import open_wav_memmap
+        mm, _ = open_wav_memmap(Path(src), mode="r")
+        y = np.asarray(mm[s:e], dtype=np.float32)
+        if mm.dtype == np.int16: y /= 32768.0
+    else:
+        y = src
+    off = s / ASR_SR
+    segments, _ = _WORKER_MODEL.transcribe(y, vad_filter=True, **kw)
+    return [{"start": off + float(seg.start), "end": off + float(seg.end), "text": seg.text.strip()}
+            for seg in segments]
+
+def transcribe_faster_whisper_parallel(audio_wav: Path, out_json: Path, model_size="small",
+                                       workers=None, threads_per_worker=2, compute_type="int8",
+                                       chunk_sec=None, language=None, beam_size=5):
+    """
+    Parallel ASR: run VAD once, pack speech into ~equal chunks on silence
+    boundaries, transcribe them in a process pool (one int8 WhisperModel with
+    `threads_per_worker` threads per worker) and merge the segments back with
+    absolute timestamps. Same [{start,end,text}] output as transcribe_faster_whisper.
+    """
+    import os, numpy as np
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing as mp
+    from faster_whisper.audio import decode_audio
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+    from modules.wavmap import open_wav_memmap
+
+    workers = workers or max(1, (os.cpu_count() or 2) // threads_per_worker)
+    if isinstance(audio_wav, PCMAudio):
+        # decoded already; workers can still map it if it was spilled to a float32 wav
+        audio = asr_input(audio_wav)
+        src = getattr(audio_wav.samples, "filename", None) if audio_wav.sr == ASR_SR else None
+    else:
+        try:
+            mm, sr = open_wav_memmap(audio_wav, mode="r")
+            mapped = sr == ASR_SR and mm.ndim == 1
+        except ValueError:
+            mapped = False
+        if mapped:
+            audio = np.asarray(mm, dtype=np.float32)
+            if mm.dtype == np.int16: audio /= 32768.0
+            del mm
+        else:
+            audio = decode_audio(str(audio_wav), sampling_rate=ASR_SR)
+        src = str(audio_wav) if mapped else None  # workers map the file instead of unpickling audio
+
+    regions = get_speech_timestamps(audio, VadOptions())
+    speech = sum(r["end"] - r["start"] for r in regions)
+    if chunk_sec:
+        target = int(chunk_sec * ASR_SR)
+    else:
+        # ~2 chunks per worker for load balance, but keep enough context for Whisper
+        target = int(np.clip(speech / (2 * workers), 30 * ASR_SR, 600 * ASR_SR))
+    chunks = pack_speech_regions(regions, len(audio), target)
+    print(f"[ASR] {len(regions)} speech regions → {len(chunks)} chunks on {workers} workers "
+          f"x {threads_per_worker} threads")
+    metrics.count("chunks", len(chunks))
+    metrics.note(asr_workers=workers, speech_sec=speech / ASR_SR)
+
+    kw = {"beam_size": beam_size, "language": language}
+    jobs = [(src if src else audio[s:e], s, e, kw) for s, e in chunks]
+    del audio
+    out = []
+    ctx = mp.get_context("spawn")  # ctranslate2/onnxruntime threads do not survive fork
+    with ProcessPoolExecutor(max_workers=min(workers, max(1, len(jobs))), mp_context=ctx,
+                             initializer=_init_asr_worker,
+                             initargs=(model_size, compute_type, threads_per_worker)) as ex:
+        for segs in ex.map(_transcribe_chunk, jobs):
+            out.extend(segs)
+    out.sort(key=lambda d: d["start"])
+    return _save_segments(out, out_json)
@@ -0,0 +1,152 @@
+# modules/dag.py
+import threading, time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from modules.threads import get_threads
+
+
+class ResourcePool:
+    """
+    Counted resources (e.g. {"cpu": 8, "net": 2, "mem_mb": 8192}). A request
+    above a limit is clamped to it, so an oversized task can still run alone.
+    """
+    def __init__(self, limits: dict):
+        self.limits = dict(limits)
+        self.free = dict(limits)
+        self._lock = threading.Lock()
+
+    def _clamp(self, req: dict) -> dict:
+        return {k: min(v, self.limits[k]) for k, v in req.items() if k in self.limits}
+
+    def try_acquire(self, req: dict) -> bool:
+        req = self._clamp(req)
+        with self._lock:
+            if any(self.free[k] < v for k, v in req.items()):
+                return False
+            for k, v in req.items(): self.free[k] -= v
+            return True
+
+    def release(self, req: dict):
+        with self._lock:
+            for k, v in self._clamp(req).items(): self.free[k] += v
+
+
+class Task:
+    __slots__ = ("name", "fn", "deps", "resources", "start", "end", "result", "status", "error", "metrics")
+
+    def __init__(self, name, fn, deps=(), resources=None, metrics=None):
+        self.name, self.fn, self.deps = name, fn, tuple(deps)
+        self.resources = dict(resources or {})
+        self.metrics = metrics  # metrics.RunReport that records this task as a stage
+        self.start = self.end = self.result = self.error = None
+        self.status = "pending"  # → done | failed | skipped (a dependency failed)
+
+
+class DAGExecutor:
+    """
+    Runs tasks (zero-argument callables) as soon as their dependencies have
+    finished and their resources fit in the pool. Tasks are started in the
+    order they were added whenever several are ready. With fail_fast, the
+    first failure stops new tasks from starting; running ones finish, then it
+    is re-raised. Otherwise only the failed task's dependents are skipped and
+    the rest of the graph keeps going (see Task.status / Task.error).
+    """
+    def __init__(self, limits: dict, max_workers: int = 8, fail_fast: bool = True, metrics=None):
+        self.pool = ResourcePool(limits)
+        self.metrics = metrics  # default RunReport for tasks added without one
+        self.max_workers = max_workers
+        self.fail_fast = fail_fast
+        self.tasks = {}  # name -> Task, insertion ordered
+        self.t0 = None
+
+    def add(self, name: str, fn, deps=(), metrics=None, **resources) -> str:
+        if name in self.tasks:
+            raise ValueError(f"duplicate task {name}")
+        missing = [d for d in deps if d not in self.tasks]
+        if missing:
+            raise ValueError(f"task {name} depends on unknown task(s): {', '.join(missing)}")
+        self.tasks[name] = Task(name, fn, deps, resources, metrics or self.metrics)
+        return name
+
+    def _call(self, t: Task):
+        t.start = time.perf_counter() - self.t0
+        threads = get_threads()
+        try:
+            # the task's cpu request becomes its thread allotment (shared with other jobs on the box)
+            with threads.allot(t.name, t.resources.get("cpu", 1)), \
+                    t.metrics.stage(t.name) if t.metrics is not None else nullcontext():
+                threads.apply()
+                return t.fn()
+        finally:
+            t.end = time.perf_counter() - self.t0
+
+    def run(self, only=None) -> dict:
+        """
+        Execute the graph; returns {name: return value}. With `only`, just
+        those tasks run and every other task counts as already done.
+        """
+        unknown = set(only or ()) - set(self.tasks)
+        if unknown:
+            raise ValueError(f"unknown task(s): {', '.join(sorted(unknown))}")
+        self.t0 = time.perf_counter()
+        pending = [t for t in self.tasks.values() if only is None or t.name in only]
+        done, running = {n for n in self.tasks if only is not None and n not in only}, {}
+        error = None
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dag") as ex:
+            while pending or running:
+                if error is None:
+                    for t in list(pending):
+                        if len(running) >= self.max_workers: break
+                        if all(d in done for d in t.deps) and self.pool.try_acquire(t.resources):
+                            pending.remove(t)
+                            running[ex.submit(self._call, t)] = t
+                if not running:
+                    if error is not None or not pending: break
+                    raise RuntimeError("DAG stalled: " + ", ".join(t.name for t in pending))
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    t = running.pop(fut)
+                    self.pool.release(t.resources)
+                    try:
+                        t.result = fut.result()
+                        t.status = "done"
+                        done.add(t.name)
+                        print(f"[dag] {t.name} done in {t.end - t.start:.1f}s")
+                    except KeyboardInterrupt:
+                        raise
+                    except BaseException as e:  # a SystemExit from a task fails that task, not the graph
+                        t.status, t.error = "failed", e
+                        print(f"[dag] {t.name} failed: {e!r}")
+                        if self.fail_fast:
+                            error = error or e
+                        else:
+                            self._skip_dependents(t.name, pending)
+        if error is not None:
+            raise error
+        return {name: t.result for name, t in self.tasks.items()}
+
+    def _skip_dependents(self, name, pending):
+        failed = {name}
+        for t in list(pending):  # pending keeps insertion (topological) order
+            if any(d in failed for d in t.deps):
+                t.status = "skipped"
+                failed.add(t.name)
+                pending.remove(t)
+
+    def critical_path(self):
+        """(seconds, [task names]) of the longest dependency chain by measured duration."""
+        best = {}
+        for t in self.tasks.values():  # insertion order is topological (deps must exist on add)
+            dur = (t.end - t.start) if t.end is not None else 0.0
+            prev = max((best[d] for d in t.deps), key=lambda b: b[0], default=(0.0, []))
+            best[t.name] = (prev[0] + dur, prev[1] + [t.name])
+        return max(best.values(), key=lambda b: b[0], default=(0.0, []))
+
+    def report(self):
+        wall = max((t.end for t in self.tasks.values() if t.end is not None), default=0.0)
+        for t in self.tasks.values():
+            if t.start is None: continue
+            print(f"[dag] {t.name:<14} {t.start:7.1f}s → {t.end:7.1f}s  ({t.end - t.start:.1f}s)")
+        cp, names = self.critical_path()
+        print(f"[dag] wall {wall:.1f}s, critical path {cp:.1f}s: {' → '.join(names)}")
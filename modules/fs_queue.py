@@ -0,0 +1,302 @@
+# modules/fs_queue.py
+import json, os, socket, threading, time, uuid
+from pathlib import Path
+
+from modules.stage_cache import _atomic_json
+
+
+class LeaseLost(Exception):
+    """The lease expired and was reclaimed (or taken over) while the task was running."""
+
+
+def _read_json(path: Path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class Lease:
+    """A worker's claim on one task; keep it alive with heartbeat() while running."""
+    def __init__(self, queue, task: dict, node: str, token: str):
+        self.queue, self.task, self.node, self.token = queue, task, node, token
+        self.path = queue._lease_path(task["id"])
+
+    def heartbeat(self):
+        rec = _read_json(self.path)
+        if not rec or rec.get("token") != self.token:
+            raise LeaseLost(self.task["id"])
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            raise LeaseLost(self.task["id"]) from None
+
+    def complete(self, outputs: dict, seconds: float):
+        self.heartbeat()  # a reclaimed task's result is dropped; its new owner publishes its own
+        _atomic_json(self.queue.root / "done" / f"{self.task['id']}.json", {
+            "id": self.task["id"], "node": self.node, "token": self.token, "seconds": seconds,
+            "finished": time.time(), "outputs": {k: str(v) for k, v in (outputs or {}).items()},
+        })
+        self._release()
+
+    def fail(self, error: str):
+        self.queue._record_attempt(self.task["id"], self.node, self.token, error)
+        self._release()
+
+    def _release(self):
+        rec = _read_json(self.path)
+        if rec and rec.get("token") == self.token:
+            self.path.unlink(missing_ok=True)
+
+
+class FSQueue:
+    """
+    Job queue on a shared directory (e.g. NFS) that needs no server, only
+    atomic create-exclusive and rename:
+
+        tasks/<id>.json      task spec and dependencies (immutable once submitted)
+        leases/<id>.lease    owner and token, created O_EXCL by the claiming worker;
+                             its mtime is the heartbeat
+        done/<id>.json       result record, published by rename
+        failed/<id>.json     set once a task used up max_attempts
+        attempts/<id>/*.json one record per failed or expired attempt
+        nodes/<node>.json    node heartbeat (slots, running tasks, load)
+
+    A task is ready once every dependency is done. A lease whose mtime is
+    older than lease_ttl is reclaimed by whichever process notices first (the
+    rename to an .expired name succeeds for exactly one of them), and the task
+    becomes ready again. Node clocks should be NTP-synced; keep lease_ttl
+    well above any skew.
+
+    Only the queue's own records are published by rename. Stage outputs are
+    written by the stages themselves, mostly in place, and a worker whose
+    lease was reclaimed while it was still alive (stalled, partitioned) keeps
+    running and can overwrite the new owner's files; its result record is
+    dropped. Keep lease_ttl well above the longest stall a node can have.
+    """
+    DIRS = ("tasks", "leases", "done", "failed", "attempts", "nodes", "tmp")
+
+    def __init__(self, root: Path, lease_ttl: float = 120.0):
+        self.root = Path(root)
+        self.lease_ttl = lease_ttl
+        for d in self.DIRS:
+            (self.root / d).mkdir(parents=True, exist_ok=True)
+
+    def _lease_path(self, task_id: str) -> Path:
+        return self.root / "leases" / f"{task_id}.lease"
+
+    def _has(self, d: str, task_id: str) -> bool:
+        return (self.root / d / f"{task_id}.json").exists()
+
+    # ---- submit / inspect ----
+    def submit(self, task_id: str, kind: str, spec: dict, deps=(), max_attempts: int = 3) -> bool:
+        """Add a task unless one with that id exists (so resubmitting a manifest is harmless)."""
+        path = self.root / "tasks" / f"{task_id}.json"
+        if path.exists(): return False
+        _atomic_json(path, {"id": task_id, "kind": kind, "spec": spec, "deps": list(deps),
+                            "max_attempts": max_attempts, "created": time.time()})
+        return True
+
+    def tasks(self) -> list:
+        out = [_read_json(p) for p in (self.root / "tasks").glob("*.json")]
+        return sorted((t for t in out if t), key=lambda t: (t["created"], t["id"]))
+
+    def attempts(self, task_id: str) -> list:
+        return [_read_json(p) for p in sorted((self.root / "attempts" / task_id).glob("*.json"))]
+
+    def state(self, task: dict, _memo=None) -> str:
+        """done | failed | leased | ready | waiting (on dependencies) | blocked (a dependency failed)."""
+        memo = {} if _memo is None else _memo
+        tid = task["id"]
+        if tid in memo: return memo[tid]
+        if self._has("done", tid): st = "done"
+        elif self._has("failed", tid): st = "failed"
+        elif self._lease_path(tid).exists(): st = "leased"
+        else:
+            deps = [self.state(_read_json(self.root / "tasks" / f"{d}.json") or {"id": d}, memo)
+                    for d in task.get("deps", ())]
+            st = "blocked" if any(d in ("failed", "blocked") for d in deps) else \
+                 "ready" if all(d == "done" for d in deps) else "waiting"
+        memo[tid] = st
+        return st
+
+    def finished(self) -> bool:
+        memo = {}
+        return all(self.state(t, memo) in ("done", "failed", "blocked") for t in self.tasks())
+
+    # ---- leases ----
+    def claim(self, node: str):
+        """Lease the oldest ready task; returns a Lease or None."""
+        self.reclaim()
+        memo = {}
+        for task in self.tasks():
+            if self.state(task, memo) != "ready": continue
+            token = uuid.uuid4().hex
+            try:
+                fd = os.open(self._lease_path(task["id"]), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"node": node, "pid": os.getpid(), "token": token, "since": time.time()}, f)
+            if self._has("done", task["id"]):  # finished between the scan and the claim
+                self._lease_path(task["id"]).unlink(missing_ok=True)
+                continue
+            return Lease(self, task, node, token)
+        return None
+
+    def reclaim(self) -> list:
+        """Free leases whose heartbeat is older than lease_ttl; returns the task ids."""
+        freed, now = [], time.time()
+        for p in (self.root / "leases").glob("*.lease"):
+            try:
+                if now - p.stat().st_mtime <= self.lease_ttl: continue
+                rec = _read_json(p) or {}
+                grave = self.root / "tmp" / f"{p.stem}.{uuid.uuid4().hex[:8]}.expired"
+                os.rename(p, grave)  # exactly one reclaimer wins
+            except FileNotFoundError:
+                continue
+            grave.unlink(missing_ok=True)
+            self._record_attempt(p.stem, rec.get("node", "?"), rec.get("token", "?"),
+                                 f"lease expired (no heartbeat for {self.lease_ttl:.0f}s)")
+            freed.append(p.stem)
+            print(f"[fsqueue] reclaimed {p.stem} from {rec.get('node', '?')}")
+        return freed
+
+    def _record_attempt(self, task_id: str, node: str, token: str, error: str):
+        _atomic_json(self.root / "attempts" / task_id / f"{time.time_ns()}_{token[:8]}.json",
+                     {"id": task_id, "node": node, "error": error, "t": time.time()})
+        task = _read_json(self.root / "tasks" / f"{task_id}.json") or {}
+        if len(self.attempts(task_id)) >= task.get("max_attempts", 3):
+            _atomic_json(self.root / "failed" / f"{task_id}.json", {"id": task_id, "error": error, "t": time.time()})
+
+    # ---- coordinator view ----
+    def node_heartbeat(self, node: str, info: dict):
+        _atomic_json(self.root / "nodes" / f"{node}.json", {"node": node, "updated": time.time(), **info})
+
+    def status(self) -> dict:
+        memo, counts, leases = {}, {}, []
+        for t in self.tasks():
+            st = self.state(t, memo)
+            counts[st] = counts.get(st, 0) + 1
+            if st == "leased":
+                p = self._lease_path(t["id"])
+                rec = _read_json(p) or {}
+                try:
+                    age = time.time() - p.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                leases.append({"id": t["id"], "node": rec.get("node"), "since": rec.get("since"), "heartbeat_age": age})
+        nodes = []
+        for p in sorted((self.root / "nodes").glob("*.json")):
+            n = _read_json(p)
+            if n:
+                n["alive"] = time.time() - n["updated"] <= self.lease_ttl
+                nodes.append(n)
+        return {"counts": counts, "leases": leases, "nodes": nodes}
+
+
+class FSWorker:
+    """
+    One node: `slots` threads claim tasks from the queue and run
+    runner(task) -> {artifact: path}, heart-beating each lease every
+    lease_ttl/3 while it runs. The node's own heartbeat file carries its
+    utilization for the coordinator view.
+    """
+    def __init__(self, queue: FSQueue, runner, node: str | None = None, slots: int = 1, poll: float = 2.0):
+        self.queue, self.runner, self.slots, self.poll = queue, runner, slots, poll
+        self.node = node or f"{socket.gethostname()}-{os.getpid()}"
+        self.running, self.completed, self.failed = {}, 0, 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _beat_node(self):
+        load = os.getloadavg()[0] if hasattr(os, "getloadavg") else None
+        with self._lock:
+            info = {"host": socket.gethostname(), "pid": os.getpid(), "slots": self.slots,
+                    "running": dict(self.running), "completed": self.completed, "failed": self.failed}
+        self.queue.node_heartbeat(self.node, info | {"load1": load, "cpus": os.cpu_count()})
+
+    def _run(self, lease: Lease):
+        tid, t0 = lease.task["id"], time.perf_counter()
+        with self._lock:
+            self.running[tid] = time.time()
+        stop_beat, lost = threading.Event(), threading.Event()
+        def _beat():
+            while not stop_beat.wait(self.queue.lease_ttl / 3):
+                try:
+                    lease.heartbeat()
+                except LeaseLost:
+                    lost.set(); return
+        hb = threading.Thread(target=_beat, name=f"lease-{tid}", daemon=True)
+        hb.start()
+        ok = False
+        try:
+            outputs = self.runner(lease.task)
+            if lost.is_set():
+                print(f"[fsqueue] {self.node}: lost the lease on {tid}; its result is dropped")
+            else:
+                lease.complete(outputs, time.perf_counter() - t0)
+                ok = True
+                print(f"[fsqueue] {self.node}: {tid} done in {time.perf_counter() - t0:.1f}s")
+        except LeaseLost:
+            print(f"[fsqueue] {self.node}: lost the lease on {tid}; its result is dropped")
+        except (Exception, SystemExit) as e:  # keep the slot's loop alive
+            lease.fail(repr(e))
+            print(f"[fsqueue] {self.node}: {tid} failed: {e!r}")
+        finally:
+            stop_beat.set()
+            with self._lock:
+                self.running.pop(tid, None)
+                self.completed += ok
+                self.failed += not ok
+
+    def _loop(self, exit_when_idle: bool):
+        while not self._stop.is_set():
+            lease = self.queue.claim(self.node)
+            if lease is None:
+                if exit_when_idle and self.queue.finished(): return
+                self._stop.wait(self.poll)
+                continue
+            self._run(lease)
+
+    def run(self, exit_when_idle: bool = False):
+        """Work until stop() (or, with exit_when_idle, until every task is finished)."""
+        threads = [threading.Thread(target=self._loop, args=(exit_when_idle,), name=f"{self.node}-{i}")
+                   for i in range(self.slots)]
+        for t in threads: t.start()
+        try:
+            while any(t.is_alive() for t in threads):
+                self._beat_node()
+                for t in threads: t.join(self.queue.lease_ttl / 4)
+        except KeyboardInterrupt:
+            print(f"[fsqueue] {self.node}: stopping after running tasks")
+            self.stop()
+            for t in threads: t.join()
+        self._beat_node()
+
+    def stop(self):
+        self._stop.set()
+
+
+def stub_task(task: dict) -> dict:
+    """
+    Stand-in runner for multi-process tests: sleeps spec["sec"], then
+    publishes spec["out"] by rename. spec["crash"] makes the first attempt
+    exit the process without releasing the lease (a dead node); spec["fail"] raises.
+    """
+    spec = task["spec"]
+    out = Path(spec.get("out") or f"{task['id']}.txt")
+    time.sleep(float(spec.get("sec", 0.1)))
+    crashed = out.with_name(out.name + ".crashed")
+    if spec.get("crash") and not crashed.exists():
+        crashed.parent.mkdir(parents=True, exist_ok=True)
+        crashed.touch()
+        os._exit(3)
+    if spec.get("fail"):
+        raise RuntimeError(f"stub failure in {task['id']}")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(f".{out.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps({"id": task["id"], "pid": os.getpid()}), encoding="utf-8")
+    os.replace(tmp, out)
+    return {"output": out}
@@ -0,0 +1,151 @@
+# modules/job_queue.py
+import json, sqlite3, threading, time, uuid
+from pathlib import Path
+
+STATES = ("queued", "running", "done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once a cancel has been requested for it."""
+
+
+class JobQueue:
+    """
+    Persistent job queue in SQLite, shared by the HTTP server and its worker
+    processes (each opens its own connection). A job moves
+    queued → running → done | failed | cancelled; claim() hands the oldest
+    queued job to exactly one worker. Progress events are appended to a
+    separate table, so clients can poll them incrementally.
+    """
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # autocommit; multi-statement updates use explicit BEGIN IMMEDIATE
+        self.db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE, spec TEXT, status TEXT,"
+            " worker TEXT, cancel INTEGER DEFAULT 0, error TEXT, outputs TEXT,"
+            " created REAL, started REAL, finished REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, seq)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT, t REAL,"
+            " stage TEXT, percent REAL, eta REAL, message TEXT)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS events_job ON events(job_id, seq)")
+
+    def _row(self, r) -> dict:
+        d = dict(r)
+        d["spec"] = json.loads(d["spec"])
+        d["outputs"] = json.loads(d["outputs"]) if d["outputs"] else {}
+        d["cancel"] = bool(d["cancel"])
+        return d
+
+    def submit(self, spec: dict) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self.db.execute("INSERT INTO jobs (id, spec, status, created) VALUES (?, ?, 'queued', ?)",
+                            (job_id, json.dumps(spec, ensure_ascii=False), time.time()))
+        self.event(job_id, "queued", 0.0)
+        return job_id
+
+    def claim(self, worker: str):
+        """Atomically take the oldest queued job; returns its dict or None."""
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                r = self.db.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY seq LIMIT 1").fetchone()
+                if r is not None:
+                    self.db.execute("UPDATE jobs SET status = 'running', worker = ?, started = ? WHERE id = ?",
+                                    (worker, time.time(), r["id"]))
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        return None if r is None else self.get(r["id"])
+
+    def _finish(self, job_id: str, status: str, **fields):
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock:
+            self.db.execute(f"UPDATE jobs SET status = ?, finished = ?{', ' + cols if cols else ''}"
+                            " WHERE id = ? AND status = 'running'",
+                            (status, time.time(), *fields.values(), job_id))
+
+    def complete(self, job_id: str, outputs: dict):
+        self._finish(job_id, "done", outputs=json.dumps({k: str(v) for k, v in outputs.items()}))
+        self.event(job_id, "done", 100.0, eta=0.0)
+
+    def fail(self, job_id: str, error: str):
+        self._finish(job_id, "failed", error=error)
+        self.event(job_id, "failed", None, message=error)
+
+    def mark_cancelled(self, job_id: str):
+        self._finish(job_id, "cancelled")
+        self.event(job_id, "cancelled", None)
+
+    def cancel(self, job_id: str) -> str | None:
+        """
+        A queued job is cancelled at once; a running one is flagged and stops
+        at its next progress report. Returns the job's status afterwards.
+        """
+        with self._lock:
+            self.db.execute("UPDATE jobs SET status = 'cancelled', cancel = 1, finished = ?"
+                            " WHERE id = ? AND status = 'queued'", (time.time(), job_id))
+            self.db.execute("UPDATE jobs SET cancel = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        job = self.get(job_id)
+        if job is not None and job["status"] == "cancelled":
+            self.event(job_id, "cancelled", None)
+        return None if job is None else job["status"]
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            r = self.db.execute("SELECT cancel FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(r and r["cancel"])
+
+    def requeue(self, worker: str | None = None) -> int:
+        """
+        Put running jobs back in the queue: all of them at server start (left
+        over from a crash), or only `worker`'s when that process died.
+        """
+        q = "UPDATE jobs SET status = 'queued', worker = NULL, started = NULL WHERE status = 'running'"
+        with self._lock:
+            cur = self.db.execute(q + (" AND worker = ?" if worker else ""), (worker,) if worker else ())
+        return cur.rowcount
+
+    def event(self, job_id: str, stage: str, percent, eta=None, message: str = ""):
+        with self._lock:
+            self.db.execute("INSERT INTO events (job_id, t, stage, percent, eta, message) VALUES (?, ?, ?, ?, ?, ?)",
+                            (job_id, time.time(), stage, percent, eta, message))
+
+    def events(self, job_id: str, after: int = 0) -> list:
+        with self._lock:
+            rows = self.db.execute("SELECT * FROM events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                                   (job_id, after)).fetchall()
+        return [dict(r) for r in rows]
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            r = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            last = self.db.execute("SELECT stage, percent, eta, message, t FROM events"
+                                   " WHERE job_id = ? ORDER BY seq DESC LIMIT 1", (job_id,)).fetchone()
+        if r is None: return None
+        d = self._row(r)
+        d["progress"] = dict(last) if last else None
+        return d
+
+    def list(self, status: str | None = None, limit: int = 100) -> list:
+        q = "SELECT * FROM jobs" + (" WHERE status = ?" if status else "") + " ORDER BY seq DESC LIMIT ?"
+        with self._lock:
+            rows = self.db.execute(q, ((status,) if status else ()) + (limit,)).fetchall()
+        return [self._row(r) for r in rows]
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self.db.execute("SELECT status, COUNT(*) n FROM jobs GROUP BY status").fetchall()
+        return {s: 0 for s in STATES} | {r["status"]: r["n"] for r in rows}
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,327 @@
+# modules/job_server.py
+import fcntl, importlib, json, mimetypes, multiprocessing as mp, os, re, shutil, signal, threading, time, traceback
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+from modules.job_queue import JobQueue, JobCancelled
+
+# Runner contract: runner(spec: dict, progress, slot) -> {artifact name: path}
+#   progress(stage, percent=None, message="") records an event and raises
+#   JobCancelled once the job has been cancelled; slot(resource_class) is a
+#   context manager holding one of that class's server-wide slots.
+
+
+def _import(ref: str):
+    """'package.module:attr' → attr."""
+    mod, _, attr = ref.partition(":")
+    return getattr(importlib.import_module(mod), attr)
+
+
+class SlotLeases:
+    """
+    Server-wide stage slots as lock files: <root>/<class>.<k>.lock for k <
+    limit. A stage holds a slot while it holds an flock on one of its class's
+    files. The kernel drops the lock when the holder dies, so a worker killed
+    inside a stage (OOM, segfault) cannot leak the slot. Picklable, so
+    spawned workers get their own copy.
+    """
+    def __init__(self, root: Path, limits: dict):
+        self.root, self.limits = Path(root), dict(limits)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, cls, k) -> Path:
+        return self.root / f"{cls}.{k}.lock"
+
+    def try_acquire(self, cls: str):
+        """An open, locked file holding one of cls's slots, or None if all are taken."""
+        for k in range(self.limits[cls]):
+            f = open(self._path(cls, k), "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except BlockingIOError:
+                f.close()
+        return None
+
+    @contextmanager
+    def hold(self, cls: str, check=None, poll: float = 0.1):
+        """Wait for a slot of `cls` (calling check() about once a second while queued), hold it for the block."""
+        if cls not in self.limits:
+            yield; return
+        waited = 0.0
+        while (f := self.try_acquire(cls)) is None:
+            time.sleep(poll)
+            waited += poll
+            if check is not None and waited >= 1.0:
+                check()
+                waited = 0.0
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def free(self) -> dict:
+        """{class: slots not held right now} (probes the locks)."""
+        out = {}
+        for cls, n in self.limits.items():
+            held = [f for f in (self.try_acquire(cls) for _ in range(n)) if f is not None]
+            out[cls] = len(held)
+            for f in held: f.close()
+        return out
+
+
+def run_one(queue: JobQueue, job: dict, runner, slots: SlotLeases):
+    job_id, t0 = job["id"], time.perf_counter()
+
+    def progress(stage, percent=None, message=""):
+        eta = None
+        if percent is not None and 0 < percent < 100:
+            eta = (time.perf_counter() - t0) * (100 - percent) / percent
+        queue.event(job_id, stage, percent, eta, message)
+        if queue.cancel_requested(job_id):
+            raise JobCancelled(job_id)
+
+    def check_cancel():  # keeps noticing cancels while queued for a slot
+        if queue.cancel_requested(job_id):
+            raise JobCancelled(job_id)
+    slot = lambda cls: slots.hold(cls, check_cancel)
+
+    try:
+        progress("started", 0.0)
+        outputs = runner(job["spec"], progress, slot) or {}
+    except JobCancelled:
+        queue.mark_cancelled(job_id)
+        print(f"[server] job {job_id} cancelled")
+    except (Exception, SystemExit) as e:  # a runner's SystemExit fails the job, not the warm worker
+        queue.fail(job_id, f"{e!r}\n{traceback.format_exc(limit=5)}")
+        print(f"[server] job {job_id} failed: {e!r}")
+    else:
+        queue.complete(job_id, outputs)
+        print(f"[server] job {job_id} done in {time.perf_counter() - t0:.1f}s")
+
+
+def _worker_main(db_path, worker_id, runner_ref, init_ref, slots, stop, poll):
+    """Worker process: loads models lazily and keeps them for every job it runs."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the server decides when to drain
+    if init_ref:
+        _import(init_ref)()
+    runner = _import(runner_ref)
+    queue = JobQueue(db_path)
+    while not stop.is_set():
+        job = queue.claim(worker_id)
+        if job is None:
+            stop.wait(poll)
+            continue
+        print(f"[server] {worker_id} took job {job['id']}")
+        run_one(queue, job, runner, slots)
+    queue.close()
+
+
+# ---------------- stub pipeline for local testing ----------------
+STUB_STAGES = (("asr", "asr"), ("translate", "nllb"), ("tts", "tts"), ("wav2lip", "wav2lip"))
+STUB_LOAD_SEC = 0.5
+
+def _load_stub(model_id, device, compute_type, **opts):
+    time.sleep(STUB_LOAD_SEC)
+    return {"model": model_id, "pid": os.getpid()}
+
+def stub_runner(spec, progress, slot):
+    """
+    Stands in for the pipeline: a fake model per stage (loaded once per worker
+    through the model registry) and `stage_sec` of sleeping in `steps` progress
+    steps. spec["fail_at"] = stage name makes that stage raise.
+    """
+    from modules.model_registry import get_registry
+    reg = get_registry()
+    reg.register("stub", _load_stub)
+    stage_sec, steps = float(spec.get("stage_sec", 0.2)), int(spec.get("steps", 4))
+    for i, (stage, cls) in enumerate(STUB_STAGES):
+        with slot(cls):
+            reg.get("stub", stage)
+            for k in range(1, steps + 1):
+                if spec.get("fail_at") == stage:
+                    raise RuntimeError(f"stub failure in {stage}")
+                time.sleep(stage_sec / steps)
+                progress(stage, 100.0 * (i + k / steps) / len(STUB_STAGES))
+    out = Path(spec.get("out_dir") or "outputs") / f"{spec.get('basename', 'stub')}__stub.txt"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(spec, ensure_ascii=False), encoding="utf-8")
+    return {"output": out}
+
+
+# ---------------- HTTP front end ----------------
+_JOB = re.compile(r"^/jobs/([0-9a-f]+)(?:/(cancel|events|artifacts)(?:/([^/]+))?)?$")
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "DubServer/1"
+    app = None  # JobServer, set per server in JobServer.start()
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _json(self, code, obj):
+        body = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        n = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(n) or b"{}")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        q, app = parse_qs(url.query), self.app
+        if url.path == "/health":
+            return self._json(200, {"draining": app.draining, "workers": app.alive_workers(),
+                                    "jobs": app.queue.counts()})
+        if url.path == "/jobs":
+            return self._json(200, app.queue.list(q.get("status", [None])[0], int(q.get("limit", [100])[0])))
+        m = _JOB.match(url.path)
+        job = m and app.queue.get(m.group(1))
+        if not job:
+            return self._json(404, {"error": "no such job"})
+        action, name = m.group(2), m.group(3)
+        if action is None:
+            return self._json(200, job)
+        if action == "events":
+            return self._json(200, app.queue.events(job["id"], int(q.get("after", [0])[0])))
+        if action == "artifacts" and name is None:
+            return self._json(200, job["outputs"])
+        if action == "artifacts":
+            path = job["outputs"].get(name)
+            if path is None or not Path(path).is_file():
+                return self._json(404, {"error": f"no artifact {name!r}"})
+            self.send_response(200)
+            self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+            self.send_header("Content-Length", str(Path(path).stat().st_size))
+            self.send_header("Content-Disposition", f'attachment; filename="{Path(path).name}"')
+            self.end_headers()
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+            return
+        self._json(405, {"error": "use POST"})
+
+    def do_POST(self):
+        app = self.app
+        if self.path == "/jobs":
+            if app.draining:
+                return self._json(503, {"error": "server is draining"})
+            try:
+                spec = self._body()
+                if app.validate is not None:
+                    app.validate(spec)
+            except (ValueError, TypeError) as e:
+                return self._json(400, {"error": str(e)})
+            job_id = app.queue.submit(spec)
+            return self._json(202, {"id": job_id, "status": "queued"})
+        m = _JOB.match(self.path)
+        if m and m.group(2) == "cancel":
+            status = app.queue.cancel(m.group(1))
+            return self._json(404, {"error": "no such job"}) if status is None else \
+                self._json(200, {"id": m.group(1), "status": status})
+        if self.path == "/drain":
+            app.drain()
+            return self._json(202, {"draining": True})
+        self._json(404, {"error": "not found"})
+
+    def do_DELETE(self):
+        self.path = self.path.rstrip("/") + "/cancel"
+        self.do_POST()
+
+
+class JobServer:
+    """
+    Local dubbing service: a SQLite job queue, `workers` long-lived worker
+    processes that keep their models loaded between jobs, and a small HTTP
+    API on localhost (submit, status, progress events, cancel, artifacts).
+    `slots` caps how many jobs may be inside a stage of each resource class
+    at once, across all workers (e.g. {"wav2lip": 1}).
+
+    drain() (also on SIGINT/SIGTERM or POST /drain) stops accepting jobs, lets
+    running ones finish and leaves queued ones in the database for the next start.
+    """
+    def __init__(self, db_path: Path, runner: str, init: str | None = None, workers: int = 2,
+                 slots: dict | None = None, host: str = "127.0.0.1", port: int = 8765,
+                 poll: float = 0.5, validate=None):
+        self.db_path, self.runner, self.init = Path(db_path), runner, init
+        self.n_workers, self.poll, self.validate = workers, poll, validate
+        self.host, self.port = host, port
+        self.queue = JobQueue(self.db_path)
+        self._ctx = mp.get_context("spawn")  # workers must not inherit the server's threads
+        self.slots = SlotLeases(self.db_path.with_name(self.db_path.name + ".slots"), slots or {})
+        self._stop = self._ctx.Event()
+        self.procs = {}
+        self.draining = False
+        self.httpd = None
+
+    def _spawn(self, i: int):
+        wid = f"w{i}-{os.getpid()}"
+        p = self._ctx.Process(target=_worker_main, name=wid, daemon=True,
+                              args=(str(self.db_path), wid, self.runner, self.init, self.slots, self._stop, self.poll))
+        p.start()
+        self.procs[i] = (wid, p)
+
+    def alive_workers(self) -> int:
+        return sum(p.is_alive() for _, p in self.procs.values())
+
+    def _supervise(self):
+        # a worker that died mid-job (OOM, segfault) fails that job and is replaced;
+        # the kernel already released the stage slots it held (SlotLeases)
+        while not self._stop.wait(1.0):
+            for i, (wid, p) in list(self.procs.items()):
+                if p.is_alive(): continue
+                for job in self.queue.list("running", limit=1000):
+                    if job["worker"] == wid:
+                        self.queue.fail(job["id"], f"worker {wid} exited with code {p.exitcode}")
+                print(f"[server] worker {wid} exited ({p.exitcode}); restarting")
+                self._spawn(i)
+
+    def start(self):
+        n = self.queue.requeue()
+        if n:
+            print(f"[server] requeued {n} job(s) left running by a previous server")
+        for i in range(self.n_workers):
+            self._spawn(i)
+        threading.Thread(target=self._supervise, name="server-supervisor", daemon=True).start()
+        handler = type("Handler", (_Handler,), {"app": self})
+        self.httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self.port = self.httpd.server_address[1]
+        print(f"[server] http://{self.host}:{self.port} with {self.n_workers} workers, slots {self.slots_info()}")
+        return self
+
+    def slots_info(self) -> dict:
+        return self.slots.free()
+
+    def drain(self, timeout: float | None = None):
+        """Stop taking jobs, wait for running ones, then stop the HTTP server (non-blocking)."""
+        if self.draining: return
+        self.draining = True
+        print("[server] draining: finishing running jobs, queued jobs stay queued")
+        def _finish():
+            self._stop.set()
+            for _, p in self.procs.values():
+                p.join(timeout)
+            self.httpd.shutdown()
+        threading.Thread(target=_finish, name="server-drain", daemon=True).start()
+
+    def serve_forever(self):
+        def _on_signal(signum, frame):
+            if self.draining:  # second signal: stop now; running jobs are requeued on next start
+                for _, p in self.procs.values():
+                    p.terminate()
+                os._exit(1)
+            self.drain()
+        signal.signal(signal.SIGINT, _on_signal)
+        signal.signal(signal.SIGTERM, _on_signal)
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            print(f"[server] stopped; jobs: {self.queue.counts()}")
+            self.queue.close()
@@ -1,6 +1,8 @@
 # modules/media.py
 import subprocess, json
 from pathlib import Path
+import numpy as np
+from modules.threads import get_threads
 
 def extract_audio_ffmpeg(video_path: Path, out_dir: Path, sr: int = 16000) -> Path:
     """
@@ -9,7 +11,7 @@ def extract_audio_ffmpeg(video_path: Path, out_dir: Path, sr: int = 16000) -> Pa
     out_dir.mkdir(parents=True, exist_ok=True)
     out_wav = out_dir / f"{video_path.stem}_audio.wav"
     cmd = [
-        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error", *get_threads().ffmpeg_args(),
         "-i", str(video_path),
         "-vn", "-ac", "1", "-ar", str(sr), "-acodec", "pcm_s16le",
         str(out_wav)
@@ -34,3 +36,112 @@ def probe_video_info(video_path: Path) -> dict:
     num, den = (int(x) for x in fps_str.split("/"))
     fps = num / den if den else float(num)
     return {"fps": fps, "w": w, "h": h}
+
+def probe_audio_frames(audio_path: Path, sr: int) -> int:
+    """
+    Number of samples the audio would have at `sr`, read from the file header
+    (soundfile) or container metadata (ffprobe) instead of decoding it.
+    Already-decoded PCMAudio is measured directly.
+    """
+    if isinstance(audio_path, PCMAudio):
+        return int(round(audio_path.frames * sr / audio_path.sr))
+    try:
+        import soundfile as sf
+        info = sf.info(str(audio_path))
+        return int(round(info.frames * sr / info.samplerate))
+    except Exception:
+        pass
+    cmd = [
+        "ffprobe", "-v", "error", "-show_entries", "format=duration",
+        "-of", "json", str(audio_path)
+    ]
+    out = subprocess.check_output(cmd).decode("utf-8", "ignore")
+    return int(round(float(json.loads(out)["format"]["duration"]) * sr))
+
+
+# ---------------- decoded PCM shared between stages ----------------
+class PCMAudio:
+    """
+    Mono float32 samples in [-1, 1] plus their sample rate, decoded once and
+    handed to ASR, the timeline builder and the mel frontend instead of each
+    stage re-reading (and maybe resampling) the file. `samples` may be a
+    read-only memory map.
+    """
+    __slots__ = ("samples", "sr", "path")
+
+    def __init__(self, samples: np.ndarray, sr: int, path: Path | None = None):
+        self.samples, self.sr, self.path = samples, int(sr), path
+
+    @property
+    def frames(self) -> int:
+        return len(self.samples)
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.sr
+
+    def at(self, sr: int) -> np.ndarray:
+        """Samples at `sr`; only resamples when the rate actually differs."""
+        if sr == self.sr: return self.samples
+        import librosa
+        return librosa.resample(np.asarray(self.samples), orig_sr=self.sr, target_sr=sr)
+
+def _ffmpeg_pcm16(src: Path, sr: int) -> np.ndarray:
+    """Decode any media file to mono PCM16 at `sr` through an ffmpeg pipe (no temp file)."""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", *get_threads().ffmpeg_args(),
+        "-i", str(src), "-vn", "-ac", "1", "-ar", str(sr), "-f", "s16le", "pipe:1"
+    ]
+    return np.frombuffer(subprocess.run(cmd, check=True, stdout=subprocess.PIPE).stdout, dtype="<i2")
+
+def _to_float(pcm16: np.ndarray) -> np.ndarray:
+    return pcm16.astype(np.float32) / 32768.0  # same scaling as faster-whisper / soundfile
+
+def _spill(samples: np.ndarray, sr: int, mmap_path: Path) -> np.ndarray:
+    """Write samples to a float32 WAV and return a read-only map of it."""
+    from modules.wavmap import create_wav_memmap, open_wav_memmap
+    mm, _ = create_wav_memmap(mmap_path, len(samples), sr, dtype=np.float32)
+    mm[:] = samples
+    mm.flush(); del mm
+    return open_wav_memmap(mmap_path, mode="r")[0]
+
+def load_pcm(src: Path, sr: int = 16000, mmap_path: Path | None = None) -> PCMAudio:
+    """
+    Decoded mono float32 audio at `sr`. Mono WAVs already at `sr` are mapped
+    in place (float32 without a copy); anything else is decoded by ffmpeg.
+    With `mmap_path`, decoded samples are spilled to a float32 WAV and mapped,
+    so they can be paged out and shared with worker processes.
+    """
+    from modules.wavmap import open_wav_memmap
+    src = Path(src)
+    try:
+        mm, wav_sr = open_wav_memmap(src, mode="r")
+        mapped = wav_sr == sr and mm.ndim == 1
+    except (ValueError, OSError):
+        mapped = False
+    if mapped and mm.dtype == np.float32:
+        return PCMAudio(mm, sr, src)
+    y = _to_float(mm) if mapped else _to_float(_ffmpeg_pcm16(src, sr))
+    return PCMAudio(_spill(y, sr, mmap_path) if mmap_path else y, sr, src)
+
+def extract_audio_pcm(video_path: Path, out_dir: Path, sr: int = 16000, mmap_path: Path | None = None) -> PCMAudio:
+    """
+    Like extract_audio_ffmpeg (same PCM16 WAV on disk), but the decode also
+    stays in memory and is returned as PCMAudio for the downstream stages.
+    """
+    from modules.wavmap import create_wav_memmap
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_wav = out_dir / f"{video_path.stem}_audio.wav"
+    pcm16 = _ffmpeg_pcm16(video_path, sr)
+    mm, _ = create_wav_memmap(out_wav, len(pcm16), sr)
+    mm[:] = pcm16
+    mm.flush(); del mm
+    y = _to_float(pcm16)
+    print("✅ Extracted audio:", out_wav)
+    return PCMAudio(_spill(y, sr, mmap_path) if mmap_path else y, sr, out_wav)
+
+def asr_input(audio):
+    """What to hand faster-whisper: the 16 kHz samples when already decoded, else the path."""
+    if isinstance(audio, PCMAudio):
+        return np.asarray(audio.at(16000), dtype=np.float32)
+    return str(audio)
@@ -0,0 +1,203 @@
+# modules/metrics.py
+import json, os, resource, threading, time
+from contextlib import contextmanager
+from pathlib import Path
+
+from modules.model_registry import _rss_bytes
+
+_local = threading.local()  # .stage: record of the stage running on this thread
+
+
+def count(item: str, n: int = 1):
+    """Add n to a counter (segments, groups, frames, ...) of the stage running on this thread."""
+    rec = getattr(_local, "stage", None)
+    if rec is not None:
+        rec["items"][item] = rec["items"].get(item, 0) + n
+
+def note(**fields):
+    """Attach details (cache hit, sub-stage timings, ...) to the stage running on this thread."""
+    rec = getattr(_local, "stage", None)
+    if rec is not None:
+        rec["detail"].update(fields)
+
+def bind(fn):
+    """
+    fn, counting into the stage running on the calling thread wherever it
+    is later called (an executor thread has no stage of its own).
+    """
+    rec = getattr(_local, "stage", None)
+    def run(*a, **kw):
+        prev, _local.stage = getattr(_local, "stage", None), rec
+        try:
+            return fn(*a, **kw)
+        finally:
+            _local.stage = prev
+    return run
+
+def read_detail(path: Path, prefix: str = ""):
+    """Merge a metrics JSON written by a subprocess (inference.py --metrics_json) into the current stage."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return
+    for k, v in data.pop("items", {}).items():
+        count(k, v)
+    note(**{prefix + k: v for k, v in data.items()})
+
+def _children():
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime, ru.ru_maxrss * 1024
+
+
+class RunReport:
+    """
+    Per-stage wall time, CPU time (this process + waited-for subprocesses
+    such as ffmpeg and Wav2Lip), peak RSS (sampled every `sample_sec`), item
+    counters and real-time factor (wall / media duration) for one run.
+    Stages running at the same time share the process, so their CPU and
+    RSS figures overlap; such stages are marked "overlapped".
+    """
+    def __init__(self, name: str, strip: str = "", sample_sec: float = 0.2):
+        self.name, self.strip, self.sample_sec = name, strip, sample_sec
+        self.media_sec = None
+        self.meta = {}
+        self.stages = {}
+        self._active = set()
+        self._lock = threading.Lock()
+        self._sampler = None
+        self.t0 = time.time()
+        self._cpu0 = time.process_time() + _children()[0]
+
+    def _sample(self):
+        while True:
+            time.sleep(self.sample_sec)
+            rss = _rss_bytes()
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                for rec in self._active_recs():
+                    rec["_peak"] = max(rec["_peak"], rss)
+
+    def _active_recs(self):
+        return [self.stages[n] for n in self._active]
+
+    @contextmanager
+    def stage(self, name: str):
+        name = name[len(self.strip):] if self.strip and name.startswith(self.strip) else name
+        rec = {"name": name, "start": time.time() - self.t0, "status": "running", "items": {}, "detail": {},
+               "overlapped": False, "_peak": _rss_bytes()}
+        with self._lock:
+            self.stages[name] = rec
+            if self._active:
+                rec["overlapped"] = True
+                for other in self._active_recs(): other["overlapped"] = True
+            self._active.add(name)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="metrics-rss", daemon=True)
+                self._sampler.start()
+        prev, _local.stage = getattr(_local, "stage", None), rec
+        w0, c0, (cc0, cm0) = time.perf_counter(), time.process_time(), _children()
+        try:
+            yield rec
+            rec["status"] = "done"
+        except BaseException:
+            rec["status"] = "failed"
+            raise
+        finally:
+            cc1, cm1 = _children()
+            rec.update(wall_s=time.perf_counter() - w0, cpu_s=time.process_time() - c0, child_cpu_s=cc1 - cc0,
+                       child_peak_rss_mb=cm1 / 2**20 if cm1 > cm0 else None)
+            _local.stage = prev
+            with self._lock:
+                self._active.discard(name)
+                rec["peak_rss_mb"] = max(rec.pop("_peak"), _rss_bytes()) / 2**20
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            stages = [{k: v for k, v in s.items() if not k.startswith("_")} for s in self.stages.values()]
+        for s in stages:
+            s["rtf"] = s["wall_s"] / self.media_sec if self.media_sec and "wall_s" in s else None
+        ends = [s["start"] + s["wall_s"] for s in stages if "wall_s" in s]
+        wall = max(ends, default=0.0) - min((s["start"] for s in stages), default=0.0)
+        return {
+            "name": self.name, "started": self.t0, "media_sec": self.media_sec, "meta": self.meta,
+            "wall_s": wall, "rtf": wall / self.media_sec if self.media_sec else None,
+            "cpu_s": time.process_time() + _children()[0] - self._cpu0,
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "stages": stages,
+        }
+
+    def write(self, path: Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self.to_dict(), indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+        return path
+
+    def summary(self):
+        print_summary(self.to_dict())
+
+
+def _items(items: dict) -> str:
+    return " ".join(f"{k}={v}" for k, v in items.items())
+
+def print_summary(rep: dict):
+    media = f", media {rep['media_sec']:.1f}s, RTF {rep['rtf']:.2f}" if rep.get("media_sec") else ""
+    print(f"[metrics] {rep['name']}: wall {rep['wall_s']:.1f}s{media}, max RSS {rep['max_rss_mb']:.0f} MB")
+    print(f"[metrics] {'stage':<20}{'wall s':>8}{'cpu s':>8}{'child s':>8}{'RSS MB':>8}{'RTF':>7}  items")
+    for s in rep["stages"]:
+        if "wall_s" not in s: continue
+        rtf = f"{s['rtf']:.2f}" if s.get("rtf") is not None else "-"
+        flag = "*" if s["overlapped"] else " "
+        print(f"[metrics] {s['name'][:19]:<19}{flag}{s['wall_s']:>8.1f}{s['cpu_s']:>8.1f}{s['child_cpu_s']:>8.1f}"
+              f"{s['peak_rss_mb']:>8.0f}{rtf:>7}  {_items(s['items'])}{'' if s['status'] == 'done' else ' ' + s['status']}")
+    if any(s["overlapped"] for s in rep["stages"]):
+        print("[metrics] * ran alongside other stages; CPU/RSS are shared with them")
+
+
+# ---------------- aggregation across runs (a batch, a benchmark series) ----------------
+def stage_kind(name: str) -> str:
+    """'translate:hindi' → 'translate', 'wav2lip:hindi#3' → 'wav2lip_shard'."""
+    kind = name.split(":")[0]
+    return kind + "_shard" if "#" in name else kind
+
+def _pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(q / 100 * (len(xs) - 1))))] if xs else None
+
+def aggregate(reports) -> dict:
+    """Per stage kind over many reports: runs, wall/RTF percentiles, CPU and item totals, RSS max."""
+    by = {}
+    for rep in reports:
+        for s in rep["stages"]:
+            if s.get("status") != "done": continue
+            a = by.setdefault(stage_kind(s["name"]), {"runs": 0, "wall": [], "rtf": [], "cpu_s": 0.0,
+                                                      "peak_rss_mb": 0.0, "items": {}})
+            a["runs"] += 1
+            a["wall"].append(s["wall_s"])
+            if s.get("rtf") is not None: a["rtf"].append(s["rtf"])
+            a["cpu_s"] += s["cpu_s"] + s["child_cpu_s"]
+            a["peak_rss_mb"] = max(a["peak_rss_mb"], s["peak_rss_mb"], s.get("child_peak_rss_mb") or 0)
+            for k, v in s["items"].items():
+                a["items"][k] = a["items"].get(k, 0) + v
+    stages = {}
+    for kind, a in by.items():
+        stages[kind] = {"runs": a["runs"], "wall_total_s": sum(a["wall"]), "wall_p50_s": _pct(a["wall"], 50),
+                        "wall_p95_s": _pct(a["wall"], 95), "rtf_p50": _pct(a["rtf"], 50), "rtf_p95": _pct(a["rtf"], 95),
+                        "cpu_s": a["cpu_s"], "peak_rss_mb": a["peak_rss_mb"], "items": a["items"]}
+    media = sum(r.get("media_sec") or 0 for r in reports)
+    wall = sum(r["wall_s"] for r in reports)
+    return {"runs": len(reports), "media_sec": media, "wall_s": wall,
+            "rtf": wall / media if media else None, "stages": stages}
+
+def print_aggregate(agg: dict):
+    rtf = f", RTF {agg['rtf']:.2f}" if agg.get("rtf") else ""
+    print(f"[metrics] {agg['runs']} runs: {agg['wall_s']:.1f}s wall (summed) for {agg['media_sec']:.1f}s of media{rtf}")
+    print(f"[metrics] {'stage':<16}{'runs':>5}{'total s':>9}{'p50 s':>8}{'p95 s':>8}{'RTF p50':>8}{'cpu s':>9}{'RSS MB':>8}  items")
+    for kind, s in sorted(agg["stages"].items(), key=lambda kv: -kv[1]["wall_total_s"]):
+        rtf = f"{s['rtf_p50']:.2f}" if s["rtf_p50"] is not None else "-"
+        print(f"[metrics] {kind:<16}{s['runs']:>5}{s['wall_total_s']:>9.1f}{s['wall_p50_s']:>8.1f}{s['wall_p95_s']:>8.1f}"
+              f"{rtf:>8}{s['cpu_s']:>9.1f}{s['peak_rss_mb']:>8.0f}  {_items(s['items'])}")
@@ -0,0 +1,167 @@
+# modules/model_registry.py
+import os, sys, threading, time
+from collections import OrderedDict
+from pathlib import Path
+
+W2L_DIR = Path(__file__).resolve().parents[1] / "Wav2Lip"
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+def _torch_bytes(model) -> int:
+    m = getattr(model, "model", model)  # NLLBTranslator wraps its torch module
+    if not hasattr(m, "parameters"): return 0
+    return sum(t.numel() * t.element_size() for t in list(m.parameters()) + list(m.buffers()))
+
+
+# ---- built-in loaders: (model_id, device, compute_type, **opts) -> model ----
+def _load_whisper(model_id, device, compute_type, **opts):
+    from faster_whisper import WhisperModel
+    from modules.threads import get_threads
+    if not opts.get("cpu_threads"):  # 0 = the loading stage's thread share (ctranslate2 pools are fixed at load)
+        opts["cpu_threads"] = get_threads().threads()
+    return WhisperModel(model_id, device=device, compute_type=compute_type, **opts)
+
+def _warm_whisper(model):
+    import numpy as np
+    list(model.transcribe(np.zeros(16000, dtype=np.float32), beam_size=1)[0])
+
+def _load_nllb(model_id, device, compute_type, **opts):
+    from modules.translate_nllb import NLLBTranslator
+    return NLLBTranslator(device=device, backend=compute_type, **opts)
+
+def _warm_nllb(tr):
+    tr.translate_texts(["Hello."], "fra_Latn", beams=1, max_new=8)
+
+def import_wav2lip_inference():
+    """Import Wav2Lip/inference.py as a module (its CLI args are only parsed under __main__)."""
+    if str(W2L_DIR) not in sys.path:
+        sys.path.insert(0, str(W2L_DIR))
+    import inference
+    return inference
+
+def _load_wav2lip(model_id, device, compute_type, **opts):
+    inf = import_wav2lip_inference()
+    inf.device = device
+    return inf.load_model(model_id)
+
+def _warm_wav2lip(model):
+    import torch
+    dev = next(model.parameters()).device
+    with torch.no_grad():
+        model(torch.zeros(1, 1, 80, 16, device=dev), torch.zeros(1, 6, 96, 96, device=dev))
+
+
+def _opts_key(opts) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in opts.items()))
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models keyed by (kind, model id, device, compute type)
+    plus any extra loader options (e.g. Whisper's cpu_threads).
+    Models load lazily on first get(), stay resident, and the least recently
+    used ones are dropped once the estimated resident size exceeds ram_budget_mb.
+    """
+    def __init__(self, ram_budget_mb: float | None = None):
+        self.budget = ram_budget_mb * 2**20 if ram_budget_mb else None
+        self._models = OrderedDict()  # key -> {"model", "bytes", "load_s", "hits"}
+        self._kinds = {}
+        self._lock = threading.RLock()
+        self._loading = {}  # key -> Lock, so concurrent callers load a model once
+        self.register("whisper", _load_whisper, _warm_whisper)
+        self.register("nllb", _load_nllb, _warm_nllb)
+        self.register("wav2lip", _load_wav2lip, _warm_wav2lip)
+
+    def register(self, kind: str, loader, warmup=None):
+        self._kinds[kind] = (loader, warmup)
+
+    def get(self, kind, model_id, device="cpu", compute_type="default", **opts):
+        key = (kind, str(model_id), device, compute_type, _opts_key(opts))
+        with self._lock:
+            ent = self._models.get(key)
+            if ent is not None:
+                self._models.move_to_end(key)
+                ent["hits"] += 1
+                return ent["model"]
+            gate = self._loading.setdefault(key, threading.Lock())
+        with gate:
+            with self._lock:
+                if key in self._models:
+                    return self.get(kind, model_id, device, compute_type, **opts)
+            loader, _ = self._kinds[kind]
+            rss0, t0 = _rss_bytes(), time.perf_counter()
+            model = loader(str(model_id), device, compute_type, **opts)
+            load_s = time.perf_counter() - t0
+            size = _torch_bytes(model) or max(0, _rss_bytes() - rss0)
+            print(f"[models] loaded {kind}:{model_id} ({device}/{compute_type}) "
+                  f"in {load_s:.1f}s, ~{size / 2**20:.0f} MB")
+            with self._lock:
+                self._models[key] = {"model": model, "bytes": size, "load_s": load_s, "hits": 0}
+                self._loading.pop(key, None)
+                self._evict(keep=key)
+            return model
+
+    def _evict(self, keep=None):
+        if self.budget is None: return
+        while sum(e["bytes"] for e in self._models.values()) > self.budget:
+            victim = next((k for k in self._models if k != keep), None)
+            if victim is None: break
+            ent = self._models.pop(victim)
+            print(f"[models] evicted {victim[0]}:{victim[1]} (~{ent['bytes'] / 2**20:.0f} MB, LRU)")
+
+    def warmup(self, kind, model_id, device="cpu", compute_type="default", **opts):
+        """Load (if needed) and run one tiny inference so first real calls skip lazy init."""
+        model = self.get(kind, model_id, device, compute_type, **opts)
+        warm = self._kinds[kind][1]
+        if warm is not None:
+            t0 = time.perf_counter()
+            warm(model)
+            print(f"[models] warmed {kind}:{model_id} in {time.perf_counter() - t0:.1f}s")
+        return model
+
+    def preload(self, specs, warm=True):
+        """specs: iterable of (kind, model_id, device, compute_type) tuples."""
+        for spec in specs:
+            (self.warmup if warm else self.get)(*spec)
+
+    def evict(self, kind, model_id, device="cpu", compute_type="default", **opts):
+        with self._lock:
+            self._models.pop((kind, str(model_id), device, compute_type, _opts_key(opts)), None)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def stats(self) -> list:
+        with self._lock:
+            return [{"kind": k[0], "model_id": k[1], "device": k[2], "compute_type": k[3],
+                     "mb": e["bytes"] / 2**20, "load_s": e["load_s"], "hits": e["hits"]}
+                    for k, e in self._models.items()]
+
+    def report(self):
+        for s in self.stats():
+            print(f"[models] {s['kind']}:{s['model_id']} ({s['device']}/{s['compute_type']}) "
+                  f"~{s['mb']:.0f} MB, load {s['load_s']:.1f}s, reused {s['hits']}x")
+
+
+_REGISTRY = None
+_REGISTRY_LOCK = threading.Lock()
+
+def configure_registry(ram_budget_mb: float | None = None) -> ModelRegistry:
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        _REGISTRY = ModelRegistry(ram_budget_mb)
+        return _REGISTRY
+
+def get_registry() -> ModelRegistry:
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = ModelRegistry()
+        return _REGISTRY
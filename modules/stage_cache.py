@@ -0,0 +1,142 @@
+# modules/stage_cache.py
+import hashlib, json, os, tempfile, threading, time
+from pathlib import Path
+
+from modules import metrics
+
+_BLOCK = 1 << 20
+
+
+def _atomic_json(path: Path, obj):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+class StageCache:
+    """
+    Decides whether a pipeline stage has to run. A stage's key is sha1 over
+    its name, the content digests of its input files and its parameters;
+    <root>/<stage>/<key>.json records the digests of the outputs it produced.
+    A stage is skipped when a record exists for its key and every output
+    still has the recorded content. A changed input or parameter therefore
+    reruns that stage, and its new outputs change the keys of everything
+    downstream of it.
+
+    File digests are memoized by (size, mtime) in <root>/digests.json, so
+    unchanged large files (videos, checkpoints) are hashed once. One instance
+    may be shared by stages running on several threads.
+    """
+    def __init__(self, root: Path, force=(), enabled: bool = True):
+        self.root = Path(root)
+        self.force = set(force)
+        self.enabled = enabled
+        self._memo_path = self.root / "digests.json"
+        self._lock = threading.Lock()
+        try:
+            with open(self._memo_path, encoding="utf-8") as f:
+                self._memo = json.load(f)
+        except (OSError, ValueError):
+            self._memo = {}
+
+    def digest(self, path: Path) -> str:
+        path = Path(path).resolve()
+        st = path.stat()
+        ent = self._memo.get(str(path))
+        if ent and ent[0] == st.st_size and ent[1] == st.st_mtime_ns:
+            return ent[2]
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            while block := f.read(_BLOCK):
+                h.update(block)
+        with self._lock:
+            self._memo[str(path)] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def key(self, stage: str, inputs: dict, params: dict) -> str:
+        """inputs: {name: Path (hashed by content) or plain value}; params: JSON-able settings."""
+        ins = {k: ("sha1:" + self.digest(v)) if isinstance(v, Path) else v for k, v in inputs.items()}
+        blob = json.dumps({"stage": stage, "inputs": ins, "params": params}, sort_keys=True, default=str)
+        return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+    def _record_path(self, stage: str, key: str) -> Path:
+        return self.root / stage / f"{key}.json"
+
+    def _produced(self, stage: str, name: str, digest: str) -> bool:
+        """Whether any recorded run of the stage wrote this content as output `name`."""
+        for rp in (self.root / stage).glob("*.json"):
+            try:
+                with open(rp, encoding="utf-8") as f:
+                    if json.load(f)["outputs"].get(name) == digest:
+                        return True
+            except (OSError, ValueError, KeyError):
+                continue
+        return False
+
+    def fresh(self, stage: str, key: str, outputs: dict, keep_edited: bool = False) -> bool:
+        """
+        With keep_edited, an output whose content no run of the stage produced
+        counts as edited by hand and is kept (the stage is treated as fresh).
+        """
+        try:
+            with open(self._record_path(stage, key), encoding="utf-8") as f:
+                rec = json.load(f)["outputs"]
+        except (OSError, ValueError, KeyError):
+            return False
+        edited = []
+        for name, p in outputs.items():
+            p = Path(p)
+            if not p.exists():
+                return False
+            d = self.digest(p)
+            if rec.get(name) == d:
+                continue
+            if not keep_edited or name not in rec or self._produced(stage, name, d):
+                return False
+            edited.append(str(p))
+        if edited:
+            print(f"[cache] {stage}: {', '.join(edited)} edited since it was written, kept")
+        return True
+
+    def _save_memo(self):
+        with self._lock:
+            _atomic_json(self._memo_path, self._memo)
+
+    def up_to_date(self, stage: str, inputs: dict, params: dict, outputs: dict, keep_edited: bool = False) -> bool:
+        """Whether run() would skip the stage (e.g. to batch only the stale ones of several)."""
+        if not self.enabled or stage in self.force or "all" in self.force:
+            return False
+        return self.fresh(stage, self.key(stage, inputs, params), outputs, keep_edited)
+
+    def run(self, stage: str, inputs: dict, params: dict, outputs: dict, fn, keep_edited: bool = False) -> bool:
+        """
+        Run fn() unless the stage is up to date; record its outputs afterwards.
+        Returns True when the stage was skipped. keep_edited: see fresh().
+        """
+        if not self.enabled:
+            fn()
+            return False
+        key = self.key(stage, inputs, params)
+        if stage not in self.force and "all" not in self.force and self.fresh(stage, key, outputs, keep_edited):
+            print(f"[cache] {stage}: up to date ({key[:12]}), skipped")
+            metrics.note(**{f"{stage}_cache": "hit"})
+            self._save_memo()
+            return True
+        t0 = time.perf_counter()
+        fn()
+        missing = [str(p) for p in outputs.values() if not Path(p).exists()]
+        if missing:
+            raise FileNotFoundError(f"stage {stage} did not produce: {', '.join(missing)}")
+        _atomic_json(self._record_path(stage, key), {
+            "stage": stage, "params": params, "created": time.time(),
+            "seconds": time.perf_counter() - t0,
+            "outputs": {name: self.digest(p) for name, p in outputs.items()},
+        })
+        self._save_memo()
+        return False
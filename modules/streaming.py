@@ -0,0 +1,216 @@
+# modules/streaming.py
+import asyncio, json, threading, time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from pathlib import Path
+
+from modules import metrics, threads
+from modules.media import asr_input, probe_audio_frames
+from modules.tts_edge import (
+    _splits_before, _group_entry, _synth_exact, _timeline_params, _save_manifest,
+    manifest_path, pick_edge_voice,
+)
+from modules.tts_scheduler import get_scheduler
+from modules.voice_catalog import VoiceCatalog
+from modules.wavmap import create_wav_memmap, write_samples
+
+_END = object()  # end-of-stream marker passed down every queue
+
+
+class _Stopped(Exception):
+    """The consumers are gone (a later stage failed); the ASR thread should quit."""
+
+def _asr_producer(model, audio_wav, q, loop, kw, stop: threading.Event):
+    """
+    Runs in a worker thread: pushes faster-whisper segments as they are
+    decoded. Blocks while q is full, but gives up (and stops transcribing)
+    once `stop` is set, since nobody will drain q any more.
+    """
+    def put(item):
+        fut = asyncio.run_coroutine_threadsafe(q.put(item), loop)
+        while True:
+            try:
+                return fut.result(timeout=0.2)
+            except FutureTimeout:
+                if stop.is_set():
+                    fut.cancel()
+                    raise _Stopped()
+    try:
+        segments, _ = model.transcribe(asr_input(audio_wav), vad_filter=True, **kw)
+        for seg in segments:
+            if stop.is_set(): raise _Stopped()
+            put({"start": float(seg.start), "end": float(seg.end), "text": seg.text.strip()})
+    except _Stopped:
+        return
+    finally:
+        if not stop.is_set():
+            try:
+                put(_END)
+            except _Stopped:
+                pass
+
+async def _run_stages(*stages):
+    """
+    Run the stages together. The first one to fail cancels the others (so
+    none is left blocked on a queue nobody drains) and its error is raised.
+    """
+    tasks = [asyncio.ensure_future(s) for s in stages]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for t in tasks:
+            if not t.done(): t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    for t in tasks:
+        if not t.cancelled() and t.exception() is not None:
+            raise t.exception()
+
+async def _translate_stage(in_q, out_q, ex, translate, max_batch, max_wait):
+    """Micro-batches segments: up to max_batch, or whatever arrived max_wait s after the first."""
+    loop = asyncio.get_running_loop()
+    done = False
+    while not done:
+        item = await in_q.get()
+        if item is _END: break
+        batch, deadline = [item], loop.time() + max_wait
+        while len(batch) < max_batch:
+            try:
+                item = await asyncio.wait_for(in_q.get(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                break
+            if item is _END:
+                done = True; break
+            batch.append(item)
+        res = await loop.run_in_executor(ex, translate, [b["text"] for b in batch])
+        for b, t in zip(batch, res):
+            await out_q.put({"start": b["start"], "end": b["end"], "src": b["text"], "tgt": t})
+    await out_q.put(_END)
+
+async def _group_stage(in_q, out_q, asr, trs, total_sec, sr_out, gap_split, left_borrow, right_borrow, borrow_frac):
+    """
+    Emits a group as soon as its right boundary is known, i.e. when the first
+    segment of the next group arrives (same rule as build_dubbed_timeline).
+    """
+    cur, prev_end = [], 0.0
+    entry = lambda g, nxt: _group_entry(asr, trs, g, prev_end, nxt, sr_out, left_borrow, right_borrow, borrow_frac)
+    while (seg := await in_q.get()) is not _END:
+        i = len(asr)
+        metrics.count("segments")
+        asr.append({"start": seg["start"], "end": seg["end"], "text": seg["src"]})
+        trs.append(seg)
+        if cur and _splits_before(asr[i-1], asr[i], gap_split):
+            await out_q.put(entry(cur, asr[i]["start"]))
+            prev_end, cur = asr[cur[-1]]["end"], []
+        cur.append(i)
+    if cur:
+        await out_q.put(entry(cur, total_sec))
+    await out_q.put(_END)
+
+async def _tts_stage(in_q, pending_q, voice, sr_synth, sr_out):
+    # pending_q is bounded, so at most its maxsize syntheses are in flight
+    spawned = []
+    try:
+        while (g := await in_q.get()) is not _END:
+            task = asyncio.create_task(_synth_exact(g["text"], voice, target_sec=g["target"],
+                                                    sr_synth=sr_synth, sr_out=sr_out))
+            spawned.append(task)
+            await pending_q.put((g, task))
+        await pending_q.put(_END)
+    except asyncio.CancelledError:
+        # syntheses _place_stage will never await
+        for t in spawned:
+            t.cancel()
+        await asyncio.gather(*spawned, return_exceptions=True)
+        raise
+
+async def _place_stage(pending_q, timeline, groups, voice, t0):
+    # groups are written strictly in order: later groups overwrite any overlap
+    while (item := await pending_q.get()) is not _END:
+        g, task = item
+        y = await task
+        write_samples(timeline, g["offset"], y)
+        timeline.flush()
+        groups.append({k: g[k] for k in ("first", "last", "text_sha1", "S", "E", "offset")}
+                      | {"voice": voice, "length": len(y)})
+        metrics.count("groups")
+        if len(groups) == 1:
+            print(f"[stream] first dubbed audio after {time.perf_counter() - t0:.1f}s")
+        print(f"[TTS] Group {len(groups)} [{g['S']:.2f}-{g['E']:.2f}] {g['last']-g['first']+1} segs")
+
+
+async def stream_dub(
+    audio_wav: Path, asr_json: Path, trans_json: Path, out_wav: Path,
+    tgt_code: str, locale_prefix: str, preferred_voice: str|None,
+    model_size="small", device="cpu", compute_type="default", asr_kwargs: dict|None = None,
+    tm_path: Path|None = None, backend="torch", ct2_dir=None, decode=None,
+    sr_synth=24000, sr_out=16000, catalog: VoiceCatalog|None = None,
+    max_batch=8, max_wait=0.5, queue_size=16, tts_concurrency=2,
+    gap_split=0.35, left_borrow=0.40, right_borrow=0.60, borrow_frac=0.85,
+):
+    """
+    ASR → translation → TTS at segment granularity, linked by bounded asyncio
+    queues (backpressure): segments from faster-whisper's generator go straight
+    into a translation micro-batcher, groups are synthesized as soon as their
+    boundaries are known, and audio lands in the memory-mapped dub wav.
+    Writes the same asr_json, trans_json, dub wav and timeline manifest as the
+    staged pipeline, so later incremental re-dubs work unchanged.
+    """
+    from modules.model_registry import get_registry
+    from modules.translate_nllb import _LazyTranslator, _translate_unique
+    from modules.translation_memory import TranslationMemory
+
+    t0 = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    n_samples = probe_audio_frames(audio_wav, sr_out)
+    params = _timeline_params(sr_synth, sr_out, gap_split, left_borrow, right_borrow, borrow_frac)
+
+    model = get_registry().get("whisper", model_size, device, compute_type)
+    voice = await pick_edge_voice(locale_prefix, preferred_voice, catalog)
+    timeline, _ = create_wav_memmap(out_wav, n_samples, sr_out)
+
+    # translation (and its SQLite connection) stays on one dedicated thread
+    nllb_ex = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream-nllb")
+    tr = _LazyTranslator(backend, ct2_dir)
+    tm = await loop.run_in_executor(nllb_ex, TranslationMemory, tm_path) if tm_path else None
+    # runs on nllb_ex: counters and the thread share still belong to this stage
+    translate = metrics.bind(threads.bind(
+        lambda texts: _translate_unique(tr, texts, [tgt_code], tm=tm, decode=decode)[tgt_code]))
+
+    seg_q, tr_q, grp_q = (asyncio.Queue(queue_size) for _ in range(3))
+    pending_q = asyncio.Queue(max(1, tts_concurrency))
+    asr, trs, groups = [], [], []
+    stop = threading.Event()
+
+    async def _asr_stage():
+        try:
+            await loop.run_in_executor(None, _asr_producer, model, audio_wav, seg_q, loop, asr_kwargs or {}, stop)
+        finally:
+            stop.set()  # cancelled: the thread quits at its next segment instead of transcribing the rest
+
+    try:
+        await _run_stages(
+            _asr_stage(),
+            _translate_stage(seg_q, tr_q, nllb_ex, translate, max_batch, max_wait),
+            _group_stage(tr_q, grp_q, asr, trs, n_samples / sr_out, sr_out,
+                         gap_split, left_borrow, right_borrow, borrow_frac),
+            _tts_stage(grp_q, pending_q, voice, sr_synth, sr_out),
+            _place_stage(pending_q, timeline, groups, voice, t0),
+        )
+    finally:
+        stop.set()
+        if tm is not None:
+            await loop.run_in_executor(nllb_ex, tm.close)
+        nllb_ex.shutdown()
+        del timeline
+
+    for path, rows in ((asr_json, asr), (trans_json, trs)):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    _save_manifest(manifest_path(out_wav), {
+        "version": 1, "sr": sr_out, "n_samples": n_samples, "voice": voice, "params": params,
+        "complete": True, "groups": groups,
+        "changed_samples": [[groups[0]["offset"], groups[-1]["offset"] + groups[-1]["length"]]] if groups else [],
+    })
+    get_scheduler().report()
+    print(f"✅ Streamed dub in {time.perf_counter() - t0:.1f}s: {out_wav}")
+    return out_wav
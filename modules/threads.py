@@ -0,0 +1,190 @@
+# modules/threads.py
+import fcntl, itertools, json, os, sys, threading, time
+from contextlib import contextmanager
+from pathlib import Path
+
+_local = threading.local()  # .allot: Allotment of the stage running on this thread
+
+# what subprocesses (Wav2Lip, ...) read to size torch/OpenMP/BLAS and OpenCV pools at start
+THREAD_ENV = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "OPENCV_FOR_THREADS_NUM")
+
+
+def fair_shares(wants: dict, cores: int) -> dict:
+    """
+    Max-min fair split of `cores` among {key: threads wanted}: nobody gets more
+    than it asked for, what the small asks leave over goes to the bigger
+    ones, and every stage gets at least one thread.
+    """
+    shares, left = {}, cores
+    order = sorted(wants, key=lambda k: wants[k])
+    for i, k in enumerate(order):
+        shares[k] = max(1, min(wants[k], left // (len(order) - i)))
+        left = max(0, left - shares[k])
+    return shares
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Allotment:
+    __slots__ = ("key", "name", "want", "threads", "applied")
+
+    def __init__(self, key, name, want):
+        self.key, self.name, self.want = key, name, want
+        self.threads = want
+        self.applied = None  # torch thread count last set on the stage's thread
+
+
+class ThreadBudget:
+    """
+    Gives every running stage an explicit number of CPU threads out of
+    `cores`, instead of torch, OpenCV, ffmpeg and ctranslate2 each starting
+    one thread per core. A stage's share is applied to torch intra-op
+    threads (on its own thread), OpenCV's pool (process-wide: the sum of
+    this process's shares), ffmpeg's -threads, pools sized at model load
+    (faster-whisper cpu_threads, ctranslate2 intra_threads) and, through
+    the environment, to subprocesses.
+
+    With `ledger` (a JSON file on local disk) the stages of every process
+    using the same file are split together: job server and cluster workers,
+    separate CLI runs. Shares are recomputed whenever a stage starts or
+    finishes; a running stage picks up its new share at its next apply()
+    (called between batches), other processes within `poll_sec`.
+    """
+    def __init__(self, cores: int | None = None, ledger: Path | None = None, poll_sec: float = 1.0):
+        self.cores = max(1, cores or os.cpu_count() or 1)
+        self.ledger = Path(ledger) if ledger else None
+        self.poll_sec = poll_sec
+        self._local = {}  # key -> Allotment of this process's running stages
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._polled = 0.0
+        self._cv2 = None
+
+    @contextmanager
+    def _locked(self):
+        self.ledger.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.ledger.with_name(self.ledger.name + ".lock"), "a") as lk:
+            fcntl.flock(lk, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lk, fcntl.LOCK_UN)
+
+    def _rebalance(self, add=None, remove=None):
+        """Update the ledger (if any) and every local stage's share; `add` is an Allotment, `remove` a key."""
+        with self._lock:
+            if add is not None: self._local[add.key] = add
+            if remove is not None: self._local.pop(remove, None)
+            wants = {k: a.want for k, a in self._local.items()}
+            if self.ledger is not None:
+                with self._locked():
+                    try:
+                        shared = json.loads(self.ledger.read_text(encoding="utf-8"))
+                    except (OSError, ValueError):
+                        shared = {}
+                    mine = f"{os.getpid()}:"
+                    # entries of processes that died without cleaning up are dropped
+                    shared = {k: w for k, w in shared.items()
+                              if not k.startswith(mine) and _alive(int(k.split(":")[0]))}
+                    shared.update(wants)
+                    tmp = self.ledger.with_name(f".{self.ledger.name}.{os.getpid()}.tmp")
+                    tmp.write_text(json.dumps(shared), encoding="utf-8")
+                    os.replace(tmp, self.ledger)
+                wants = shared
+            shares = fair_shares(wants, self.cores) if wants else {}
+            for k, a in self._local.items():
+                a.threads = shares[k]
+            self._polled = time.monotonic()
+
+    @contextmanager
+    def allot(self, name: str, want: int = 1):
+        """Register the calling thread's stage for the duration of the block; yields its Allotment."""
+        a = Allotment(f"{os.getpid()}:{next(self._ids)}:{name}", name, max(1, min(int(want), self.cores)))
+        prev, _local.allot = getattr(_local, "allot", None), a
+        self._rebalance(add=a)
+        try:
+            yield a
+        finally:
+            _local.allot = prev
+            self._rebalance(remove=a.key)
+
+    def threads(self) -> int:
+        """The calling stage's current share (all cores outside a stage)."""
+        a = getattr(_local, "allot", None)
+        return a.threads if a is not None else self.cores
+
+    def apply(self) -> int:
+        """
+        Set the calling stage's share on the libraries already imported (torch
+        on this thread, OpenCV for the process) and return it. Cheap enough to
+        call per batch; the ledger is re-read at most every poll_sec.
+        """
+        a = getattr(_local, "allot", None)
+        if a is None:
+            return self.cores
+        if self.ledger is not None and time.monotonic() - self._polled > self.poll_sec:
+            self._rebalance()
+        n = a.threads
+        torch = sys.modules.get("torch")
+        if torch is not None and a.applied != n:
+            torch.set_num_threads(n)
+            a.applied = n
+        cv2 = sys.modules.get("cv2")
+        if cv2 is not None:
+            with self._lock:
+                total = min(self.cores, sum(x.threads for x in self._local.values()))
+            if total != self._cv2:
+                cv2.setNumThreads(total)
+                self._cv2 = total
+        return n
+
+    def ffmpeg_args(self) -> list:
+        """-threads for the codec of the file that follows (an input's decoder, the output's encoder)."""
+        return ["-threads", str(self.threads())]
+
+    def env(self, base: dict | None = None) -> dict:
+        """Environment for a subprocess that should stay within the calling stage's share."""
+        env = dict(os.environ if base is None else base)
+        env.update({k: str(self.threads()) for k in THREAD_ENV})
+        return env
+
+    def snapshot(self) -> dict:
+        """{stage name: threads} of this process's running stages."""
+        with self._lock:
+            return {a.name: a.threads for a in self._local.values()}
+
+
+def bind(fn):
+    """fn, running under the calling stage's allotment wherever it is later called (executor threads)."""
+    a = getattr(_local, "allot", None)
+    def run(*args, **kw):
+        prev, _local.allot = getattr(_local, "allot", None), a
+        try:
+            return fn(*args, **kw)
+        finally:
+            _local.allot = prev
+    return run
+
+
+_BUDGET = None
+_BUDGET_LOCK = threading.Lock()
+
+def configure_threads(cores: int | None = None, ledger: Path | None = None, poll_sec: float = 1.0) -> ThreadBudget:
+    global _BUDGET
+    with _BUDGET_LOCK:
+        _BUDGET = ThreadBudget(cores, ledger, poll_sec)
+        return _BUDGET
+
+def get_threads() -> ThreadBudget:
+    global _BUDGET
+    with _BUDGET_LOCK:
+        if _BUDGET is None:
+            _BUDGET = ThreadBudget()
+        return _BUDGET
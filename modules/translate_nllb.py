@@ -1,10 +1,21 @@
 # modules/translate_nllb.py
 from pathlib import Path
-import json, torch
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+import json, time
+from modules import metrics
+from modules.threads import get_threads
+from modules.translation_memory import TranslationMemory, normalize_text
 
 MODEL_ID = "facebook/nllb-200-distilled-600M"
+MAX_BATCH_TOKENS = 4096  # padded source tokens x beams per generate() call
+MAX_BATCH_SIZE   = 64
 
+# Decoding strategies selectable per job; "beam4" is the original behaviour.
+DECODE_PRESETS = {
+    "beam4":  {"beams": 4, "max_new": 200, "no_repeat_ngram_size": 3},
+    "beam2":  {"beams": 2, "max_new": 200, "no_repeat_ngram_size": 3},
+    "greedy": {"beams": 1, "max_new": 200, "no_repeat_ngram_size": 3},
+}
+BACKENDS = ("torch", "int8", "ct2")  # fp32 torch, dynamic-int8 torch, CTranslate2 int8
 def _get_bos_id(tok, lang_code: str) -> int:
     if hasattr(tok, "lang_code_to_id") and isinstance(tok.lang_code_to_id, dict):
         if lang_code in tok.lang_code_to_id:
@@ -16,35 +27,259 @@ def _get_bos_id(tok, lang_code: str) -> int:
         return bid
     raise ValueError(f"Could not resolve BOS id for {lang_code}")
 
+def resolve_backend(backend: str, ct2_dir: Path | None = None) -> str:
+    """
+    "ct2" needs the ctranslate2 package and a converted model directory
+    (ct2-transformers-converter --model facebook/nllb-200-distilled-600M
+    --output_dir <ct2_dir> --quantization int8); otherwise fall back to "int8".
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown NLLB backend '{backend}', expected one of {BACKENDS}")
+    if backend == "ct2":
+        try:
+            import ctranslate2  # noqa: F401
+            ok = ct2_dir is not None and (Path(ct2_dir) / "model.bin").exists()
+        except ImportError:
+            ok = False
+        if not ok:
+            print(f"[NLLB] CTranslate2 model not available at {ct2_dir}, using int8 torch backend")
+            return "int8"
+    return backend
+
+def model_key(backend: str = "torch") -> str:
+    """Model identity used by the translation memory (fp32 keeps the bare model id)."""
+    return MODEL_ID if backend == "torch" else f"{MODEL_ID}+{backend}"
+
+def _backend_device(backend: str, device: str | None = None) -> str:
+    """Device for `backend`: int8 dynamic quantization (also the ct2 fallback) only runs on CPU."""
+    if backend == "int8":
+        if device not in (None, "cpu"):
+            print(f"[NLLB] int8 backend runs on CPU only, ignoring device '{device}'")
+        return "cpu"
+    if device is None:
+        import torch
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+def _decode_params(decode) -> dict:
+    if decode is None: return dict(DECODE_PRESETS["beam4"])
+    if isinstance(decode, str): return dict(DECODE_PRESETS[decode])
+    return dict(DECODE_PRESETS["beam4"], **decode)
+
 class NLLBTranslator:
-    def __init__(self, device=None):
+    def __init__(self, device=None, backend="torch", ct2_dir=None):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
         self.tok = AutoTokenizer.from_pretrained(MODEL_ID)
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_ID)
-        if device is None:
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = self.model.to(device)
+        self.backend = resolve_backend(backend, ct2_dir)
+        device = _backend_device(self.backend, device)
+        if self.backend == "ct2":
+            import ctranslate2
+            self.model = ctranslate2.Translator(str(ct2_dir), device=device,
+                                                compute_type="int8" if device == "cpu" else "int8_float16",
+                                                intra_threads=get_threads().threads())  # fixed at load
+        else:
+            self.model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_ID)
+            if self.backend == "int8":
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.model = self.model.to(device).eval()
         self.device = device
+        self.model_key = model_key(self.backend)
+        self.degraded = set()  # (tgt_code, index) pairs decoded greedily to meet a latency budget
 
-    def translate_texts(self, texts, tgt_code, beams=4, max_new=200, batch_size=8):
-        out = []
-        bos_id = _get_bos_id(self.tok, tgt_code)
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i+batch_size]
-            enc = self.tok(batch, return_tensors="pt", padding=True, truncation=True, max_length=512).to(self.device)
+    def _decode(self, batch, tgt_code, beams, max_new, no_repeat_ngram_size):
+        if self.backend == "ct2":
+            src = [self.tok.convert_ids_to_tokens(ids)
+                   for ids in self.tok(batch, truncation=True, max_length=512)["input_ids"]]
+            res = self.model.translate_batch(
+                src, target_prefix=[[tgt_code]] * len(src), beam_size=beams,
+                max_decoding_length=max_new, no_repeat_ngram_size=no_repeat_ngram_size
+            )
+            return [self.tok.decode(self.tok.convert_tokens_to_ids(r.hypotheses[0][1:]), skip_special_tokens=True)
+                    for r in res]
+        import torch
+        enc = self.tok(batch, return_tensors="pt", padding=True, truncation=True, max_length=512).to(self.device)
+        with torch.no_grad():
             gen = self.model.generate(
-                **enc, forced_bos_token_id=bos_id, num_beams=beams,
-                max_new_tokens=max_new, no_repeat_ngram_size=3
+                **enc, forced_bos_token_id=_get_bos_id(self.tok, tgt_code), num_beams=beams,
+                max_new_tokens=max_new, no_repeat_ngram_size=no_repeat_ngram_size
             )
-            outs = self.tok.batch_decode(gen, skip_special_tokens=True)
-            out.extend(outs)
+        return self.tok.batch_decode(gen, skip_special_tokens=True)
+
+    def translate_texts(self, texts, tgt_code, beams=4, max_new=200,
+                        batch_size=MAX_BATCH_SIZE, max_tokens=MAX_BATCH_TOKENS,
+                        no_repeat_ngram_size=3, budget_sec=None):
+        """
+        Translate in length-sorted buckets sized by a padded-token budget, so
+        short segments are batched wide and one long segment no longer pads
+        its neighbours. Output is returned in input order.
+
+        budget_sec: if the projected wall time exceeds it, the remaining
+        buckets are decoded greedily (recorded in self.degraded).
+        """
+        out = [None] * len(texts)
+        self.degraded = set()
+        lens = [len(ids) for ids in self.tok(list(texts), truncation=True, max_length=512)["input_ids"]]
+        pace = _Pace(lens, beams, budget_sec)
+        threads = get_threads()
+        for idx in _token_batches(lens, max_tokens // max(1, beams), batch_size):
+            threads.apply()  # picks up a rebalanced share between buckets
+            outs = self._decode([texts[i] for i in idx], tgt_code, pace.beams, max_new, no_repeat_ngram_size)
+            if pace.beams != beams:
+                self.degraded.update((tgt_code, i) for i in idx)
+            for i, t in zip(idx, outs):
+                out[i] = t
+            pace.step(idx)
         return out
 
-def translate_segments(asr_json: Path, tgt_code: str, out_json: Path):
-    with open(asr_json, "r", encoding="utf-8") as f:
-        segs = json.load(f)
-    texts = [s["text"] for s in segs]
-    tr = NLLBTranslator()
-    trans = tr.translate_texts(texts, tgt_code)
+    def translate_texts_multi(self, texts, tgt_codes, beams=4, max_new=200,
+                              batch_size=MAX_BATCH_SIZE, max_tokens=MAX_BATCH_TOKENS, need=None,
+                              no_repeat_ngram_size=3, budget_sec=None):
+        """
+        Decode several target languages from shared encoder passes: a bucket
+        is encoded once and decoded with each target's forced BOS token.
+        need: optional {code: set of indices} limiting which rows a target decodes.
+        Every target gets the buckets translate_texts would give its rows, so
+        without a latency budget the output equals per-language translate_texts.
+        Returns {code: [translation or None, ...]} in input order.
+        """
+        if self.backend == "ct2":
+            # CTranslate2 translators do not expose encoder outputs; decode per target
+            out, degraded = {}, set()
+            for c in tgt_codes:
+                rows = sorted(need[c]) if need is not None else list(range(len(texts)))
+                res = self.translate_texts([texts[i] for i in rows], c, beams, max_new, batch_size, max_tokens,
+                                           no_repeat_ngram_size, budget_sec)
+                degraded.update((c, rows[i]) for _, i in self.degraded)
+                out[c] = [None] * len(texts)
+                for i, t in zip(rows, res): out[c][i] = t
+            self.degraded = degraded
+            return out
+
+        import torch
+        from transformers.modeling_outputs import BaseModelOutput
+        out = {c: [None] * len(texts) for c in tgt_codes}
+        self.degraded = set()
+        bos = {c: _get_bos_id(self.tok, c) for c in tgt_codes}
+        lens = [len(ids) for ids in self.tok(list(texts), truncation=True, max_length=512)["input_ids"]]
+        # each target is bucketed exactly as translate_texts would bucket its own rows, so its
+        # padding and batch composition (and output) match a per-language run; the encoder
+        # pass is shared by the targets whose buckets come out identical
+        batches, pace = {}, {}
+        for c in tgt_codes:
+            rows = sorted(need[c]) if need is not None else list(range(len(texts)))
+            pace[c] = _Pace([lens[i] for i in rows], beams, budget_sec, index=rows)
+            for b in _token_batches([lens[i] for i in rows], max_tokens // max(1, beams), batch_size):
+                batches.setdefault(tuple(rows[i] for i in b), []).append(c)
+        metrics.count("encoder_batches", len(batches))
+        threads = get_threads()
+        for idx, codes in batches.items():
+            threads.apply()
+            t0 = time.perf_counter()
+            enc = self.tok([texts[i] for i in idx], return_tensors="pt", padding=True, truncation=True,
+                           max_length=512).to(self.device)
+            with torch.no_grad():
+                hidden = self.model.get_encoder()(**enc).last_hidden_state
+            shared = (time.perf_counter() - t0) / len(codes)
+            for c in codes:
+                t0 = time.perf_counter()
+                # generate() expands encoder outputs for beams in place, so hand it a fresh copy
+                with torch.no_grad():
+                    gen = self.model.generate(
+                        encoder_outputs=BaseModelOutput(last_hidden_state=hidden.clone()),
+                        attention_mask=enc["attention_mask"],
+                        forced_bos_token_id=bos[c], num_beams=pace[c].beams,
+                        max_new_tokens=max_new, no_repeat_ngram_size=no_repeat_ngram_size
+                    )
+                if pace[c].beams != beams:
+                    self.degraded.update((c, i) for i in idx)
+                for i, t in zip(idx, self.tok.batch_decode(gen, skip_special_tokens=True)):
+                    out[c][i] = t
+                pace[c].step(idx, shared + time.perf_counter() - t0)
+        return out
+
+class _Pace:
+    """
+    Tracks tokens done vs. elapsed time and drops to greedy decoding once the
+    projected total exceeds the latency budget. `index` maps the caller's row
+    ids to positions in `lens` (default: the same).
+    """
+    def __init__(self, lens, beams, budget_sec, index=None):
+        self.beams, self.budget = beams, budget_sec
+        self.lens = dict(zip(index, lens)) if index is not None else lens
+        self.total, self.done, self.t0, self.spent = max(1, sum(lens)), 0, time.perf_counter(), 0.0
+
+    def step(self, idx, sec=None):
+        """sec: time spent on these rows (several targets share a run); default: wall time since start."""
+        self.done += sum(self.lens[i] for i in idx)
+        self.spent = time.perf_counter() - self.t0 if sec is None else self.spent + sec
+        if not self.budget or self.beams == 1 or self.done >= self.total: return
+        projected = self.spent / self.done * self.total
+        if projected > self.budget:
+            print(f"[NLLB] projected {projected:.1f}s exceeds the {self.budget:.1f}s budget, "
+                  f"decoding the rest greedily")
+            self.beams = 1
+
+def _token_batches(lens, max_tokens, max_batch):
+    """
+    Yield lists of indices, longest first, where len(batch) * longest <= max_tokens.
+    """
+    order = sorted(range(len(lens)), key=lambda i: -lens[i])
+    batch, longest = [], 0
+    for i in order:
+        L = max(1, lens[i])
+        if batch and (len(batch) >= max_batch or (len(batch) + 1) * max(longest, L) > max_tokens):
+            metrics.count("batches")
+            yield batch
+            batch, longest = [], 0
+        batch.append(i); longest = max(longest, L)
+    if batch:
+        metrics.count("batches")
+        yield batch
+
+def _translate_unique(tr, texts, tgt_codes, tm=None, decode=None, budget_sec=None):
+    """
+    Translate each distinct normalized text once per target, reusing the
+    translation memory (if given) across jobs. Several targets share one
+    encoder pass. Returns {code: translations aligned with `texts`}.
+    """
+    params = _decode_params(decode)
+    dec = {"beams": params["beams"], "max_new": params["max_new"],
+           "no_repeat_ngram_size": params["no_repeat_ngram_size"], "budget_sec": budget_sec}
+    norm = [normalize_text(t) for t in texts]
+    uniq = list(dict.fromkeys(n for n in norm if n))
+    known = {c: (tm.get_many(uniq, c, tr.model_key, params) if tm is not None else {}) for c in tgt_codes}
+    todo = {c: [u for u in uniq if u not in known[c]] for c in tgt_codes}
+    if len(tgt_codes) == 1:
+        c = tgt_codes[0]
+        res = tr.translate_texts(todo[c], c, **dec) if todo[c] else []
+        fresh = {c: dict(zip(todo[c], res))}
+        degraded = {c: {todo[c][i] for _, i in tr.degraded}} if todo[c] else {c: set()}
+    else:
+        # in `uniq` order, so each target's rows keep the order translate_texts would see
+        pool = [u for u in uniq if any(u not in known[c] for c in tgt_codes)]
+        pos = {u: i for i, u in enumerate(pool)}
+        need = {c: {pos[u] for u in todo[c]} for c in tgt_codes}
+        res = tr.translate_texts_multi(pool, tgt_codes, need=need, **dec) if pool else {}
+        fresh = {c: {u: res[c][pos[u]] for u in todo[c]} for c in tgt_codes}
+        degraded = {c: {pool[i] for cc, i in (tr.degraded if pool else ()) if cc == c} for c in tgt_codes}
+    out = {}
+    for c in tgt_codes:
+        # greedy fallbacks taken to meet a latency budget are not remembered as full-quality output
+        keep = {u: t for u, t in fresh[c].items() if u not in degraded[c]}
+        if tm is not None and keep:
+            tm.put_many(keep, c, tr.model_key, params)
+        known[c].update(fresh[c])
+        metrics.count("segments", len(texts))
+        metrics.count("tm_hits", len(uniq) - len(todo[c]))
+        metrics.count("translated", len(todo[c]))
+        print(f"[NLLB] {c}: {len(texts)} segments, {len(uniq)} unique, "
+              f"{len(uniq) - len(todo[c])} from translation memory, {len(todo[c])} translated"
+              + (f" ({len(degraded[c])} greedy)" if degraded[c] else ""))
+        out[c] = [known[c].get(n, "") for n in norm]
+    return out
+
+def _write_translation(segs, trans, out_json: Path):
     out = []
     for s, t in zip(segs, trans):
         out.append({"start": float(s["start"]), "end": float(s["end"]), "src": s["text"], "tgt": t})
@@ -53,3 +288,75 @@ def translate_segments(asr_json: Path, tgt_code: str, out_json: Path):
         json.dump(out, f, ensure_ascii=False, indent=2)
     print("✅ Translation saved:", out_json)
     return out_json
+
+def _run_translation(asr_json: Path, tgt_codes, tm_path: Path | None, translator=None,
+                     backend="torch", ct2_dir=None, decode=None, budget_sec=None):
+    with open(asr_json, "r", encoding="utf-8") as f:
+        segs = json.load(f)
+    texts = [s["text"] for s in segs]
+    tm = TranslationMemory(tm_path) if tm_path else None
+    try:
+        tr = translator or _LazyTranslator(backend, ct2_dir)
+        trans = _translate_unique(tr, texts, list(tgt_codes), tm=tm, decode=decode, budget_sec=budget_sec)
+        if tm is not None:
+            st = tm.stats()
+            print(f"[TM] hit rate {st['hit_rate']:.0%} ({st['hits']}/{st['hits'] + st['misses']}), {st['entries']} entries")
+    finally:
+        if tm is not None: tm.close()
+    return segs, trans
+
+def translate_segments(asr_json: Path, tgt_code: str, out_json: Path, tm_path: Path | None = None,
+                       backend="torch", ct2_dir=None, decode=None, budget_sec=None, translator=None):
+    """
+    translator: optional preloaded NLLBTranslator (default: shared model registry).
+    backend: "torch" (fp32), "int8" (dynamic-quantized torch) or "ct2" (CTranslate2).
+    decode:  a DECODE_PRESETS name or a dict overriding beams/max_new/no_repeat_ngram_size.
+    budget_sec: optional latency budget; past it the remaining text is decoded greedily.
+    """
+    segs, trans = _run_translation(asr_json, [tgt_code], tm_path, translator, backend=backend, ct2_dir=ct2_dir,
+                                   decode=decode, budget_sec=budget_sec)
+    return _write_translation(segs, trans[tgt_code], out_json)
+
+def translate_segments_multi(asr_json: Path, tgt_codes, out_dir: Path,
+                             tm_path: Path | None = None, names: dict | None = None,
+                             backend="torch", ct2_dir=None, decode=None, budget_sec=None,
+                             translator=None) -> dict:
+    """
+    Translate one ASR JSON into several languages with a single model load,
+    sharing encoder passes between targets (see translate_texts_multi). Writes
+    <stem>_en_to_<name>.json per target (name from `names`, else the NLLB
+    code), the same as translate_segments would write for that target.
+    Returns {code: out_json}.
+    """
+    stem = asr_json.stem[:-len("_asr")] if asr_json.stem.endswith("_asr") else asr_json.stem
+    segs, trans = _run_translation(asr_json, tgt_codes, tm_path, translator, backend=backend, ct2_dir=ct2_dir,
+                                   decode=decode, budget_sec=budget_sec)
+    names = names or {}
+    return {
+        c: _write_translation(segs, trans[c], Path(out_dir) / f"{stem}_en_to_{names.get(c, c)}.json")
+        for c in tgt_codes
+    }
+
+class _LazyTranslator:
+    """
+    Defers fetching NLLB (from the shared model registry) until something
+    actually misses the translation memory.
+    """
+    def __init__(self, backend="torch", ct2_dir=None):
+        self.backend = resolve_backend(backend, ct2_dir)
+        self.ct2_dir = ct2_dir
+        self.model_key = model_key(self.backend)
+        self._tr = None
+    def _get(self):
+        if self._tr is None:
+            from modules.model_registry import get_registry
+            self._tr = get_registry().get("nllb", MODEL_ID, _backend_device(self.backend), self.backend,
+                                          ct2_dir=self.ct2_dir)
+        return self._tr
+    @property
+    def degraded(self):
+        return self._tr.degraded if self._tr is not None else set()
+    def translate_texts(self, *a, **kw):
+        return self._get().translate_texts(*a, **kw)
+    def translate_texts_multi(self, *a, **kw):
+        return self._get().translate_texts_multi(*a, **kw)
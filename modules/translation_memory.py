@@ -0,0 +1,94 @@
+# modules/translation_memory.py
+import hashlib, json, re, sqlite3, time, unicodedata
+from pathlib import Path
+
+_WS = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """NFC + collapsed whitespace; case and punctuation are kept (they change the translation)."""
+    return _WS.sub(" ", unicodedata.normalize("NFC", text or "")).strip()
+
+
+class TranslationMemory:
+    """
+    Local SQLite store of previous translations keyed by
+    (normalized source, target code, model id, decoding params).
+
+    Least-recently-used rows beyond `max_entries` are evicted, and the file is
+    vacuumed once evictions pile up.
+    """
+    def __init__(self, path: Path, max_entries: int = 200_000, vacuum_after: int = 10_000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries, self.vacuum_after = max_entries, vacuum_after
+        self.db = sqlite3.connect(str(self.path), timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS tm ("
+            " key TEXT PRIMARY KEY, src TEXT, tgt TEXT, tgt_code TEXT, model_id TEXT,"
+            " params TEXT, hits INTEGER DEFAULT 0, created REAL, used REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS tm_used ON tm(used)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v INTEGER)")
+        self.db.commit()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def _key(src: str, tgt_code: str, model_id: str, params: str) -> str:
+        return hashlib.sha1("\x1f".join((src, tgt_code, model_id, params)).encode("utf-8")).hexdigest()
+
+    def get_many(self, srcs, tgt_code: str, model_id: str, params: dict) -> dict:
+        """Look up normalized sources; returns {src: tgt} for the hits."""
+        p = json.dumps(params, sort_keys=True)
+        keys = {self._key(s, tgt_code, model_id, p): s for s in srcs}
+        found = {}
+        ks = list(keys)
+        for i in range(0, len(ks), 500):  # stay under SQLite's host-parameter limit
+            chunk = ks[i:i+500]
+            q = f"SELECT key, tgt FROM tm WHERE key IN ({','.join('?'*len(chunk))})"
+            for k, tgt in self.db.execute(q, chunk):
+                found[keys[k]] = tgt
+        now = time.time()
+        self.db.executemany("UPDATE tm SET hits = hits + 1, used = ? WHERE key = ?",
+                            [(now, self._key(s, tgt_code, model_id, p)) for s in found])
+        self.db.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, pairs: dict, tgt_code: str, model_id: str, params: dict):
+        p = json.dumps(params, sort_keys=True)
+        now = time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO tm (key, src, tgt, tgt_code, model_id, params, hits, created, used)"
+            " VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?)",
+            [(self._key(s, tgt_code, model_id, p), s, t, tgt_code, model_id, p, now, now)
+             for s, t in pairs.items()])
+        self.db.commit()
+        self.evict()
+
+    def evict(self) -> int:
+        """Drop least-recently-used rows above max_entries; VACUUM every `vacuum_after` deletions."""
+        n = self.db.execute("SELECT COUNT(*) FROM tm").fetchone()[0]
+        extra = n - self.max_entries
+        if extra <= 0: return 0
+        self.db.execute("DELETE FROM tm WHERE key IN (SELECT key FROM tm ORDER BY used LIMIT ?)", (extra,))
+        self.db.execute("INSERT INTO meta (k, v) VALUES ('evicted', ?) "
+                        "ON CONFLICT(k) DO UPDATE SET v = v + excluded.v", (extra,))
+        self.db.commit()
+        if self.db.execute("SELECT v FROM meta WHERE k = 'evicted'").fetchone()[0] >= self.vacuum_after:
+            self.vacuum()
+        return extra
+
+    def vacuum(self):
+        self.db.execute("UPDATE meta SET v = 0 WHERE k = 'evicted'")
+        self.db.commit()
+        self.db.execute("VACUUM")
+
+    def stats(self) -> dict:
+        n = self.db.execute("SELECT COUNT(*) FROM tm").fetchone()[0]
+        total = self.hits + self.misses
+        return {"entries": n, "hits": self.hits, "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0}
+
+    def close(self):
+        self.db.close()
@@ -1,8 +1,14 @@
 # modules/tts_edge.py
-import asyncio, uuid, os, numpy as np, librosa, soundfile as sf, edge_tts, json
+import uuid, os, hashlib, numpy as np, json
 from pathlib import Path
+from modules import metrics
+from modules.tts_scheduler import get_scheduler
+from modules.voice_catalog import VoiceCatalog, load_voice_catalog
+from modules.media import probe_audio_frames
+from modules.wavmap import create_wav_memmap, open_wav_memmap, write_samples
 
 def _trim(y, top_db=40): 
+    import librosa
     yt, _ = librosa.effects.trim(y, top_db=top_db); 
     return yt
 
@@ -17,21 +23,26 @@ def _micro_stretch(y, sr, target_sec, cap=0.12):
     if target_sec <= 0: return np.zeros(0, dtype=np.float32)
     ratio = cur/target_sec
     if abs(1.0 - ratio) <= cap:
+        import librosa
         return librosa.effects.time_stretch(y, rate=ratio)
     return y
 
-async def _edge_say_to_array(text, voice, rate_pct=0, sr=24000, retries=3):
+async def _edge_save(text, voice, rate_pct, path):
+    import edge_tts
+    await edge_tts.Communicate(text=text, voice=voice, rate=f"{int(rate_pct):+d}%").save(path)
+
+async def _edge_say_to_array(text, voice, rate_pct=0, sr=24000, retries=None):
     if not text.strip(): return np.zeros(0, dtype=np.float32)
-    err = None
-    for k in range(1, retries+1):
-        try:
-            tmp = f"_edge_{uuid.uuid4().hex}.mp3"
-            await edge_tts.Communicate(text=text, voice=voice, rate=f"{int(rate_pct):+d}%").save(tmp)
-            y, _ = librosa.load(tmp, sr=sr, mono=True); os.remove(tmp)
-            return y.astype(np.float32)
-        except Exception as e:
-            err = e; await asyncio.sleep(0.3*k)
-    raise err
+    tmp = f"_edge_{uuid.uuid4().hex}.mp3"
+    try:
+        # rate limiting, backoff and the circuit breaker live in the shared scheduler
+        await get_scheduler().run(voice, lambda: _edge_save(text, voice, rate_pct, tmp), retries=retries)
+        metrics.count("tts_requests")
+        import librosa
+        y, _ = librosa.load(tmp, sr=sr, mono=True)
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
+    return y.astype(np.float32)
 
 async def _synth_exact(text, voice, target_sec, sr_synth=24000, sr_out=16000, rate_cap=30):
     if not text.strip() or target_sec <= 0:
@@ -43,6 +54,7 @@ async def _synth_exact(text, voice, target_sec, sr_synth=24000, sr_out=16000, ra
     y2 = _trim(y2)
     y2 = _micro_stretch(y2, sr_synth, target_sec, cap=0.12)
     if sr_synth != sr_out:
+        import librosa
         y2 = librosa.resample(y2, orig_sr=sr_synth, target_sr=sr_out)
     tgt_n = int(round(target_sec*sr_out))
     if len(y2) > tgt_n: y2 = y2[:tgt_n]
@@ -52,75 +64,212 @@ async def _synth_exact(text, voice, target_sec, sr_synth=24000, sr_out=16000, ra
     if pk > 0: y2 = (y2 / pk) * 0.9
     return y2
 
-async def pick_edge_voice(locale_prefix: str, preferred: str|None):
-    voices = await edge_tts.list_voices()
+async def pick_edge_voice(locale_prefix: str, preferred: str|None, catalog: VoiceCatalog|None = None):
+    if catalog is None:
+        catalog = await load_voice_catalog()
     if preferred:
-        for v in voices:
-            if v.get("ShortName","").lower() == preferred.lower():
-                print(f"[TTS] Using voice: {v['ShortName']}")
-                return v["ShortName"]
+        v = catalog.get(preferred)
+        if v is not None:
+            print(f"[TTS] Using voice: {v['ShortName']}")
+            return v["ShortName"]
         print(f"[TTS] Preferred '{preferred}' not found, auto-picking…")
-    cand = [v for v in voices if v.get("Locale","").lower().startswith(locale_prefix.lower())]
+    cand = list(catalog.by_locale_prefix(locale_prefix))
     if not cand: raise RuntimeError(f"No voices for locale prefix '{locale_prefix}'")
     # Prefer Neural + female
     cand.sort(key=lambda v: (("Neural" not in v.get("ShortName","")), v.get("Gender","")!="Female"))
     print(f"[TTS] Using voice: {cand[0]['ShortName']}")
     return cand[0]["ShortName"]
 
-def _place_overwrite(dst, start_idx, seg):
-    s = int(start_idx); e = min(len(dst), s + len(seg))
-    if s >= len(dst) or e <= 0: return
-    seg_slice = seg[max(0, -s): max(0, -s) + (e - max(0, s))]
-    s = max(0, s); e = s + len(seg_slice)
-    dst[s:e] = seg_slice
-
 def _is_punct_end(txt): return txt.strip().endswith((".", "?", "!"))
 
+def _splits_before(prev, seg, gap_split):
+    """True if `seg` starts a new group after `prev` (long pause or sentence end)."""
+    gap = float(seg["start"]) - float(prev["end"])
+    return (gap > gap_split) or _is_punct_end(prev["text"])
+
+def _group_segments(asr, gap_split):
+    # group segments (sentence-ish)
+    groups, cur = [], [0]
+    for i in range(1, len(asr)):
+        if _splits_before(asr[i-1], asr[i], gap_split):
+            groups.append(cur); cur = [i]
+        else:
+            cur.append(i)
+    groups.append(cur)
+    return groups
+
+def _group_entry(asr, trs, g, prev_end, next_start, sr_out, left_borrow, right_borrow, borrow_frac):
+    """
+    Elastic window [S, E], text and sample offset of one group, given the end
+    of the previous group and the start of the next one.
+    """
+    s0, e0 = float(asr[g[0]]["start"]), float(asr[g[-1]]["end"])
+    left  = max(0.0, s0 - prev_end)
+    right = max(0.0, next_start - e0)
+    borrowL = min(left_borrow,  left  * borrow_frac)
+    borrowR = min(right_borrow, right * borrow_frac)
+    S = s0 - borrowL; E = e0 + borrowR
+    text = " ".join((trs[i]["tgt"] or "").strip() for i in g).strip()
+    return {
+        "first": g[0], "last": g[-1], "S": S, "E": E, "target": max(0.10, E - S),
+        "text": text, "text_sha1": hashlib.sha1(text.encode("utf-8")).hexdigest(),
+        "offset": int(round(S*sr_out)),
+    }
+
+def _plan_groups(asr, trs, total_sec, sr_out, gap_split, left_borrow, right_borrow, borrow_frac):
+    """
+    Resolve every group to its elastic window [S, E], text and sample offset.
+    """
+    groups = _group_segments(asr, gap_split)
+    def prev_end(idx):  return float(asr[groups[idx-1][-1]]["end"]) if idx>0 else 0.0
+    def next_start(idx):return float(asr[groups[idx+1][0]]["start"]) if idx<len(groups)-1 else total_sec
+    return [
+        _group_entry(asr, trs, g, prev_end(gi), next_start(gi), sr_out, left_borrow, right_borrow, borrow_frac)
+        for gi, g in enumerate(groups)
+    ]
+
+def _timeline_params(sr_synth, sr_out, gap_split, left_borrow, right_borrow, borrow_frac):
+    return {"sr_synth": sr_synth, "sr_out": sr_out, "gap_split": gap_split,
+            "left_borrow": left_borrow, "right_borrow": right_borrow, "borrow_frac": borrow_frac}
+
+def manifest_path(out_wav: Path) -> Path:
+    """Timeline manifest stored next to the dub wav."""
+    return out_wav.with_name(out_wav.stem + ".manifest.json")
+
+def _save_manifest(path: Path, man: dict):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(man, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def _dirty_groups(plan, man, voice, params, n_samples):
+    """
+    Indices of groups that must be (re-)synthesized, or None if the layout
+    changed and the timeline has to be rebuilt from scratch.
+    """
+    if not man or man.get("params") != params or man.get("n_samples") != n_samples:
+        return None
+    old = man.get("groups", [])
+    if len(old) != len(plan): return None
+    for p, o in zip(plan, old):
+        if (p["first"], p["last"], p["offset"]) != (o["first"], o["last"], o["offset"]):
+            return None
+        if abs(p["S"] - o["S"]) > 1e-6 or abs(p["E"] - o["E"]) > 1e-6:
+            return None
+    dirty = {i for i, (p, o) in enumerate(zip(plan, old))
+             if o.get("length") is None or p["text_sha1"] != o["text_sha1"] or o.get("voice") != voice}
+    # groups are laid down in order and later ones overwrite any overlap, so a
+    # rewritten group also forces every later group that overlaps its span
+    for i in range(len(old)):
+        if i in dirty:
+            end = plan[i]["offset"] + int(round(plan[i]["target"]*man["sr"]))
+            for j in range(i+1, len(old)):
+                if old[j]["offset"] >= end: break
+                dirty.add(j)
+    return sorted(dirty)
+
+def _progress_path(out_wav: Path) -> Path:
+    return out_wav.with_name(out_wav.stem + ".progress.jsonl")
+
+def _load_manifest(out_wav: Path):
+    """
+    Manifest plus any per-group journal lines from an interrupted run.
+    """
+    man_path = manifest_path(out_wav)
+    if not (out_wav.exists() and man_path.exists()): return None
+    with open(man_path, "r", encoding="utf-8") as f: man = json.load(f)
+    prog = _progress_path(out_wav)
+    if prog.exists():
+        with open(prog, "r", encoding="utf-8") as f:
+            for line in f:
+                try: rec = json.loads(line)
+                except ValueError: break  # torn last line
+                man["groups"][rec["i"]].update(rec["g"])
+    return man
+
+def _merge_ranges(ranges):
+    out = []
+    for s, e in sorted(ranges):
+        if out and s <= out[-1][1]: out[-1][1] = max(out[-1][1], e)
+        else: out.append([s, e])
+    return out
+
 async def build_dubbed_timeline(
     asr_json: Path, trans_json: Path, orig_audio_wav: Path,
     out_wav: Path, locale_prefix: str, preferred_voice: str|None,
     sr_synth=24000, sr_out=16000,
-    gap_split=0.35, left_borrow=0.40, right_borrow=0.60, borrow_frac=0.85
+    gap_split=0.35, left_borrow=0.40, right_borrow=0.60, borrow_frac=0.85,
+    catalog: VoiceCatalog|None = None, incremental=True
 ):
-    import json
+    """
+    Synthesize the dubbed timeline into a pre-sized, memory-mapped out_wav and
+    record a manifest next to it; each finished group is journaled, so an
+    interrupted run resumes where it stopped.
+    With incremental=True and a matching manifest, only groups whose text/voice
+    changed are re-synthesized and patched into the existing wav in place.
+    Returns out_wav; the changed sample ranges are stored in the manifest.
+    """
     with open(asr_json, "r", encoding="utf-8") as f: asr = json.load(f)
     with open(trans_json, "r", encoding="utf-8") as f: trs = json.load(f)
     assert len(asr) == len(trs), "ASR/translation counts differ"
 
-    orig, _ = librosa.load(str(orig_audio_wav), sr=sr_out, mono=True)
-    timeline = np.zeros_like(orig, dtype=np.float32)
+    # output length from the header; the original audio is never decoded here
+    n_samples = probe_audio_frames(orig_audio_wav, sr_out)
+    params = _timeline_params(sr_synth, sr_out, gap_split, left_borrow, right_borrow, borrow_frac)
+    plan = _plan_groups(asr, trs, n_samples/sr_out, sr_out, gap_split, left_borrow, right_borrow, borrow_frac)
 
-    # group segments (sentence-ish)
-    groups, cur = [], [0]
-    for i in range(1, len(asr)):
-        gap = float(asr[i]["start"]) - float(asr[i-1]["end"])
-        if (gap > gap_split) or _is_punct_end(asr[i-1]["text"]):
-            groups.append(cur); cur = [i]
-        else:
-            cur.append(i)
-    groups.append(cur)
+    voice = await pick_edge_voice(locale_prefix, preferred_voice, catalog)
 
-    # helpers
-    def base_window(g):
-        return float(asr[g[0]]["start"]), float(asr[g[-1]]["end"])
-    def prev_end(idx):  return float(asr[groups[idx-1][-1]]["end"]) if idx>0 else 0.0
-    def next_start(idx):return float(asr[groups[idx+1][0]]["start"]) if idx<len(groups)-1 else len(orig)/sr_out
-
-    voice = await pick_edge_voice(locale_prefix, preferred_voice)
-
-    for gi, g in enumerate(groups, 1):
-        s0, e0 = base_window(g)
-        left  = max(0.0, s0 - prev_end(gi-1))
-        right = max(0.0, next_start(gi-1) - e0)
-        borrowL = min(left_borrow,  left  * borrow_frac)
-        borrowR = min(right_borrow, right * borrow_frac)
-        S = s0 - borrowL; E = e0 + borrowR; target = max(0.10, E - S)
-        text = " ".join((trs[i]["tgt"] or "").strip() for i in g).strip()
-        y = await _synth_exact(text, voice, target_sec=target, sr_synth=sr_synth, sr_out=sr_out)
-        _place_overwrite(timeline, int(round(S*sr_out)), y)
-        print(f"[TTS] Group {gi}/{len(groups)} [{S:.2f}-{E:.2f}] {len(g)} segs")
-
-    out_wav.parent.mkdir(parents=True, exist_ok=True)
-    sf.write(out_wav, timeline.astype(np.float32), sr_out)
+    man = _load_manifest(out_wav) if incremental else None
+    dirty = _dirty_groups(plan, man, voice, params, n_samples) if man else None
+    timeline = None
+    if dirty is not None:
+        timeline, mm_sr = open_wav_memmap(out_wav, mode="r+")
+        if timeline.ndim != 1 or len(timeline) != n_samples or mm_sr != sr_out:
+            dirty, timeline = None, None  # wav on disk no longer matches its manifest
+
+    if dirty is None:
+        todo = list(range(len(plan)))
+        # pre-sized, memory-mapped output: each group lands on disk as it finishes
+        timeline, _ = create_wav_memmap(out_wav, n_samples, sr_out)
+        old = [{} for _ in plan]
+    else:
+        todo = dirty
+        old = man["groups"]
+        print(f"[TTS] Incremental re-dub: {len(todo)}/{len(plan)} groups to synthesize")
+
+    man_path, prog = manifest_path(out_wav), _progress_path(out_wav)
+    metrics.note(groups_total=len(plan))
+    groups = [
+        {k: p[k] for k in ("first", "last", "text_sha1", "S", "E", "offset")}
+        | {"voice": old[i].get("voice"), "length": old[i].get("length")}
+        for i, p in enumerate(plan)
+    ]
+    for i in todo: groups[i]["length"] = None
+    man = {"version": 1, "sr": sr_out, "n_samples": n_samples, "voice": voice, "params": params,
+           "complete": False, "groups": groups}
+    _save_manifest(man_path, man)
+
+    with open(prog, "w", encoding="utf-8") as journal:
+        for gi in todo:
+            p = plan[gi]
+            y = await _synth_exact(p["text"], voice, target_sec=p["target"], sr_synth=sr_synth, sr_out=sr_out)
+            write_samples(timeline, p["offset"], y)
+            timeline.flush()
+            groups[gi].update(voice=voice, text_sha1=p["text_sha1"], length=len(y))
+            journal.write(json.dumps({"i": gi, "g": {"voice": voice, "text_sha1": p["text_sha1"], "length": len(y)}}) + "\n")
+            journal.flush()
+            metrics.count("groups")
+            print(f"[TTS] Group {gi+1}/{len(plan)} [{p['S']:.2f}-{p['E']:.2f}] {p['last']-p['first']+1} segs")
+    del timeline
+
+    changed = _merge_ranges([(plan[i]["offset"], plan[i]["offset"] + groups[i]["length"]) for i in todo])
+    man.update(complete=True, changed_samples=changed)
+    _save_manifest(man_path, man)
+    prog.unlink()
+    if dirty is not None:
+        for s0, e0 in changed:
+            print(f"[TTS] Patched samples {s0}-{e0} ({s0/sr_out:.2f}-{e0/sr_out:.2f}s)")
+    get_scheduler().report()
     print("✅ TTS dubbed wav:", out_wav)
     return out_wav
@@ -0,0 +1,203 @@
+# modules/tts_scheduler.py
+import asyncio, math, random, threading, time
+from collections import defaultdict, deque
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the TTS endpoint has failed too often and calls are short-circuited."""
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens/sec refill, at most `burst` stored.
+    Safe to share between event loops running in different threads.
+    """
+    def __init__(self, rate: float, burst: int, clock=time.monotonic):
+        self.rate, self.burst, self.clock = float(rate), float(burst), clock
+        self.tokens = float(burst)
+        self.stamp = clock()
+        self._lock = threading.Lock()
+
+    def _take(self) -> float:
+        # returns 0 when a token was taken, else seconds to wait for the next one
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0.0
+            return (1.0 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self._take()
+            if wait <= 0: return
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    closed → open after `threshold` consecutive failures; after `reset_after` seconds
+    one probe call is let through (half-open). A success closes it again.
+    """
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0, clock=time.monotonic):
+        self.threshold, self.reset_after, self.clock = threshold, reset_after, clock
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None: return "closed"
+        if self.clock() - self.opened_at >= self.reset_after: return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            st = self.state
+            if st == "closed": return True
+            if st == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures, self.opened_at, self.probing = 0, None, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+            self.probing = False
+
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit: +1/limit per success (≈ +1 per full window),
+    halved on every error, clamped to [min_limit, max_limit].
+    """
+    def __init__(self, min_limit: int = 1, max_limit: int = 8, initial: int | None = None):
+        self.min_limit, self.max_limit = min_limit, max_limit
+        self.limit = float(initial or max(min_limit, max_limit // 2))
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        while True:
+            with self._lock:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+            await asyncio.sleep(0.01)
+
+    def release(self, ok: bool):
+        with self._lock:
+            self.in_flight -= 1
+            if ok:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            else:
+                self.limit = max(self.min_limit, self.limit / 2.0)
+
+
+def _percentile(xs, q):
+    if not xs: return 0.0
+    xs = sorted(xs)
+    k = max(0, min(len(xs) - 1, math.ceil(q / 100.0 * len(xs)) - 1))  # nearest-rank
+    return xs[k]
+
+
+class TTSScheduler:
+    """
+    Process-wide gate in front of the TTS endpoint: token bucket + adaptive
+    concurrency + jittered exponential backoff + circuit breaker, with
+    per-voice latency/error accounting.
+
+    `run(voice, make_call)` takes a zero-arg coroutine factory, so any async
+    callable (the real Edge client or a local fault-injecting stub) can be scheduled.
+    """
+    def __init__(self, rate_per_sec=4.0, burst=8, min_concurrency=1, max_concurrency=6,
+                 retries=5, backoff_base=0.5, backoff_cap=8.0,
+                 breaker_threshold=5, breaker_reset=30.0, clock=time.monotonic):
+        self.bucket = TokenBucket(rate_per_sec, burst, clock=clock)
+        self.limit = AdaptiveLimit(min_concurrency, max_concurrency)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset, clock=clock)
+        self.retries, self.backoff_base, self.backoff_cap = retries, backoff_base, backoff_cap
+        self.clock = clock
+        self._lat = defaultdict(lambda: deque(maxlen=2000))
+        self._ok = defaultdict(int)
+        self._err = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt: int) -> float:
+        # "full jitter": uniform in [0, min(cap, base * 2^(attempt-1))]
+        return random.uniform(0.0, min(self.backoff_cap, self.backoff_base * (2 ** (attempt - 1))))
+
+    async def run(self, voice: str, make_call, retries: int | None = None):
+        retries = retries or self.retries
+        err = None
+        for attempt in range(1, retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(
+                    f"TTS circuit open after {self.breaker.failures} consecutive failures"
+                    + (f" (last: {err!r})" if err else ""))
+            await self.bucket.acquire()
+            await self.limit.acquire()
+            t0 = self.clock()
+            try:
+                result = await make_call()
+            except Exception as e:
+                self.limit.release(False)
+                self.breaker.record_failure()
+                with self._lock: self._err[voice] += 1
+                err = e
+            else:
+                self.limit.release(True)
+                self.breaker.record_success()
+                with self._lock:
+                    self._ok[voice] += 1
+                    self._lat[voice].append(self.clock() - t0)
+                return result
+            if attempt < retries:
+                await asyncio.sleep(self.backoff(attempt))
+        raise err
+
+    def stats(self) -> dict:
+        with self._lock:
+            voices = set(self._ok) | set(self._err)
+            return {
+                v: {
+                    "ok": self._ok[v], "errors": self._err[v],
+                    "p50": _percentile(list(self._lat[v]), 50),
+                    "p95": _percentile(list(self._lat[v]), 95),
+                }
+                for v in sorted(voices)
+            }
+
+    def report(self, prefix="[TTS]"):
+        for v, s in self.stats().items():
+            print(f"{prefix} {v}: ok={s['ok']} err={s['errors']} "
+                  f"p50={s['p50']:.2f}s p95={s['p95']:.2f}s limit={self.limit.limit:.1f}")
+
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+def configure_scheduler(**kwargs) -> TTSScheduler:
+    """
+    (Re)create the process-wide scheduler with the given TTSScheduler kwargs.
+    """
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        _SCHEDULER = TTSScheduler(**kwargs)
+        return _SCHEDULER
+
+def get_scheduler() -> TTSScheduler:
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = TTSScheduler()
+        return _SCHEDULER
@@ -0,0 +1,119 @@
+# modules/voice_catalog.py
+import asyncio, bisect, json, os, threading, time
+from pathlib import Path
+
+from config import VOICE_CATALOG_PATH, VOICE_CATALOG_TTL
+
+
+class VoiceCatalog:
+    """
+    Indexed view over the Edge voice list: O(1) ShortName lookup and
+    locale-prefix lookup via bisect over sorted locale keys.
+    """
+    def __init__(self, voices: list, fetched_at: float = 0.0):
+        self.voices = voices
+        self.fetched_at = fetched_at
+        self._by_name = {v.get("ShortName", "").lower(): v for v in voices}
+        by_loc = {}
+        for v in voices:
+            by_loc.setdefault(v.get("Locale", "").lower(), []).append(v)
+        self._by_locale = by_loc
+        self._locales = sorted(by_loc)
+
+    def __len__(self): return len(self.voices)
+
+    def get(self, short_name: str) -> dict | None:
+        return self._by_name.get((short_name or "").lower())
+
+    def by_locale_prefix(self, prefix: str) -> list:
+        p = prefix.lower()
+        out = []
+        for loc in self._locales[bisect.bisect_left(self._locales, p):]:
+            if not loc.startswith(p): break
+            out.extend(self._by_locale[loc])
+        return out
+
+
+def _read_cache(path: Path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data["voices"], float(data.get("fetched_at", 0.0))
+    except (OSError, ValueError, KeyError):
+        return None, 0.0
+
+def _write_cache(path: Path, voices: list):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + f".{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"fetched_at": time.time(), "voices": voices}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+async def _fetch_voices() -> list:
+    import edge_tts
+    from modules.tts_scheduler import get_scheduler
+    return await get_scheduler().run("<catalog>", edge_tts.list_voices)
+
+def _refresh_in_background(path: Path, ttl: float):
+    key = str(path)
+    with _LOCK:
+        if key in _REFRESHING: return
+        _REFRESHING.add(key)
+    print(f"[TTS] Voice catalog older than {ttl/3600:.0f}h, refreshing in background")
+    def work():
+        try:
+            voices = asyncio.run(_fetch_voices())
+            _write_cache(path, voices)
+            with _LOCK:
+                _MEMO[key] = VoiceCatalog(voices, time.time())
+        except Exception as e:
+            print(f"[TTS] Voice catalog refresh failed, keeping cached copy: {e!r}")
+        finally:
+            with _LOCK:
+                _REFRESHING.discard(key)
+    threading.Thread(target=work, name="voice-catalog-refresh", daemon=True).start()
+
+
+_MEMO = {}
+_REFRESHING = set()  # cache paths with a background refresh in flight
+_LOCK = threading.Lock()
+
+async def load_voice_catalog(cache_path: Path = VOICE_CATALOG_PATH, ttl: float = VOICE_CATALOG_TTL,
+                             offline: bool = False, refresh: bool = False) -> VoiceCatalog:
+    """
+    Return the voice catalog, preferring (in order) the in-process memo, a fresh
+    on-disk cache, and finally edge_tts.list_voices().
+
+    A stale catalog (memo or cache) is served immediately and refreshed in a
+    background thread, so only the very first run (empty cache) pays for a
+    network fetch and long-lived processes still pick up new voices.
+    offline=True never touches the network and fails if no cache exists.
+    """
+    cache_path = Path(cache_path)
+    key = str(cache_path)
+    with _LOCK:
+        memo = _MEMO.get(key)
+    if memo is not None and not refresh:
+        if not offline and time.time() - memo.fetched_at > ttl:
+            _refresh_in_background(cache_path, ttl)
+        return memo
+
+    voices, fetched_at = (None, 0.0) if refresh else _read_cache(cache_path)
+    if voices is not None:
+        cat = VoiceCatalog(voices, fetched_at)
+        if not offline and time.time() - fetched_at > ttl:
+            _refresh_in_background(cache_path, ttl)
+            with _LOCK:
+                # a refresh that already finished must not be replaced by the stale copy
+                return _MEMO.setdefault(key, cat)
+    elif offline:
+        raise RuntimeError(f"Offline TTS mode but no voice catalog cache at {cache_path}")
+    else:
+        voices = await _fetch_voices()
+        _write_cache(cache_path, voices)
+        cat = VoiceCatalog(voices, time.time())
+        print(f"[TTS] Voice catalog fetched ({len(cat)} voices) → {cache_path}")
+
+    with _LOCK:
+        _MEMO[key] = cat
+    return cat
@@ -6,11 +6,14 @@ import subprocess
 from pathlib import Path
 from typing import Optional, Tuple
 
-import cv2
+from modules import metrics
+from modules.media import PCMAudio, load_pcm
+from modules.threads import get_threads
 
 
 def _probe_fps(video_path: Path) -> int:
     """Read FPS from the video, with sane fallback."""
+    import cv2
     cap = cv2.VideoCapture(str(video_path))
     fps = cap.get(cv2.CAP_PROP_FPS)
     cap.release()
@@ -44,6 +47,25 @@ def _find_temp_writer_output() -> Optional[Path]:
     return None
 
 
+def _run_in_process(argv, checkpoint_path: Path, force_cpu: bool, pcm: PCMAudio) -> int:
+    """
+    Run inference.py inside this process with the Wav2Lip model taken from
+    the shared model registry, so repeated renders skip the checkpoint load.
+    The mel frontend gets the already-decoded samples instead of reloading the wav.
+    """
+    import torch
+    from modules.model_registry import get_registry, import_wav2lip_inference
+    inf = import_wav2lip_inference()
+    inf.device = "cpu" if force_cpu or not torch.cuda.is_available() else "cuda"
+    model = get_registry().get("wav2lip", checkpoint_path.resolve(), inf.device, "fp32")
+    try:
+        inf.run(argv, model=model, wav=pcm.at(16000))
+        return 0
+    except SystemExit as e:
+        print("Wav2Lip exited:", e)
+        return 1
+
+
 def run_wav2lip(
     video_in: Path,
     audio_in: Path,
@@ -54,14 +76,21 @@ def run_wav2lip(
     resize_factor: int = 1,
     box: Optional[Tuple[int, int, int, int]] = None,
     force_cpu: bool = False,
+    in_process: bool = False,
+    face_cache: Optional[Path] = None,
+    shard: Optional[Tuple[int, int]] = None,
+    resume_dir: Optional[Path] = None,
+    segment_batches: int = 8,
 ) -> Path:
     """
     Run Wav2Lip inference via the repository's inference.py, then ensure
     an MP4 exists by muxing from the writer's temp output if needed.
+    The result is written under a temporary name and renamed onto `outfile`,
+    so a crashed or concurrent render never leaves a partial file there.
 
     Args:
         video_in:      input face video (mp4)
-        audio_in:      dubbed wav (e.g., 16k mono)
+        audio_in:      dubbed wav (e.g., 16k mono), or PCMAudio already decoded from it
         checkpoint_path: Wav2Lip checkpoint (wav2lip_gan.pth or wav2lip.pth)
         outfile:       final mp4 to write
         fps:           override FPS used by writer; if None, derived from video
@@ -69,14 +98,24 @@ def run_wav2lip(
         resize_factor: 1=best quality, 2=downscale for speed/VRAM
         box:           optional (x1, y1, x2, y2) to bypass face detector
         force_cpu:     if True, disables CUDA for this call
+        in_process:    run inference.py in this process with a registry-cached model
+                       instead of a subprocess (keeps Wav2Lip warm across calls)
+        face_cache:    face detections JSON (see detect_faces); reused if it matches the video
+        shard:         (k, n) renders only the k-th of n equal frame ranges as a silent
+                       segment; join the segments with concat_segments
+        resume_dir:    render as closed segments plus a progress manifest in this (stable)
+                       directory; after a crash the next call continues from the last segment
+        segment_batches: Wav2Lip batches per segment with resume_dir
 
     Returns:
         Path to the produced MP4.
     """
     video_in = Path(video_in)
-    audio_in = Path(audio_in)
+    pcm = audio_in if isinstance(audio_in, PCMAudio) else None
+    audio_in = Path(pcm.path if pcm else audio_in)
     checkpoint_path = Path(checkpoint_path)
-    outfile = Path(outfile)
+    final = Path(outfile)
+    outfile = final.with_name(f"{final.stem}.{os.getpid()}.part{final.suffix}")  # renamed onto `final` when complete
 
     for p in [video_in, audio_in, checkpoint_path]:
         if not p.exists():
@@ -103,33 +142,49 @@ def run_wav2lip(
     if box is not None:
         x1, y1, x2, y2 = box
         cmd += ["--box", str(x1), str(y1), str(x2), str(y2)]
+    if face_cache is not None:
+        cmd += ["--face_cache", str(face_cache)]
+    if shard is not None:
+        cmd += ["--shard", str(shard[0]), str(shard[1])]
+    if resume_dir is not None:
+        cmd += ["--resume_dir", str(resume_dir), "--segment_batches", str(segment_batches)]
+    metrics_json = outfile.with_suffix(".metrics.json")
+    cmd += ["--metrics_json", str(metrics_json), "--threads", str(get_threads().threads())]
 
-    env = os.environ.copy()
+    env = get_threads().env()
     if force_cpu:
         env["CUDA_VISIBLE_DEVICES"] = ""
 
     print("Running:\n ", " ".join(shlex.quote(c) for c in cmd))
-    ret = subprocess.run(cmd, env=env, check=False)
-    print("Exit code:", ret.returncode)
+    if in_process:
+        code = _run_in_process(cmd[3:], checkpoint_path, force_cpu, pcm or load_pcm(audio_in, 16000))
+    else:
+        code = subprocess.run(cmd, env=env, check=False).returncode
+    print("Exit code:", code)
+    metrics.read_detail(metrics_json, prefix="w2l_")
+    metrics_json.unlink(missing_ok=True)
 
     # If final MP4 exists, done
     if outfile.exists() and outfile.stat().st_size > 0:
-        print("✅ Wav2Lip done:", outfile)
-        return outfile
+        os.replace(outfile, final)
+        print("✅ Wav2Lip done:", final)
+        return final
+    if shard is not None:
+        raise RuntimeError(f"❌ Wav2Lip shard {shard[0]}/{shard[1]} produced no segment. Check Wav2Lip logs above.")
 
     # Otherwise, try to mux from the writer's temp file
     cand = _find_temp_writer_output()
     if cand is None:
-        raise SystemExit("❌ Neither final MP4 nor temp/result.* found. Check Wav2Lip logs above.")
+        raise RuntimeError("❌ Neither final MP4 nor temp/result.* found. Check Wav2Lip logs above.")
 
     if not _ffmpeg_available():
-        raise SystemExit("❌ ffmpeg is not available on PATH; please install ffmpeg.")
+        raise RuntimeError("❌ ffmpeg is not available on PATH; please install ffmpeg.")
 
     mux_cmd = [
         "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
         "-i", str(cand), "-i", str(audio_in),
         "-shortest",
-        "-c:v", "libx264", "-pix_fmt", "yuv420p",
+        "-c:v", "libx264", *get_threads().ffmpeg_args(), "-pix_fmt", "yuv420p",
         "-c:a", "aac",
         str(outfile),
     ]
@@ -137,7 +192,70 @@ def run_wav2lip(
     subprocess.run(mux_cmd, check=True)
 
     if outfile.exists() and outfile.stat().st_size > 0:
-        print("✅ Muxed:", outfile)
-        return outfile
+        os.replace(outfile, final)
+        print("✅ Muxed:", final)
+        return final
+
+    raise RuntimeError("❌ Mux failed; verify ffmpeg install and temp result file.")
+
+
+def concat_segments(segments, audio_in: Path, outfile: Path) -> Path:
+    """
+    Join silent segments from run_wav2lip(shard=...) in order and mux the
+    dubbed audio. Video streams are copied, not re-encoded; the result is
+    renamed onto `outfile` once complete.
+    """
+    outfile = Path(outfile)
+    outfile.parent.mkdir(parents=True, exist_ok=True)
+    part = outfile.with_name(f"{outfile.stem}.{os.getpid()}.part{outfile.suffix}")
+    listing = outfile.with_name(f"{outfile.stem}.{os.getpid()}.segments.txt")
+    listing.write_text("".join(f"file '{Path(p).resolve()}'\n" for p in segments), encoding="utf-8")
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", str(listing), "-i", str(audio_in),
+        "-map", "0:v", "-map", "1:a", "-shortest",
+        "-c:v", "copy", "-c:a", "aac", *get_threads().ffmpeg_args(),
+        str(part),
+    ]
+    print("Concat cmd:\n ", " ".join(shlex.quote(c) for c in cmd))
+    try:
+        subprocess.run(cmd, check=True)
+    finally:
+        listing.unlink(missing_ok=True)
+    os.replace(part, outfile)
+    print(f"✅ Joined {len(segments)} segments:", outfile)
+    return outfile
 
-    raise SystemExit("❌ Mux failed; verify ffmpeg install and temp result file.")
+
+def detect_faces(
+    video_in: Path,
+    face_cache: Path,
+    resize_factor: int = 1,
+    force_cpu: bool = False,
+) -> Path:
+    """
+    Run only Wav2Lip's face detection for `video_in` and store the raw
+    per-frame boxes in `face_cache`, so it can run while ASR/translation/TTS
+    are still working and run_wav2lip(face_cache=...) skips detection.
+    Always a subprocess: inference.py keeps its options in module globals.
+    """
+    video_in, face_cache = Path(video_in), Path(face_cache)
+    cmd = [
+        sys.executable, "-u", "Wav2Lip/inference.py",
+        "--face", str(video_in),
+        "--face_cache", str(face_cache),
+        "--resize_factor", str(resize_factor),
+        "--detect_only",
+        "--threads", str(get_threads().threads()),
+        "--metrics_json", str(face_cache.with_suffix(f".{os.getpid()}.metrics.json")),
+    ]
+    env = get_threads().env()
+    if force_cpu:
+        env["CUDA_VISIBLE_DEVICES"] = ""
+    print("Running:\n ", " ".join(shlex.quote(c) for c in cmd))
+    try:
+        subprocess.run(cmd, env=env, check=True)
+    finally:
+        metrics.read_detail(Path(cmd[-1]), prefix="w2l_")
+        Path(cmd[-1]).unlink(missing_ok=True)
+    return face_cache
@@ -0,0 +1,82 @@
+# modules/wavmap.py
+import struct
+from pathlib import Path
+import numpy as np
+
+_PCM, _FLOAT, _EXTENSIBLE = 1, 3, 0xFFFE
+
+def _wav_layout(path: Path) -> dict:
+    """
+    Walk the RIFF chunks of a WAV file and return where the sample data lives.
+    """
+    with open(path, "rb") as f:
+        head = f.read(12)
+        if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+            raise ValueError(f"Not a RIFF/WAVE file: {path}")
+        fmt = None
+        while True:
+            ck = f.read(8)
+            if len(ck) < 8:
+                raise ValueError(f"No data chunk in {path}")
+            cid, size = ck[:4], struct.unpack("<I", ck[4:])[0]
+            if cid == b"fmt ":
+                raw = f.read(size)
+                tag, ch, sr, _, _, bits = struct.unpack("<HHIIHH", raw[:16])
+                if tag == _EXTENSIBLE and len(raw) >= 26:
+                    tag = struct.unpack("<H", raw[24:26])[0]
+                fmt = (tag, ch, sr, bits)
+            elif cid == b"data":
+                if fmt is None:
+                    raise ValueError(f"data chunk before fmt chunk in {path}")
+                tag, ch, sr, bits = fmt
+                if (tag, bits) == (_FLOAT, 32):   dtype = np.float32
+                elif (tag, bits) == (_PCM, 16):   dtype = np.int16
+                else: raise ValueError(f"Unsupported WAV sample format tag={tag} bits={bits}")
+                return {"offset": f.tell(), "bytes": size, "sr": sr, "channels": ch, "dtype": dtype}
+            else:
+                f.seek(size + (size & 1), 1)  # chunks are word-aligned
+
+def create_wav_memmap(path: Path, frames: int, sr: int, dtype=np.int16):
+    """
+    Create a pre-sized mono WAV (PCM16 or float32) full of silence and map it.
+    The file is extended with truncate(), so the zeros cost no writes.
+    """
+    dtype = np.dtype(dtype)
+    tag = {np.dtype(np.int16): _PCM, np.dtype(np.float32): _FLOAT}[dtype]
+    item = dtype.itemsize
+    nbytes = int(frames) * item
+    if nbytes + 36 > 0xFFFFFFFF:
+        raise ValueError(f"{frames} frames exceed the 4 GiB RIFF limit")
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", 36 + nbytes) + b"WAVE")
+        f.write(b"fmt " + struct.pack("<IHHIIHH", 16, tag, 1, sr, sr * item, item, item * 8))
+        f.write(b"data" + struct.pack("<I", nbytes))
+        f.truncate(44 + nbytes)
+    return open_wav_memmap(path, mode="r+")
+
+def open_wav_memmap(path: Path, mode: str = "r+"):
+    """
+    Memory-map the samples of a mono/multichannel PCM16 or float32 WAV in place.
+    Returns (memmap, sr); shape is (frames,) for mono, else (frames, channels).
+    """
+    lay = _wav_layout(Path(path))
+    item = np.dtype(lay["dtype"]).itemsize
+    frames = lay["bytes"] // (item * lay["channels"])
+    shape = (frames,) if lay["channels"] == 1 else (frames, lay["channels"])
+    mm = np.memmap(path, dtype=lay["dtype"], mode=mode, offset=lay["offset"], shape=shape)
+    return mm, lay["sr"]
+
+def write_samples(mm, start: int, y: np.ndarray):
+    """
+    Overwrite mm[start:start+len(y)] with float audio y (clipped to the map),
+    converting to the map's sample format.
+    """
+    s = int(start); e = min(len(mm), s + len(y))
+    if s >= len(mm) or e <= 0: return
+    seg = y[max(0, -s): max(0, -s) + (e - max(0, s))]
+    s = max(0, s)
+    if mm.dtype == np.int16:
+        seg = np.clip(seg * 32767.0, -32768, 32767).astype(np.int16)
+    mm[s:s + len(seg)] = seg